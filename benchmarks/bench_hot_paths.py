@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the hot paths of dataset curation and evaluation on synthetic seeds, e.g.:
+
+    python benchmarks/bench_hot_paths.py --output baseline.json
+    python benchmarks/bench_hot_paths.py --compare baseline.json --threshold 0.2
+
+With --compare, a benchmark whose median time exceeds the baseline by more than the threshold is flagged
+as a regression and the script exits with a non-zero status.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import uuid
+import platform
+import statistics
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "eval"))  # the eval scripts import their sibling modules
+
+import synthetic
+from data_utils import sample_knowledge, sample_profile, normalize_profile
+from instruction import create_instruct, create_instructs
+from chatarena.agent import Player
+from chatarena.message import Message, MessagePool
+from chatarena.backends.openai import OpenAIChat
+import eval_generation
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark, a function of the scale that returns the callable to time."""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+@benchmark("data_utils.sample_knowledge")
+def bench_sample_knowledge(scale):
+    seeds = synthetic.make_seed_dialogs(100 * scale)
+    def run():
+        random.seed(42)
+        for seed in seeds:
+            sample_knowledge(seed["knowledge_graph"], seed["target"], seed["topic_path"],
+                             user_utt=seed["seed_conversation"][0], bot_utt=seed["seed_conversation"][1])
+    return run
+
+
+@benchmark("data_utils.sample_profile")
+def bench_sample_profile(scale):
+    profile_slots = synthetic.make_profile_slots(random.Random(42))
+    seeds = synthetic.make_seed_dialogs(2000 * scale)
+    def run():
+        random.seed(42)
+        for seed in seeds:
+            sample_profile(profile_slots, target_topic=seed["target"][1], domain="movie")
+    return run
+
+
+@benchmark("data_utils.normalize_profile")
+def bench_normalize_profile(scale):
+    seeds = synthetic.make_seed_dialogs(5000 * scale)
+    def run():
+        for seed in seeds:
+            normalize_profile(seed["user_profile"], "music")
+    return run
+
+
+@benchmark("instruction.create_instruct")
+def bench_create_instruct(scale):
+    seeds = synthetic.make_seed_dialogs(500 * scale)
+    inputs = []
+    for seed in seeds:
+        domain = "food" if "Food" in seed["target"][0] else "movie"
+        seed_conv = {"seed_continue": "\n".join(seed["seed_conversation"][:4]),
+                     "seed_end": "\n".join(seed["seed_conversation"])}
+        inputs.append((seed["target"], normalize_profile(seed["user_profile"], domain), seed["knowledge_graph"],
+                       seed_conv))
+    def run():
+        for target, profile, knowledge, seed_conv in inputs:
+            create_instruct(target, profile, synthetic.PERSONALITY, "Assistant", knowledge, seed_conv)
+    return run
+
+
+@benchmark("instruction.create_instructs")
+def bench_create_instructs(scale):
+    seeds = synthetic.make_seed_dialogs(500 * scale)
+    targets = [seed["target"] for seed in seeds]
+    profiles = [normalize_profile(seed["user_profile"], "movie") for seed in seeds]
+    personalities = [synthetic.PERSONALITY] * len(seeds)
+    assistant_names = ["Assistant"] * len(seeds)
+    knowledges = [seed["knowledge_graph"] for seed in seeds]
+    seed_convs = [{"seed_continue": "\n".join(seed["seed_conversation"][:4]),
+                   "seed_end": "\n".join(seed["seed_conversation"])} for seed in seeds]
+    return lambda: create_instructs(targets, profiles, personalities, assistant_names, knowledges, seed_convs)
+
+
+def make_message_pool(num_turns):
+    pool = MessagePool()
+    for turn in range(num_turns):
+        for agent_name in ("Role-S", "Role-U"):
+            pool.append_message(Message(agent_name=agent_name, content=f"turn {turn} of {agent_name}", turn=turn))
+        pool.append_message(Message(agent_name="Moderator", content="no", turn=turn, visible_to="Moderator"))
+    return pool
+
+
+@benchmark("MessagePool.get_visible_messages")
+def bench_get_visible_messages(scale):
+    num_turns = 20
+    pools = [make_message_pool(num_turns) for _ in range(500 * scale)]
+    def run():
+        for pool in pools:
+            for turn in range(num_turns):
+                pool.get_visible_messages("Role-S", turn)
+    return run
+
+
+@benchmark("OpenAIChat.query")
+def bench_openai_query(scale):
+    """Format the prompts of a whole dialog, with the network call stubbed out."""
+    backend = OpenAIChat(api_base="http://localhost:0/v1")
+    backend._get_response = lambda messages, *args, **kwargs: "[Role-S]: A canned response.<EOS>"
+    pool = make_message_pool(20)
+    role_desc = create_instruct(*next(iter_instruct_inputs()))[2]["role_desc"]
+    def run():
+        for _ in range(100 * scale):
+            for turn in range(20):
+                backend.query("Role-S", role_desc, pool.get_visible_messages("Role-S", turn),
+                              global_prompt="You are participating in a conversation.")
+    return run
+
+
+@benchmark("Player.freeze.config_id")
+def bench_player_config_id(scale):
+    """Derive the player ids of many logged arenas, as when saving them to a database."""
+    backend = OpenAIChat(api_base="http://localhost:0/v1")
+    role_desc = create_instruct(*next(iter_instruct_inputs()))[2]["role_desc"]
+    players = [Player(name="Role-S", role_desc=role_desc, backend=backend, global_prompt="") for _ in range(10)]
+    arena_ids = [uuid.uuid4() for _ in range(1000 * scale)]
+    def run():
+        for arena_id in arena_ids:
+            for player in players:
+                player.freeze().config_id(arena_id)
+    return run
+
+
+def iter_instruct_inputs():
+    for seed in synthetic.make_seed_dialogs(1):
+        seed_conv = {"seed_continue": "", "seed_end": ""}
+        yield (seed["target"], normalize_profile(seed["user_profile"], "movie"), synthetic.PERSONALITY,
+               "Assistant", seed["knowledge_graph"], seed_conv)
+
+
+def make_eval_inputs(scale):
+    eval_data, gold_data = synthetic.make_eval_data(200 * scale)
+    preds = eval_generation.load_data(eval_data)
+    gold_labels = eval_generation.load_data(gold_data, is_gold=True)
+    return preds, eval_data, gold_data, gold_labels
+
+
+@benchmark("eval.calc_bleu")
+def bench_calc_bleu(scale):
+    preds, _, _, (refs, *_) = make_eval_inputs(scale)
+    return lambda: eval_generation.calc_bleu(preds, refs)
+
+
+@benchmark("eval.calc_knowledge_f1")
+def bench_calc_knowledge_f1(scale):
+    preds, _, _, (_, all_knowledges, ref_knowledges, _, _) = make_eval_inputs(scale)
+    return lambda: eval_generation.calc_knowledge_f1(preds, ref_knowledges, all_knowledges)
+
+
+@benchmark("eval.calc_persona_f1")
+def bench_calc_persona_f1(scale):
+    preds, _, _, (_, _, _, all_personas, ref_personas) = make_eval_inputs(scale)
+    return lambda: eval_generation.calc_persona_f1(preds, ref_personas, all_personas)
+
+
+@benchmark("eval.calc_succ")
+def bench_calc_succ(scale):
+    _, eval_data, gold_data, _ = make_eval_inputs(scale)
+    def run():
+        gold_data.pop("succ_index", None)  # include building the index
+        eval_generation.calc_succ(eval_data, gold_data, verbose=False)
+    return run
+
+
+@benchmark("eval.load_data")
+def bench_load_data(scale):
+    _, _, gold_data, _ = make_eval_inputs(scale)
+    return lambda: eval_generation.load_data(gold_data, is_gold=True)
+
+
+def time_benchmark(name, scale=1, repeat=5):
+    run = BENCHMARKS[name](scale)
+    run()  # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return {
+        "median_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "repeat": repeat,
+        "scale": scale,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Compare the median times with the baseline, returning the regressions."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline or baseline[name].get("scale") != result["scale"]:
+            continue
+        ratio = result["median_seconds"] / max(baseline[name]["median_seconds"], 1e-12)
+        result["baseline_median_seconds"] = baseline[name]["median_seconds"]
+        result["ratio"] = ratio
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--benchmarks", type=str, nargs="+", default=list(BENCHMARKS),
+                        help="The benchmarks to run.")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="Multiply the size of the synthetic data.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="The number of timed runs per benchmark.")
+    parser.add_argument("--output", type=str, default=None,
+                        help="Save the results to this JSON file, e.g., as a baseline.")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="Compare with the results in this baseline JSON file.")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="The relative slowdown over the baseline that counts as a regression.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = {}
+    for name in args.benchmarks:
+        results[name] = time_benchmark(name, scale=args.scale, repeat=args.repeat)
+        print("{:<36} {:.4f}s".format(name, results[name]["median_seconds"]), file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    regressions = []
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf-8') as fr:
+            baseline = json.load(fr)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        report["regressions"] = regressions
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as fw:
+            json.dump(report, fw, indent=4)
+    print(json.dumps(report, indent=4))
+    if regressions:
+        print("Regressions over {:.0%}: {}".format(args.threshold, ", ".join(regressions)), file=sys.stderr)
+        sys.exit(1)
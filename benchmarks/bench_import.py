@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the import time of chatarena modules, which every worker process pays on startup.
+Each module is imported in a fresh interpreter, e.g.:
+
+    python benchmarks/bench_import.py --repeat 5 --max_seconds 1.0
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["chatarena.backends", "chatarena.arena", "chatarena.environments.conversation"]
+
+# Import the module and print the elapsed time, the heavy SDKs must not be in sys.modules
+SNIPPET = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [m for m in ("transformers", "torch", "anthropic", "cohere", "openai") if m in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy_modules": heavy}}))
+"""
+
+
+def time_import(module: str, repeat: int = 5):
+    """Time importing the module in `repeat` fresh interpreters."""
+    timings = []
+    heavy_modules = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", SNIPPET.format(module=module)], cwd=REPO_DIR,
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        heavy_modules = result["heavy_modules"]
+    return {
+        "module": module,
+        "median_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "heavy_modules": heavy_modules,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", type=str, nargs="+", default=DEFAULT_MODULES,
+                        help="The modules to import.")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="The number of fresh interpreters per module.")
+    parser.add_argument("--max_seconds", type=float, default=None,
+                        help="Fail if the median import time of any module exceeds this value.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    failed = False
+    results = []
+    for module in args.modules:
+        result = time_import(module, repeat=args.repeat)
+        results.append(result)
+        if result["heavy_modules"]:
+            failed = True
+        if args.max_seconds is not None and result["median_seconds"] > args.max_seconds:
+            failed = True
+    print(json.dumps(results, indent=4))
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic data shaped like the DuRecDial 2.0 seeds (knowledge triples, topic paths, user profiles and
+conversations), so that the benchmarks run without downloading the seed dataset.
+"""
+import random
+
+TARGET_ACTIONS = ["Movie recommendation", "Music recommendation", "Play music", "POI recommendation",
+                  "Food recommendation"]
+RELATIONS = ["Stars", "Directed by", "Sings", "Type", "Awards", "Achievement", "Comments", "Specials",
+             "Perfect for having", "Address", "Rating", "Birthday", "Height"]
+AGE_RANGES = ["Under 18", "18-25", "26-35", "36-50", "Over 50"]
+PERSONALITY = {
+    "agreeableness": "trustworthy, straightforward, and generous",
+    "conscientiousness": "efficient, organized, and careful",
+    "extraversion": "outgoing, energetic, and talkative",
+    "neuroticism": "secure, confident, and calm",
+    "openness": "intellectual, imaginative, and curious",
+}
+WORDS = ("the a of and to in is it that was for on are with as his they be at one have this from "
+         "movie song music film star singer food restaurant dish city love great classic famous new "
+         "old best story voice taste sweet spicy fresh director actor album award rating night day").split()
+
+
+def make_phrase(rng: random.Random, min_len: int = 1, max_len: int = 4):
+    return " ".join(rng.choice(WORDS).capitalize() for _ in range(rng.randint(min_len, max_len)))
+
+
+def make_sentence(rng: random.Random, min_len: int = 8, max_len: int = 30):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(min_len, max_len)))
+
+
+def make_topic_path(rng: random.Random, length: int = 4):
+    """A topic path of entity names, padded with NULL as in the seeds."""
+    return [make_phrase(rng) for _ in range(length)] + ["NULL"] * rng.randint(0, 2)
+
+
+def make_triples(rng: random.Random, topics, num_triples: int = 60):
+    """Knowledge triples [subject, relation, object] around the topics."""
+    triples = []
+    for _ in range(num_triples):
+        subject = rng.choice([t for t in topics if t != "NULL"])
+        relation = rng.choice(RELATIONS)
+        if relation == "Comments":
+            obj = make_sentence(rng)
+        elif relation == "Stars":
+            obj = make_sentence(rng, 2, 50)
+        else:
+            obj = make_phrase(rng)
+        triples.append([subject, relation, obj])
+    return triples
+
+
+def make_profile_slots(rng: random.Random, num_values: int = 50):
+    """The profile slot values of all users, as extracted by data_preprocess.extract_profile."""
+    slots = {
+        "Age Range": list(AGE_RANGES),
+        "Gender": ["Male", "Female"],
+        "Occupation": ["Student", "Employed", "Retired"],
+    }
+    for slot in ["Name", "Residence", "POI", "Accepted movies", "Accepted music", "Accepted celebrities",
+                 "Accepted food", "Accepted POI", "Reject", "Rejected movies", "Rejected music"]:
+        slots[slot] = [make_phrase(rng, 2, 3) for _ in range(num_values)]
+    return slots
+
+
+def make_user_profile(rng: random.Random):
+    """A raw user profile, including the mismatched slot keys and repeated values of the seeds."""
+    return {
+        "Age Range": rng.choice(AGE_RANGES) + " years old",
+        "Name": make_phrase(rng, 2, 2),
+        "Gender": rng.choice(["Male", "Female"]),
+        "Residence": make_phrase(rng, 1, 2),
+        "Occupation": rng.choice(["Student", "Employed", "Retired"]),
+        "Accepted movies": "; ".join(make_phrase(rng) for _ in range(3)),
+        "Accepted Music": "; ".join(make_phrase(rng) for _ in range(2)),
+        "Accepted celebrities": make_phrase(rng),
+        "Accepted food": make_phrase(rng),
+        "Accepted POI": make_phrase(rng),
+        "Rejected movies": make_phrase(rng),
+        "Accepted news": make_phrase(rng),
+        "Reject": make_phrase(rng),
+    }
+
+
+def make_seed_dialog(rng: random.Random, num_turns: int = 10, num_triples: int = 60):
+    topic_path = make_topic_path(rng)
+    target = [rng.choice(TARGET_ACTIONS), topic_path[-1] if topic_path[-1] != "NULL" else topic_path[0]]
+    return {
+        "target": target,
+        "topic_path": topic_path,
+        "knowledge_graph": make_triples(rng, topic_path, num_triples),
+        "user_profile": make_user_profile(rng),
+        "seed_conversation": [make_sentence(rng) for _ in range(num_turns)],
+    }
+
+
+def make_seed_dialogs(num_dialogs: int, seed: int = 42, **kwargs):
+    rng = random.Random(seed)
+    return [make_seed_dialog(rng, **kwargs) for _ in range(num_dialogs)]
+
+
+def make_eval_data(num_dialogs: int, turns_per_dialog: int = 6, seed: int = 42):
+    """
+    Tokenized gold and eval data in the layout of eval/ingest.py, using whitespace tokens so that the
+    metric benchmarks do not depend on the nltk tokenizer.
+    """
+    rng = random.Random(seed)
+    gold_samples, gold_tokens, topic_tokens, eval_tokens = [], [], [], []
+    for dialog_idx in range(num_dialogs):
+        seed_dialog = make_seed_dialog(rng, num_turns=0)
+        target = seed_dialog["target"]
+        for _ in range(turns_per_dialog):
+            response = make_sentence(rng)
+            if rng.random() < 0.3:
+                response += " " + target[1]
+            triple = rng.choice(seed_dialog["knowledge_graph"])
+            if rng.random() < 0.5:
+                response += " " + triple[2]
+            gold_samples.append({
+                "id": dialog_idx,
+                "target": target,
+                "response": response,
+                "knowledge": seed_dialog["knowledge_graph"][:20],
+                "user_profile": seed_dialog["user_profile"],
+            })
+            gold_tokens.append(response.lower().split())
+            topic_tokens.append(target[1].split())
+            # the system response shares some words and the target topic with the gold response
+            words = response.split()
+            prediction = " ".join(rng.sample(words, len(words) // 2)) + " " + make_sentence(rng, 2, 10)
+            eval_tokens.append(prediction.split())
+    gold_data = {"samples": gold_samples, "tokens": gold_tokens, "topic_tokens": topic_tokens}
+    eval_data = {
+        "samples": [{"response": " ".join(toks)} for toks in eval_tokens],
+        "tokens": [[tok.lower() for tok in toks] for toks in eval_tokens],
+        "raw_tokens": eval_tokens,
+    }
+    return eval_data, gold_data
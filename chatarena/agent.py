@@ -1,14 +1,14 @@
 from typing import List, Union
 import re
-from tenacity import RetryError
 import logging
 import uuid
 from abc import abstractmethod
 import asyncio
 
 from .backends import IntelligenceBackend, load_backend
+from .backends.resilience import BackendError
 from .message import Message, SYSTEM_NAME
-from .config import AgentConfig, Configurable, BackendConfig
+from .config import AgentConfig, Configurable, BackendConfig, FrozenConfig
 
 # A special signal sent by the player to indicate that it is not possible to continue the conversation, and it requests to end the conversation.
 # It contains a random UUID string to avoid being exploited by any of the players.
@@ -24,6 +24,17 @@ class Agent(Configurable):
         self.role_desc = role_desc
         self.global_prompt = global_prompt
 
+    def reconfigure(self, **kwargs):
+        """
+        swap in new arguments, e.g., the role_desc and global_prompt of another game
+        """
+        if "name" in kwargs:
+            assert kwargs["name"] != SYSTEM_NAME, f"Player name cannot be {SYSTEM_NAME}, which is reserved for the system."
+        for key in ("name", "role_desc", "global_prompt"):
+            if key in kwargs:
+                setattr(self, key, kwargs[key])
+        super().reconfigure(**kwargs)
+
 
 class Player(Agent):
     """
@@ -48,6 +59,7 @@ class Player(Agent):
                          global_prompt=global_prompt, **kwargs)
 
         self.backend = backend
+        self.backend_error = None  # the backend error that ended the game, if any
 
     def to_config(self) -> AgentConfig:
         return AgentConfig(
@@ -57,6 +69,15 @@ class Player(Agent):
             global_prompt=self.global_prompt,
         )
 
+    def freeze(self) -> FrozenConfig:
+        # The cached config is stale once the backend is reconfigured
+        backend = self.backend.freeze()
+        if self._frozen_config is None or self._frozen_config["backend"] is not backend:
+            config = self.to_config()
+            config["backend"] = backend
+            self._frozen_config = FrozenConfig(config)
+        return self._frozen_config
+
     def act(self, observation: List[Message]) -> str:
         """
         Call the agents to generate a response (equivalent to taking an action).
@@ -65,11 +86,8 @@ class Player(Agent):
             response = self.backend.query(agent_name=self.name, role_desc=self.role_desc,
                                           history_messages=observation, global_prompt=self.global_prompt,
                                           request_msg=None)
-        except RetryError as e:
-            logging.warning(f"Agent {self.name} failed to generate a response. "
-                            f"Error: {e.last_attempt.exception()}. "
-                            f"Sending signal to end the conversation.")
-            response = SIGNAL_END_OF_CONVERSATION
+        except BackendError as e:
+            response = self.end_on_error(e)
 
         return response
 
@@ -84,15 +102,23 @@ class Player(Agent):
             response = self.backend.async_query(agent_name=self.name, role_desc=self.role_desc,
                                                 history_messages=observation, global_prompt=self.global_prompt,
                                                 request_msg=None)
-        except RetryError as e:
-            logging.warning(f"Agent {self.name} failed to generate a response. "
-                            f"Error: {e.last_attempt.exception()}. "
-                            f"Sending signal to end the conversation.")
-            response = SIGNAL_END_OF_CONVERSATION
+        except BackendError as e:
+            response = self.end_on_error(e)
 
         return response
 
+    def end_on_error(self, e: BackendError) -> str:
+        """
+        record the backend error and return the signal to end the conversation, which is then incomplete
+        """
+        logging.warning(f"Agent {self.name} failed to generate a response. "
+                        f"Error: {e}. "
+                        f"Sending signal to end the conversation.")
+        self.backend_error = e
+        return SIGNAL_END_OF_CONVERSATION
+
     def reset(self):
+        self.backend_error = None
         self.backend.reset()
 
 
@@ -108,6 +134,13 @@ class Moderator(Player):
 
         self.terminal_condition = terminal_condition
 
+    def reconfigure(self, **kwargs):
+        # The moderator is always named "Moderator"
+        kwargs.pop("name", None)
+        if "terminal_condition" in kwargs:
+            self.terminal_condition = kwargs.pop("terminal_condition")
+        super().reconfigure(**kwargs)
+
     def to_config(self) -> AgentConfig:
         return AgentConfig(
             name=self.name,
@@ -129,9 +162,10 @@ class Moderator(Player):
             request_msg = Message(agent_name=self.name, content=self.terminal_condition, turn=-1)
             response = self.backend.query(agent_name=self.name, role_desc=self.role_desc, history_messages=history,
                                           global_prompt=self.global_prompt, request_msg=request_msg, *args, **kwargs)
-        except RetryError as e:
+        except BackendError as e:
             logging.warning(f"Agent {self.name} failed to generate a response. "
-                            f"Error: {e.last_attempt.exception()}.")
+                            f"Error: {e}.")
+            self.backend_error = e
             return True
 
         if re.match(r"yes|y|yea|yeah|yep|yup|sure|ok|okay|alright", response, re.IGNORECASE):
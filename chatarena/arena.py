@@ -1,4 +1,8 @@
-from typing import List, Dict, Union
+from typing import List, Dict, Optional, Union, Callable
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
 import uuid
 import json
 import csv
@@ -7,13 +11,39 @@ import logging
 from .agent import Player
 from .environments import Environment, TimeStep, load_environment
 from .backends import Human
+from .backends.resilience import BackendError
 from .config import ArenaConfig
+from .message import Message
 
 
 class TooManyInvalidActions(Exception):
     pass
 
 
+@dataclass
+class StepMetrics:
+    step: int
+    player_name: str
+    latency: float  # wall time of the step in seconds, including the moderator's decision
+    num_messages: int  # number of messages in the environment after the step
+    terminal: bool
+
+
+@dataclass
+class ArenaRun:
+    """
+    The result of a headless run: the transcript and the per-step metrics.
+    """
+    messages: List[Message]
+    steps: List[StepMetrics] = field(default_factory=list)
+    terminal: bool = False  # whether the environment reached a terminal state (rather than max_steps)
+    error: str = None  # the error that stopped the run, if any
+
+    @property
+    def total_latency(self) -> float:
+        return sum(step.latency for step in self.steps)
+
+
 class Arena:
     """
     Utility class that manages the game environment and players
@@ -37,6 +67,20 @@ class Arena:
     def name_to_player(self) -> Dict[str, Player]:
         return {player.name: player for player in self.players}
 
+    @property
+    def backend_error(self) -> Optional[BackendError]:
+        """
+        the backend error that ended the game early, if any, e.g., once the circuit of a provider is open
+        """
+        agents = list(self.players)
+        moderator = getattr(self.environment, "moderator", None)
+        if moderator is not None:
+            agents.append(moderator)
+        for agent in agents:
+            if agent.backend_error is not None:
+                return agent.backend_error
+        return None
+
     def reset(self) -> TimeStep:
         # Reset the environment
         self.current_timestep = self.environment.reset()
@@ -47,6 +91,29 @@ class Arena:
         self.uuid = uuid.uuid4()
         return self.current_timestep
 
+    def reconfigure(self, global_prompt: str = None, players: List[dict] = None,
+                    environment: dict = None) -> TimeStep:
+        """
+        reuse the players, their backends and the environment for a new game
+        Args:
+            global_prompt: the global prompt of the new game
+            players: the arguments to swap in each player, e.g., its name and role_desc
+            environment: the arguments to swap in the environment, e.g., the moderator of ModeratedConversation
+        """
+        if players is not None:
+            assert len(players) == len(self.players), "Must reconfigure all the players of the arena"
+            for player, player_kwargs in zip(self.players, players):
+                player.reconfigure(global_prompt=global_prompt, **player_kwargs)
+        player_names = [player.name for player in self.players]
+        assert len(player_names) == len(set(player_names)), "Player names must be unique"
+        self.global_prompt = global_prompt
+
+        for player in self.players:
+            player.reset()
+        self.current_timestep = self.environment.reconfigure(player_names=player_names, **(environment or {}))
+        self.uuid = uuid.uuid4()
+        return self.current_timestep
+
     def step(self) -> TimeStep:
         """
         Take a step in the game: one player takes an action and the environment updates
@@ -89,6 +156,39 @@ class Arena:
             if timestep.terminal:
                 break
 
+    def run_until_terminal(self, max_steps: int = None, reset: bool = True) -> ArenaRun:
+        """
+        run the game headlessly until the environment is terminal or max_steps is reached
+        This is the fast path for batch runs: no UI code is imported and nothing is rendered.
+        """
+        timestep = self.reset() if reset else self.current_timestep
+        run = ArenaRun(messages=[], terminal=bool(timestep.terminal))
+
+        step = 0
+        while not timestep.terminal:
+            player_name = self.environment.get_next_player()
+            start = time.perf_counter()
+            try:
+                timestep = self.step()
+            except TooManyInvalidActions as e:
+                run.error = str(e)
+                break
+            self.current_timestep = timestep
+
+            step += 1
+            run.steps.append(StepMetrics(step=step, player_name=player_name,
+                                         latency=time.perf_counter() - start,
+                                         num_messages=len(timestep.observation),
+                                         terminal=bool(timestep.terminal)))
+            run.terminal = bool(timestep.terminal)
+            if max_steps is not None and step >= max_steps:
+                break
+
+        run.messages = self.environment.get_observation()
+        if run.error is None and self.backend_error is not None:
+            run.error = f"{type(self.backend_error).__name__}: {self.backend_error}"
+        return run
+
     @classmethod
     def from_config(cls, config: Union[str, ArenaConfig]):
         """
@@ -135,13 +235,15 @@ class Arena:
             global_prompt=self.global_prompt
         )
 
-    def launch_cli(self, max_steps: int = None, interactive: bool = True, show_description: bool = True, show_message: bool = True):
+    def launch_cli(self, max_steps: int = None, interactive: bool = True, show_description: bool = True, show_message: bool = True,
+                   reset: bool = True):
         """
         launch the command line interface
         """
         from chatarena.ui.cli import ArenaCLI
         cli = ArenaCLI(self)
-        cli.launch(max_steps=max_steps, interactive=interactive, show_description=show_description, show_message=show_message)
+        cli.launch(max_steps=max_steps, interactive=interactive, show_description=show_description, show_message=show_message,
+                   reset=reset)
 
     def save_config(self, path: str):
         """
@@ -191,3 +293,205 @@ class Arena:
                 json.dump(message_rows, f, indent=4)
         else:
             raise ValueError("Invalid file format")
+
+
+class ArenaPool:
+    """
+    A pool of arenas with the same players and environment structure, reused across games.
+    Instead of creating the backends, players and environment of every game, a released arena is
+    reconfigured with the prompts of the next game.
+    An acquired arena is ready for its game, as if just reset, so it is run without another reset, e.g.,
+    arena.run_until_terminal(reset=False).
+    """
+
+    def __init__(self, factory: Callable[..., Arena], max_size: int = None):
+        """
+        args:
+            factory: creates a new arena, given the same arguments as Arena.reconfigure
+            max_size: the max number of idle arenas kept in the pool, unlimited if None
+        """
+        self.factory = factory
+        self.max_size = max_size
+        self._idle: List[Arena] = []
+        self._lock = threading.Lock()
+        self.num_created = 0
+
+    def acquire(self, global_prompt: str = None, players: List[dict] = None, environment: dict = None) -> Arena:
+        """
+        get an arena ready for a new game, reconfiguring an idle arena if any
+        """
+        with self._lock:
+            arena = self._idle.pop() if self._idle else None
+        if arena is None:
+            arena = self.factory(global_prompt=global_prompt, players=players, environment=environment)
+            with self._lock:
+                self.num_created += 1
+        else:
+            arena.reconfigure(global_prompt=global_prompt, players=players, environment=environment)
+        return arena
+
+    def release(self, arena: Arena):
+        """
+        return an arena to the pool once its game is over
+        """
+        with self._lock:
+            if self.max_size is None or len(self._idle) < self.max_size:
+                self._idle.append(arena)
+
+    @property
+    def num_idle(self) -> int:
+        return len(self._idle)
+
+
+class VectorArena:
+    """
+    Step many arenas in lockstep, e.g., to simulate a batch of dialogs at once.
+    At each step, the queries of the next players of all the arenas are gathered and sent in batches, one per
+    backend config (see IntelligenceBackend.batch_query), so that the backends built from the same config by
+    different arenas are coalesced, then the responses are scattered back to the environments.
+    The environments are stepped concurrently, so that the moderators of ModeratedConversation query in parallel.
+    An arena that fails is stopped with its error, without stopping the others.
+    """
+
+    def __init__(self, arenas: List[Arena], max_workers: int = None):
+        """
+        args:
+            arenas: the arenas to step in lockstep
+            max_workers: the max number of concurrent queries and environment steps, default to one per arena
+        """
+        self.arenas = arenas
+        self.max_workers = max_workers or max(1, len(arenas))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        self.timesteps = [arena.current_timestep for arena in arenas]
+        self.errors: List[str] = [None] * len(arenas)
+
+    @property
+    def num_arenas(self):
+        return len(self.arenas)
+
+    def active(self) -> List[int]:
+        """
+        get the indices of the arenas that are neither terminal nor failed
+        """
+        return [idx for idx, timestep in enumerate(self.timesteps)
+                if not timestep.terminal and self.errors[idx] is None]
+
+    def reset(self) -> List[TimeStep]:
+        self.timesteps = [arena.reset() for arena in self.arenas]
+        self.errors = [None] * self.num_arenas
+        return self.timesteps
+
+    def _act(self, indices: List[int]) -> Dict[int, Union[str, Exception]]:
+        """
+        query the next players of the arenas, batching the queries to the backends of the same config
+        """
+        batches = {}  # backend config -> (arena indices, queries, backends)
+        for idx in indices:
+            environment = self.arenas[idx].environment
+            player_name = environment.get_next_player()
+            player = self.arenas[idx].name_to_player[player_name]
+            query = dict(agent_name=player.name, role_desc=player.role_desc,
+                         history_messages=environment.get_observation(player_name),
+                         global_prompt=player.global_prompt, request_msg=None)
+            batch = batches.setdefault(player.backend.freeze(), ([], [], []))
+            batch[0].append(idx)
+            batch[1].append(query)
+            batch[2].append(player.backend)
+
+        # the batch is sent by the backend of its first query
+        futures = [(batch_indices, self._executor.submit(backends[0].batch_query, queries, self.max_workers,
+                                                         backends))
+                   for batch_indices, queries, backends in batches.values()]
+        responses = {}
+        for batch_indices, future in futures:
+            responses.update(zip(batch_indices, future.result()))
+        return responses
+
+    def step(self) -> List[TimeStep]:
+        """
+        take a step in all the active arenas, returns the current timesteps of all the arenas
+        """
+        attempts = {idx: 0 for idx in self.active()}  # the pending arenas and their invalid actions
+        actions = {}
+        while attempts:
+            for idx, response in self._act(list(attempts)).items():
+                arena = self.arenas[idx]
+                player_name = arena.environment.get_next_player()
+                if isinstance(response, BackendError):
+                    # Same as Player.act
+                    response = arena.name_to_player[player_name].end_on_error(response)
+                elif isinstance(response, Exception):
+                    self.errors[idx] = f"{type(response).__name__}: {response}"
+                    del attempts[idx]
+                    continue
+
+                if arena.environment.check_action(response, player_name):
+                    actions[idx] = (player_name, response)
+                    del attempts[idx]
+                else:  # the player tries again in the next batch
+                    logging.warning(f"{player_name} made an invalid action {response}")
+                    attempts[idx] += 1
+                    if attempts[idx] >= arena.invalid_actions_retry:
+                        warning_msg = f"{player_name} has made invalid actions for {arena.invalid_actions_retry} times. Terminating the game."
+                        logging.warning(warning_msg)
+                        self.errors[idx] = warning_msg
+                        del attempts[idx]
+
+        futures = {idx: self._executor.submit(self.arenas[idx].environment.step, player_name, action)
+                   for idx, (player_name, action) in actions.items()}
+        for idx, future in futures.items():
+            try:
+                timestep = future.result()
+            except Exception as e:
+                self.errors[idx] = f"{type(e).__name__}: {e}"
+                continue
+            self.arenas[idx].current_timestep = timestep
+            self.timesteps[idx] = timestep
+        return self.timesteps
+
+    def run_until_terminal(self, max_steps: int = None, reset: bool = True) -> List[ArenaRun]:
+        """
+        run all the arenas headlessly until each is terminal or max_steps is reached
+        The latency of a step is the wall time of the whole batched step.
+        """
+        if reset:
+            self.reset()
+        runs = [ArenaRun(messages=[], terminal=bool(timestep.terminal)) for timestep in self.timesteps]
+
+        step = 0
+        active = self.active()
+        while active:
+            player_names = {idx: self.arenas[idx].environment.get_next_player() for idx in active}
+            start = time.perf_counter()
+            self.step()
+            latency = time.perf_counter() - start
+
+            step += 1
+            for idx in active:
+                if self.errors[idx] is not None:
+                    continue
+                timestep = self.timesteps[idx]
+                runs[idx].steps.append(StepMetrics(step=step, player_name=player_names[idx], latency=latency,
+                                                   num_messages=len(timestep.observation),
+                                                   terminal=bool(timestep.terminal)))
+                runs[idx].terminal = bool(timestep.terminal)
+            if max_steps is not None and step >= max_steps:
+                break
+            active = self.active()
+
+        for run, arena, error in zip(runs, self.arenas, self.errors):
+            run.messages = arena.environment.get_observation()
+            if error is None and arena.backend_error is not None:
+                error = f"{type(arena.backend_error).__name__}: {arena.backend_error}"
+            run.error = error
+        return runs
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
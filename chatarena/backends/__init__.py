@@ -1,21 +1,54 @@
+from collections.abc import Mapping
+from importlib import import_module
+
 from ..config import BackendConfig
 
 from .base import IntelligenceBackend
-from .openai import OpenAIChat
-from .cohere import CohereAIChat
-from .human import Human
-from .hf_transformers import TransformersConversational
-from .anthropic import Claude
-
-ALL_BACKENDS = [
-    Human,
-    OpenAIChat,
-    CohereAIChat,
-    TransformersConversational,
-    Claude,
-]
-
-BACKEND_REGISTRY = {backend.type_name: backend for backend in ALL_BACKENDS}
+
+# The backend modules (and the heavy SDKs behind them) are only imported when a backend is requested by its type_name
+BACKEND_MODULES = {
+    "human": (".human", "Human"),
+    "openai-chat": (".openai", "OpenAIChat"),
+    "cohere-chat": (".cohere", "CohereAIChat"),
+    "transformers:conversational": (".hf_transformers", "TransformersConversational"),
+    "claude": (".anthropic", "Claude"),
+}
+_CLASS_TO_TYPE_NAME = {class_name: type_name for type_name, (_, class_name) in BACKEND_MODULES.items()}
+
+
+class LazyBackendRegistry(Mapping):
+    """
+    A read-only mapping from type_name to backend class, importing the backend module on first access.
+    """
+
+    def __init__(self, backend_modules: dict):
+        self._backend_modules = backend_modules
+        self._backends = {}
+
+    def __getitem__(self, type_name: str):
+        if type_name not in self._backends:
+            module_name, class_name = self._backend_modules[type_name]
+            module = import_module(module_name, package=__name__)
+            self._backends[type_name] = getattr(module, class_name)
+        return self._backends[type_name]
+
+    def __iter__(self):
+        return iter(self._backend_modules)
+
+    def __len__(self):
+        return len(self._backend_modules)
+
+
+BACKEND_REGISTRY = LazyBackendRegistry(BACKEND_MODULES)
+
+
+def __getattr__(name: str):
+    # Keep `from chatarena.backends import OpenAIChat` working without importing every backend
+    if name in _CLASS_TO_TYPE_NAME:
+        return BACKEND_REGISTRY[_CLASS_TO_TYPE_NAME[name]]
+    if name == "ALL_BACKENDS":
+        return list(BACKEND_REGISTRY.values())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # Load a backend from a config dictionary
@@ -2,23 +2,31 @@ from typing import List
 import os
 import re
 import logging
-from tenacity import retry, stop_after_attempt, wait_random_exponential
 
 from .base import IntelligenceBackend
+from .resilience import resilient
 from ..message import Message, SYSTEM_NAME as SYSTEM
 
-try:
-    import anthropic
-except ImportError:
-    is_anthropic_available = False
-    logging.warning("anthropic package is not installed")
-else:
-    anthropic_api_key = os.environ.get('ANTHROPIC_API_KEY')
-    if anthropic_api_key is None:
+anthropic = None  # The anthropic package is imported on first construction of the backend
+
+
+def is_anthropic_available() -> bool:
+    """
+    import the anthropic package and check whether the API key is set
+    """
+    global anthropic
+    if anthropic is None:
+        try:
+            import anthropic as anthropic_module
+        except ImportError:
+            logging.warning("anthropic package is not installed")
+            return False
+        anthropic = anthropic_module
+
+    if os.environ.get('ANTHROPIC_API_KEY') is None:
         logging.warning("Anthropic API key is not set. Please set the environment variable ANTHROPIC_API_KEY")
-        is_anthropic_available = False
-    else:
-        is_anthropic_available = True
+        return False
+    return True
 
 DEFAULT_MAX_TOKENS = 256
 DEFAULT_MODEL = "claude-v1"
@@ -32,7 +40,7 @@ class Claude(IntelligenceBackend):
     type_name = "claude"
 
     def __init__(self, max_tokens: int = DEFAULT_MAX_TOKENS, model: str = DEFAULT_MODEL, **kwargs):
-        assert is_anthropic_available, "anthropic package is not installed or the API key is not set"
+        assert is_anthropic_available(), "anthropic package is not installed or the API key is not set"
         super().__init__(max_tokens=max_tokens, model=model, **kwargs)
 
         self.max_tokens = max_tokens
@@ -40,8 +48,9 @@ class Claude(IntelligenceBackend):
 
         self.client = anthropic.Client(os.environ['ANTHROPIC_API_KEY'])
 
-    @retry(stop=stop_after_attempt(6), wait=wait_random_exponential(min=1, max=60))
+    @resilient(max_attempts=6)
     def _get_response(self, prompt: str):
+        self._count_attempt()
         response = self.client.completion(
             prompt=prompt,
             stop_sequences=[anthropic.HUMAN_PROMPT],
@@ -92,7 +101,8 @@ class Claude(IntelligenceBackend):
         # Add the AI prompt for Claude to generate the response
         prompt = f"{prompt}{anthropic.AI_PROMPT}"
 
-        response = self._get_response(prompt, *args, **kwargs)
+        with self.track_call(agent_name):
+            response = self._get_response(prompt, *args, **kwargs)
 
         # Remove the agent name if the response starts with it
         response = re.sub(rf"^\s*\[{agent_name}]:?", "", response).strip()
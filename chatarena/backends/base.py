@@ -1,8 +1,13 @@
 from typing import List
 from abc import abstractmethod
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import time
 
+from .resilience import BackendError
 from ..config import BackendConfig, Configurable
 from ..message import Message
+from ..metrics import CallStats, MetricsRecorder, _current_call, current_call
 
 
 class IntelligenceBackend(Configurable):
@@ -13,6 +18,8 @@ class IntelligenceBackend(Configurable):
     @abstractmethod
     def __init__(self, **kwargs):
         super().__init__(**kwargs)  # registers the arguments with Configurable
+        self.metrics = None  # the MetricsRecorder of the backend calls, if any
+        self.metrics_role = None  # the role to record the calls under, defaults to the agent name
 
     def __init_subclass__(cls, **kwargs):
         # check if the subclass has the required attributes
@@ -21,6 +28,56 @@ class IntelligenceBackend(Configurable):
                 raise TypeError(f"Can't instantiate abstract class {cls.__name__} without {required} attribute defined")
         return super().__init_subclass__(**kwargs)
 
+    @property
+    def provider(self) -> str:
+        """
+        the provider called by the backend, whose calls share a circuit breaker and a retry budget per model
+        """
+        return self.type_name
+
+    def attach_metrics(self, metrics: MetricsRecorder, role: str = None):
+        """
+        record the wall time, retries, token usage and errors of the calls into metrics
+        """
+        self.metrics = metrics
+        self.metrics_role = role
+
+    @contextmanager
+    def track_call(self, agent_name: str):
+        """
+        track one call of the backend, including all its retries
+        """
+        if self.metrics is None:
+            yield None
+            return
+
+        call = CallStats()
+        _current_call.stats = call
+        start = time.perf_counter()
+        try:
+            yield call
+        except BackendError as e:
+            call.error = type(e.cause or e).__name__
+            raise
+        except Exception as e:
+            call.error = type(e).__name__
+            raise
+        finally:
+            call.wall_time = time.perf_counter() - start
+            _current_call.stats = None
+            model = getattr(self, "model", None) or self.type_name
+            self.metrics.record(self.metrics_role or agent_name, model, call)
+
+    @staticmethod
+    def _count_attempt() -> CallStats:
+        """
+        count one attempt of the tracked call, to be called at the beginning of the retried _get_response
+        """
+        call = current_call()
+        if call is not None:
+            call.attempts += 1
+        return call
+
     def to_config(self) -> BackendConfig:
         self._config_dict["backend_type"] = self.type_name
         return BackendConfig(**self._config_dict)
@@ -30,6 +87,33 @@ class IntelligenceBackend(Configurable):
               request_msg: Message = None, *args, **kwargs) -> str:
         raise NotImplementedError
 
+    def batch_query(self, queries: List[dict], max_workers: int = 16,
+                    backends: List["IntelligenceBackend"] = None) -> list:
+        """
+        query a batch of prompts, e.g., the pending queries of many arenas stepped in lockstep
+        Backends that can generate a batch at once override this, by default the queries are sent concurrently.
+        args:
+            queries: the keyword arguments of query for each prompt
+            max_workers: the max number of concurrent queries
+            backends: the backend of each query, built from the same config as this backend (e.g., the backends of
+                the arenas of a VectorArena), which sends the query and records it in its metrics, default to self
+        returns:
+            the responses in the order of the queries, a query that failed is returned as its exception
+        """
+        backends = backends or [self] * len(queries)
+        assert len(backends) == len(queries), "Must give the backend of each query"
+
+        def safe_query(backend, query_kwargs):
+            try:
+                return backend.query(**query_kwargs)
+            except Exception as e:
+                return e
+
+        if len(queries) <= 1:
+            return [safe_query(backend, query_kwargs) for backend, query_kwargs in zip(backends, queries)]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(queries))) as executor:
+            return list(executor.map(safe_query, backends, queries))
+
     @abstractmethod
     async def async_query(self, agent_name: str, role_desc: str, history_messages: List[Message],
                           global_prompt: str = None, request_msg: Message = None, *args, **kwargs) -> str:
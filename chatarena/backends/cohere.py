@@ -1,20 +1,26 @@
 from typing import List
 import os
-from tenacity import retry, stop_after_attempt, wait_random_exponential
 
 from .base import IntelligenceBackend
+from .resilience import resilient
 from ..message import Message
 
-# Try to import the cohere package and check whether the API key is set
-try:
-    import cohere
-except ImportError:
-    is_cohere_available = False
-else:
-    if os.environ.get('COHEREAI_API_KEY') is None:
-        is_cohere_available = False
-    else:
-        is_cohere_available = True
+cohere = None  # The cohere package is imported on first construction of the backend
+
+
+def is_cohere_available() -> bool:
+    """
+    import the cohere package and check whether the API key is set
+    """
+    global cohere
+    if cohere is None:
+        try:
+            import cohere as cohere_module
+        except ImportError:
+            return False
+        cohere = cohere_module
+
+    return os.environ.get('COHEREAI_API_KEY') is not None
 
 # Default config follows the [Cohere documentation](https://cohere-sdk.readthedocs.io/en/latest/cohere.html#cohere.client.Client.chat)
 DEFAULT_TEMPERATURE = 0.8
@@ -37,7 +43,7 @@ class CohereAIChat(IntelligenceBackend):
         self.max_tokens = max_tokens
         self.model = model
 
-        assert is_cohere_available, "Cohere package is not installed or the API key is not set"
+        assert is_cohere_available(), "Cohere package is not installed or the API key is not set"
         self.client = cohere.Client(os.environ.get('COHEREAI_API_KEY'))
 
         # Stateful variables
@@ -48,8 +54,9 @@ class CohereAIChat(IntelligenceBackend):
         self.session_id = None
         self.last_msg_hash = None
 
-    @retry(stop=stop_after_attempt(6), wait=wait_random_exponential(min=1, max=60))
+    @resilient(max_attempts=6)
     def _get_response(self, new_message: str, persona_prompt: str):
+        self._count_attempt()
         response = self.client.chat(
             new_message,
             persona_prompt=persona_prompt,
@@ -96,7 +103,8 @@ class CohereAIChat(IntelligenceBackend):
         new_message = "\n".join(new_conversations)
         persona_prompt = f"Environment:\n{global_prompt}\n\nYour role:\n{role_desc}"
 
-        response = self._get_response(new_message, persona_prompt)
+        with self.track_call(agent_name):
+            response = self._get_response(new_message, persona_prompt)
 
         # Only update the last message hash if the API call is successful
         self.last_msg_hash = new_messages[-1].msg_hash
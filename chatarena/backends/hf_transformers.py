@@ -1,18 +1,86 @@
 from typing import List
-from tenacity import retry, stop_after_attempt, wait_random_exponential
+import time
+import queue
+import threading
+from concurrent.futures import Future
 
 from .base import IntelligenceBackend
+from .resilience import resilient
 from ..message import Message, SYSTEM_NAME as SYSTEM
 
-# Try to import the transformers package
-try:
-    import transformers
-    from transformers import pipeline
-    from transformers.pipelines.conversational import Conversation, ConversationalPipeline
-except ImportError:
-    is_transformers_available = False
-else:
-    is_transformers_available = True
+# The transformers package takes seconds to import, so it is imported on first construction of the backend
+pipeline = None
+Conversation = None
+
+
+def is_transformers_available() -> bool:
+    """
+    import the transformers package
+    """
+    global pipeline, Conversation
+    if pipeline is None:
+        try:
+            from transformers import pipeline as pipeline_fn
+            from transformers.pipelines.conversational import Conversation as conversation_cls
+        except ImportError:
+            return False
+        pipeline, Conversation = pipeline_fn, conversation_cls
+    return True
+
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_MAX_BATCH_DELAY = 0.05  # seconds
+
+
+class BatchScheduler:
+    """
+    Collect the pending conversations from concurrent arenas and run them through the pipeline in one forward pass.
+    A batch is dispatched once it reaches max_batch_size or its oldest query has waited for max_batch_delay seconds.
+    """
+
+    def __init__(self, chatbot, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_batch_delay: float = DEFAULT_MAX_BATCH_DELAY):
+        self.chatbot = chatbot
+        self.max_batch_size = max_batch_size
+        self.max_batch_delay = max_batch_delay
+
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, conversation) -> Future:
+        future = Future()
+        self._queue.put((conversation, future))
+        return future
+
+    def _collect(self):
+        # Block until the first query arrives, then wait for more until the batch is full or the deadline passes
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_batch_delay
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            conversations = [conversation for conversation, _ in batch]
+            try:
+                outputs = self.chatbot(conversations, batch_size=len(conversations))
+                # The pipeline unwraps the output if there is only one conversation
+                if not isinstance(outputs, list):
+                    outputs = [outputs]
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for output, (_, future) in zip(outputs, batch):
+                future.set_result(output.generated_responses[-1])
 
 
 class TransformersConversational(IntelligenceBackend):
@@ -22,26 +90,74 @@ class TransformersConversational(IntelligenceBackend):
     stateful = False
     type_name = "transformers:conversational"
 
-    def __init__(self, model: str, device: int = -1, **kwargs):
-        super().__init__(model=model, device=device, **kwargs)
+    def __init__(self, model: str, device: int = -1, batching: bool = False,
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE, max_batch_delay: float = DEFAULT_MAX_BATCH_DELAY,
+                 **kwargs):
+        """
+        instantiate the TransformersConversational backend
+        args:
+            model: the model to use
+            device: the device to run the model on, -1 for CPU
+            batching: whether to batch the queries from concurrent arenas into one forward pass
+            max_batch_size: the maximum number of conversations in a batch
+            max_batch_delay: the maximum time (in seconds) a query waits for the batch to fill up
+        """
+        super().__init__(model=model, device=device, batching=batching, max_batch_size=max_batch_size,
+                         max_batch_delay=max_batch_delay, **kwargs)
         self.model = model
         self.device = device
+        self.batching = batching
 
-        assert is_transformers_available, "Transformers package is not installed"
+        assert is_transformers_available(), "Transformers package is not installed"
         self.chatbot = pipeline(task="conversational", model=self.model, device=self.device)
 
-    @retry(stop=stop_after_attempt(6), wait=wait_random_exponential(min=1, max=60))
-    def _get_response(self, conversation: Conversation):
+        # Padding is required to stack conversations of different lengths, see also batch_query.
+        # Decoder-only models generate after the last token, so the prompts are padded on the left,
+        # otherwise the shorter prompts of a batch would be continued after their padding.
+        # Encoder-decoder models (e.g., Blenderbot) keep the padding of their tokenizer, since left padding would
+        # shift the positions of the encoder inputs.
+        if not self.chatbot.model.config.is_encoder_decoder:
+            tokenizer = self.chatbot.tokenizer
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+            tokenizer.padding_side = "left"
+
+        if batching:
+            self.scheduler = BatchScheduler(self.chatbot, max_batch_size=max_batch_size,
+                                            max_batch_delay=max_batch_delay)
+        else:
+            self.scheduler = None
+
+    @resilient(max_attempts=6)
+    def _get_response(self, conversation: "Conversation"):
+        self._count_attempt()
+        if self.scheduler is not None:
+            return self.scheduler.submit(conversation).result()
+
         conversation = self.chatbot(conversation)
         response = conversation.generated_responses[-1]
         return response
 
+    @resilient(max_attempts=6)
+    def _get_responses(self, conversations: List["Conversation"]):
+        self._count_attempt()
+        if self.scheduler is not None:
+            # Coalesced with the queries of concurrent arenas
+            futures = [self.scheduler.submit(conversation) for conversation in conversations]
+            return [future.result() for future in futures]
+
+        outputs = self.chatbot(conversations, batch_size=len(conversations))
+        # The pipeline unwraps the output if there is only one conversation
+        if not isinstance(outputs, list):
+            outputs = [outputs]
+        return [output.generated_responses[-1] for output in outputs]
+
     @staticmethod
     def _msg_template(agent_name, content):
         return f"[{agent_name}]: {content}"
 
-    def query(self, agent_name: str, role_desc: str, history_messages: List[Message], global_prompt: str = None,
-              request_msg: Message = None, *args, **kwargs) -> str:
+    def _make_conversation(self, agent_name: str, role_desc: str, history_messages: List[Message],
+                           global_prompt: str = None, request_msg: Message = None) -> "Conversation":
         user_inputs, generated_responses = [], []
         all_messages = [(SYSTEM, global_prompt), (SYSTEM, role_desc)] if global_prompt else [(SYSTEM, role_desc)]
 
@@ -73,13 +189,36 @@ class TransformersConversational(IntelligenceBackend):
         new_user_input = user_inputs[-1]
 
         # Recreate a conversation object from the history messages
-        conversation = Conversation(text=new_user_input, past_user_inputs=past_user_inputs,
-                                    generated_responses=generated_responses)
+        return Conversation(text=new_user_input, past_user_inputs=past_user_inputs,
+                            generated_responses=generated_responses)
+
+    def query(self, agent_name: str, role_desc: str, history_messages: List[Message], global_prompt: str = None,
+              request_msg: Message = None, *args, **kwargs) -> str:
+        conversation = self._make_conversation(agent_name, role_desc, history_messages, global_prompt, request_msg)
 
         # Get the response
-        response = self._get_response(conversation)
+        with self.track_call(agent_name):
+            response = self._get_response(conversation)
         return response
 
+    def batch_query(self, queries: List[dict], max_workers: int = 16,
+                    backends: List[IntelligenceBackend] = None) -> list:
+        """
+        generate the responses of a batch of prompts in one forward pass of the pipeline
+        The batch is generated by this backend, even if the queries come from other backends of the same config.
+        """
+        if len(queries) == 0:
+            return []
+        conversations = [self._make_conversation(query["agent_name"], query["role_desc"],
+                                                 query["history_messages"], query.get("global_prompt"),
+                                                 query.get("request_msg")) for query in queries]
+        # The whole batch is recorded as one call
+        try:
+            with self.track_call(queries[0]["agent_name"]):
+                return self._get_responses(conversations)
+        except Exception as e:
+            return [e] * len(queries)
+
 # conversation = Conversation("Going to the movies tonight - any suggestions?")
 #
 # # Steps usually performed by the model when generating a response:
@@ -1,34 +1,161 @@
-from typing import List
+from typing import List, Callable
 import os
 import re
+import json
 import logging
-from tenacity import retry, stop_after_attempt, wait_random, wait_random_exponential
+import threading
 
 from .base import IntelligenceBackend
+from .resilience import resilient
 from ..message import Message, SYSTEM_NAME, MODERATOR_NAME
+from ..metrics import count_tokens
 
 try:
-    import openai
+    import requests
+    from requests.adapters import HTTPAdapter
 except ImportError:
-    is_openai_available = False
-    logging.warning("openai package is not installed")
+    is_requests_available = False
+    logging.warning("requests package is not installed")
 else:
-    openai.api_key = os.environ.get("OPENAI_API_KEY")
-    if openai.api_key is None:
-        logging.warning("OpenAI API key is not set. Please set the environment variable OPENAI_API_KEY")
-        is_openai_available = False
-    else:
-        is_openai_available = True
+    is_requests_available = True
+
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+OPENAI_OFFICIAL_API_BASE = "https://api.openai.com/v1"
+OPENAI_API_BASE = os.environ.get("OPENAI_API_BASE", OPENAI_OFFICIAL_API_BASE)
+if OPENAI_API_KEY is None:
+    logging.warning("OpenAI API key is not set. Please set the environment variable OPENAI_API_KEY")
 
 # Default config follows the OpenAI playground
 DEFAULT_TEMPERATURE = 0.7
 DEFAULT_MAX_TOKENS = 256
 DEFAULT_MODEL = "gpt-3.5-turbo"
 
+# Default HTTP transport config
+DEFAULT_POOL_SIZE = 16
+DEFAULT_REQUEST_TIMEOUT = 600  # seconds, same as the openai package
+
 END_OF_MESSAGE = "<EOS>"  # End of message token specified by us not OpenAI
 STOP = ("<|endoftext|>", END_OF_MESSAGE)  # End of sentence token
 BASE_PROMPT = f"The messages always end with the token {END_OF_MESSAGE}."
 
+# A leading "[Name]:" prefix, where the model starts by naming the role it speaks as
+LEADING_ROLE_PREFIX = re.compile(r"\s*\[([^\[\]\n]+)\]:\s*")
+# The end of a text that may still grow into a "[Name]:" prefix
+PARTIAL_ROLE_PREFIX = re.compile(r"\[[^\[\]\n]*(\]:?)?$")
+
+# Keep-alive HTTP sessions shared by all backends with the same (api_base, pool_size)
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(api_base: str, pool_size: int = DEFAULT_POOL_SIZE):
+    """
+    get a pooled keep-alive HTTP session, so that the TLS handshake is paid once per connection
+    instead of once per call
+    """
+    key = (api_base, pool_size)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[key] = session
+    return session
+
+
+class StreamCutter:
+    """
+    Accumulate a streamed response and cut it as soon as the end of message token appears, or the model starts
+    speaking for another role of the conversation with a "[Name]:" prefix. The text that can no longer be cut is
+    released incrementally, without the leading "[Name]:" prefix of the agent.
+    """
+
+    def __init__(self, agent_name: str, role_names=()):
+        """
+        args:
+            agent_name: the name of the agent that speaks
+            role_names: the names of the roles of the conversation, the text is only cut on their "[Name]:" prefix,
+                so that e.g. "[10]:" within the response is kept
+        """
+        self.agent_name = agent_name
+        self.role_prefixes = tuple(f"[{name}]:" for name in set(role_names) if name != agent_name)
+        self.text = ""
+        self.stopped = False
+        self._start = None  # the start of the text after the leading prefix, None until it is known
+        self._released = 0
+
+    def _find_cut(self):
+        cut = self.text.find(END_OF_MESSAGE)
+        cut = len(self.text) if cut < 0 else cut
+        for prefix in self.role_prefixes:
+            start = self.text.find(prefix, max(self._start or 0, 1), cut)
+            if start >= 0:
+                cut = start
+        return cut if cut < len(self.text) else None
+
+    def _find_start(self):
+        stripped = self.text.lstrip()
+        if not stripped:
+            return None
+        if not stripped.startswith("["):
+            return len(self.text) - len(stripped)
+        match = LEADING_ROLE_PREFIX.match(self.text)
+        if match is not None and match.end() < len(self.text):
+            return match.end()
+        # the prefix may still be incomplete
+        return None if PARTIAL_ROLE_PREFIX.match(stripped) or match is not None else len(self.text) - len(stripped)
+
+    def _safe_end(self) -> int:
+        end = len(self.text)
+        # hold back a partial end of message token or "[Name]:" prefix
+        for k in range(min(len(END_OF_MESSAGE) - 1, end), 0, -1):
+            if END_OF_MESSAGE.startswith(self.text[end - k:]):
+                end -= k
+                break
+        bracket = self.text.rfind("[", self._start, end)
+        if bracket >= 0 and any(prefix.startswith(self.text[bracket:end]) for prefix in self.role_prefixes):
+            end = bracket
+        return end
+
+    @property
+    def num_released(self) -> int:
+        """the number of characters released so far"""
+        return 0 if self._start is None else self._released - self._start
+
+    def feed(self, delta: str) -> str:
+        """
+        add a chunk of the stream, returns the text released by it
+        """
+        if self.stopped:
+            return ""
+        self.text += delta
+        cut = self._find_cut()
+        if cut is not None:
+            self.text = self.text[:cut]
+            self.stopped = True
+        if self._start is None:
+            self._start = self._find_start()
+            if self._start is None:
+                return self.finish() if self.stopped else ""
+            self._released = self._start
+        end = len(self.text) if self.stopped else self._safe_end()
+        released = self.text[self._released:end]
+        self._released = max(self._released, end)
+        return released
+
+    def finish(self) -> str:
+        """
+        release the rest of the text once the stream ends
+        """
+        if self._start is None:
+            match = LEADING_ROLE_PREFIX.match(self.text)
+            self._start = self._released = match.end() if match else len(self.text) - len(self.text.lstrip())
+        released = self.text[self._released:]
+        self._released = len(self.text)
+        return released
+
 
 class OpenAIChat(IntelligenceBackend):
     """
@@ -38,7 +165,9 @@ class OpenAIChat(IntelligenceBackend):
     type_name = "openai-chat"
 
     def __init__(self, temperature: float = DEFAULT_TEMPERATURE, max_tokens: int = DEFAULT_MAX_TOKENS,
-                 model: str = DEFAULT_MODEL, merge_other_agents_as_one_user: bool = True, **kwargs):
+                 model: str = DEFAULT_MODEL, merge_other_agents_as_one_user: bool = True, api_base: str = None,
+                 pool_size: int = DEFAULT_POOL_SIZE, request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                 stream: bool = False, api_key: str = None, **kwargs):
         """
         instantiate the OpenAIChat backend
         args:
@@ -46,30 +175,152 @@ class OpenAIChat(IntelligenceBackend):
             max_tokens: the maximum number of tokens to sample
             model: the model to use
             merge_other_agents_as_one_user: whether to merge messages from other agents as one user message
+            api_base: the base URL of an OpenAI-compatible API, e.g., a self-hosted model or the local stub server
+            pool_size: the maximum number of keep-alive connections to the API
+            request_timeout: the timeout (in seconds) of each request
+            stream: whether to stream the response, which is cut as soon as the end of message token appears or the
+                model starts speaking for another role, and is sent to the listeners as it is generated
+            api_key: the key of the API at api_base, which is not part of the config, defaults to OPENAI_API_KEY for
+                the official API only, so that the OpenAI key is never sent to another server
         """
-        assert is_openai_available, "openai package is not installed or the API key is not set"
+        assert is_requests_available, "requests package is not installed"
+        api_base = (api_base or OPENAI_API_BASE).rstrip("/")
+        if api_key is None and api_base == OPENAI_OFFICIAL_API_BASE:
+            api_key = OPENAI_API_KEY
+        # The API key is only mandatory for the official API, self-hosted servers usually ignore it
+        assert api_key is not None or api_base != OPENAI_OFFICIAL_API_BASE, "The OpenAI API key is not set"
         super().__init__(temperature=temperature, max_tokens=max_tokens, model=model,
-                         merge_other_agents_as_one_user=merge_other_agents_as_one_user, **kwargs)
+                         merge_other_agents_as_one_user=merge_other_agents_as_one_user, api_base=api_base,
+                         pool_size=pool_size, request_timeout=request_timeout, stream=stream, **kwargs)
 
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.model = model
         self.merge_other_agent_as_user = merge_other_agents_as_one_user
+        self.api_base = api_base
+        self.pool_size = pool_size
+        self.request_timeout = request_timeout
+        self.stream = stream
+        self.listeners = []
+        self._api_key = api_key
+
+        self.session = get_session(api_base, pool_size)
+
+    @property
+    def provider(self) -> str:
+        return self.api_base
+
+    def add_listener(self, listener: Callable[..., None]):
+        """
+        receive the streamed text as listener(agent_name, delta, done, retry), done is True once the response is
+        complete, and retry is True if the attempt failed after some text was sent, which is then to be discarded
+        since the response is generated again (or the call fails)
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[..., None]):
+        self.listeners.remove(listener)
+
+    def _notify(self, agent_name: str, delta: str, done: bool = False, retry: bool = False):
+        for listener in self.listeners:
+            listener(agent_name, delta, done, retry)
 
-    @retry(stop=stop_after_attempt(5), wait=wait_random_exponential(min=1, max=60))  # Modified retry strategy
+    def _request(self, messages, stream: bool = False):
+        headers = {"Content-Type": "application/json"}
+        if self._api_key is not None:
+            headers["Authorization"] = f"Bearer {self._api_key}"
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stop": list(STOP),
+        }
+        if stream:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+        return headers, payload
+
+    @resilient(max_attempts=5)
     def _get_response(self, messages):
-        completion = openai.ChatCompletion.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            stop=STOP
-        )
-
-        response = completion.choices[0]['message']['content']
+        call = self._count_attempt()
+        headers, payload = self._request(messages)
+        resp = self.session.post(f"{self.api_base}/chat/completions", json=payload, headers=headers,
+                                 timeout=self.request_timeout)
+        resp.raise_for_status()
+        completion = resp.json()
+
+        usage = completion.get("usage")
+        if call is not None and usage:
+            call.prompt_tokens += usage.get("prompt_tokens", 0)
+            call.completion_tokens += usage.get("completion_tokens", 0)
+
+        response = completion["choices"][0]["message"]["content"]
         response = response.strip()
         return response
 
+    @resilient(max_attempts=5)
+    def _get_streamed_response(self, messages, agent_name: str, role_names=()):
+        call = self._count_attempt()
+        cutter = StreamCutter(agent_name, role_names)
+        try:
+            usage = self._stream(messages, agent_name, cutter)
+        except Exception:
+            if cutter.num_released > 0:
+                # The text sent so far is discarded by the listeners, the attempt may be retried
+                self._notify(agent_name, "", retry=True)
+            raise
+        released = cutter.finish()
+        self._notify(agent_name, released, done=True)
+
+        if call is not None:
+            if usage and not cutter.stopped:
+                call.prompt_tokens += usage.get("prompt_tokens", 0)
+                call.completion_tokens += usage.get("completion_tokens", 0)
+            else:  # the usage comes with the last event, which is not received if the stream is cut
+                call.prompt_tokens += sum(count_tokens(msg["content"], self.model) for msg in messages)
+                call.completion_tokens += count_tokens(cutter.text, self.model)
+        return cutter.text.strip()
+
+    def _stream(self, messages, agent_name: str, cutter: StreamCutter):
+        """
+        send the streamed response to the listeners as the cutter releases it, returns the usage if reported
+        """
+        headers, payload = self._request(messages, stream=True)
+        usage = None
+        with self.session.post(f"{self.api_base}/chat/completions", json=payload, headers=headers,
+                               timeout=self.request_timeout, stream=True) as resp:
+            resp.raise_for_status()
+            if not resp.headers.get("Content-Type", "").startswith("text/event-stream"):
+                # The server does not support streaming and sent the whole completion
+                completion = resp.json()
+                usage = completion.get("usage")
+                lines = []
+                released = cutter.feed(completion["choices"][0]["message"]["content"])
+                if released:
+                    self._notify(agent_name, released)
+            else:
+                lines = resp.iter_lines(decode_unicode=True)
+            # Server-sent events, one "data: {chunk}" line per event
+            for line in lines:
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                usage = chunk.get("usage") or usage
+                for choice in chunk.get("choices") or []:
+                    delta = choice.get("delta", {}).get("content")
+                    if delta:
+                        released = cutter.feed(delta)
+                        if released:
+                            self._notify(agent_name, released)
+                if cutter.stopped:
+                    # Closing the connection stops the generation, the rest would be cut anyway
+                    break
+        return usage
+
     def query(self, agent_name: str, role_desc: str, history_messages: List[Message], global_prompt: str = None,
               request_msg: Message = None, *args, **kwargs) -> str:
         """
@@ -122,7 +373,13 @@ class OpenAIChat(IntelligenceBackend):
                     else:
                         raise ValueError(f"Invalid role: {messages[-1]['role']}")
 
-        response = self._get_response(messages, *args, **kwargs)
+        with self.track_call(agent_name):
+            if self.stream:
+                # The response is only cut where the model starts speaking for a role of the conversation
+                role_names = {msg.agent_name for msg in history_messages} | {SYSTEM_NAME, MODERATOR_NAME}
+                response = self._get_streamed_response(messages, agent_name, role_names)
+            else:
+                response = self._get_response(messages, *args, **kwargs)
 
         # Remove the agent name if the response starts with it
         response = re.sub(rf"^\s*\[.*]:", "", response).strip()
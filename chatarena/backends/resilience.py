@@ -0,0 +1,335 @@
+"""
+Resilience layer shared by the backends: error classification, retries with backoff that honor Retry-After,
+a circuit breaker and a retry budget per (provider, model).
+
+A backend method that calls the provider is decorated with @resilient instead of a fixed retry policy:
+- a fatal error (e.g., a bad request) is raised as FatalBackendError without being retried,
+- a retryable error (e.g., a rate limit or a timeout) is retried with jittered exponential backoff,
+  waiting at least the Retry-After of the provider, until RetriesExhausted is raised,
+- the retries of all the calls to a provider are limited by its RetryBudget,
+- once a provider fails failure_threshold times in a row, its CircuitBreaker opens and the calls fail fast with
+  CircuitOpenError for reset_timeout seconds, so that a down provider is detected in seconds.
+"""
+from typing import Callable, Dict, Optional, Tuple
+from collections import deque
+from email.utils import parsedate_to_datetime
+import datetime
+import functools
+import logging
+import random
+import threading
+import time
+
+# Default policy
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BASE_DELAY = 1.  # seconds
+DEFAULT_MAX_DELAY = 60.  # seconds
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.  # seconds
+DEFAULT_BUDGET_RATIO = 0.2  # retries per request
+DEFAULT_BUDGET_MIN_RETRIES = 10  # retries allowed per window regardless of the ratio
+DEFAULT_BUDGET_WINDOW = 10.  # seconds
+
+# HTTP status codes worth retrying, other 4xx are fatal
+RETRYABLE_STATUS = {408, 409, 425, 429}
+
+# Exception class names of the provider SDKs, which are not imported here
+RETRYABLE_ERROR_NAMES = {
+    "RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError", "ServiceUnavailableError",
+    "Timeout", "ConnectTimeout", "ReadTimeout", "ConnectionError", "ChunkedEncodingError", "TooManyRequestsError",
+    "JSONDecodeError",  # e.g., a truncated response
+}
+FATAL_ERROR_NAMES = {
+    "BadRequestError", "InvalidRequestError", "AuthenticationError", "PermissionDeniedError", "NotFoundError",
+    "UnprocessableEntityError", "InvalidURL", "MissingSchema",
+}
+
+
+class BackendError(Exception):
+    """
+    The error of a backend call, after the resilience policy has been applied.
+    """
+
+    def __init__(self, message: str, cause: Exception = None, attempts: int = 0):
+        super().__init__(message)
+        self.cause = cause  # the last error raised by the provider, if any
+        self.attempts = attempts
+
+
+class FatalBackendError(BackendError):
+    """An error that is not worth retrying, e.g., a bad request or an authentication error."""
+
+
+class RetriesExhausted(BackendError):
+    """A retryable error that persisted after the max attempts, or the retry budget was exhausted."""
+
+
+class CircuitOpenError(BackendError):
+    """The provider has failed repeatedly and is not called until its circuit breaker resets."""
+
+
+def parse_retry_after(headers) -> Optional[float]:
+    """
+    get the seconds to wait from the retry-after-ms or Retry-After header, in seconds or as an HTTP date
+    """
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return max(0., float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0., float(value))
+    except ValueError:
+        pass
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0., (date - datetime.datetime.now(date.tzinfo)).total_seconds())
+
+
+def _get_status(e: Exception) -> Optional[int]:
+    response = getattr(e, "response", None)
+    for status in (getattr(response, "status_code", None), getattr(e, "status_code", None),
+                   getattr(e, "http_status", None)):
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def classify_error(e: Exception) -> Tuple[bool, Optional[float]]:
+    """
+    classify an error raised by a provider
+    returns:
+        whether the error is retryable, and the seconds to wait as requested by the provider (if any)
+    """
+    response = getattr(e, "response", None)
+    retry_after = parse_retry_after(getattr(response, "headers", None) or getattr(e, "headers", None))
+
+    status = _get_status(e)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500, retry_after
+
+    names = {cls.__name__ for cls in type(e).__mro__}
+    if names & FATAL_ERROR_NAMES:
+        return False, retry_after
+    if names & RETRYABLE_ERROR_NAMES or isinstance(e, (TimeoutError, ConnectionError)):
+        return True, retry_after
+    # Programming errors are not fixed by retrying
+    if isinstance(e, (ValueError, TypeError, KeyError, AttributeError, AssertionError, NotImplementedError)):
+        return False, retry_after
+    # Unknown errors are retried, as by the former fixed policy
+    return True, retry_after
+
+
+class CircuitBreaker:
+    """
+    Open after failure_threshold consecutive retryable failures, then let a single trial call through after
+    reset_timeout seconds (half-open): the circuit closes if it succeeds and opens again otherwise.
+    """
+
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = "closed"
+        self.failures = 0  # consecutive failures
+        self.num_opened = 0
+        self._opened_at = 0.
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self, name: str = ""):
+        """
+        check whether a call is allowed, raises CircuitOpenError otherwise
+        """
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            if self.state != "closed":
+                retry_in = max(0., self.reset_timeout - (time.monotonic() - self._opened_at))
+                raise CircuitOpenError(f"The circuit of {name} is open after {self.failures} consecutive failures, "
+                                       f"retry in {retry_in:.1f}s")
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """
+        let another trial call through after a call that proved nothing about the provider, e.g., a bad request
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.num_opened += 1
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+                return True  # just opened
+        return False
+
+
+class RetryBudget:
+    """
+    Limit the retries to a provider to min_retries plus ratio times the requests within the last window seconds,
+    so that retries cannot multiply the load on a struggling provider.
+    """
+
+    def __init__(self, ratio: float = DEFAULT_BUDGET_RATIO, min_retries: int = DEFAULT_BUDGET_MIN_RETRIES,
+                 window: float = DEFAULT_BUDGET_WINDOW):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+
+        self._requests = deque()
+        self._retries = deque()
+        self.num_requests = 0
+        self.num_retries = 0
+        self.num_rejected = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        for events in (self._requests, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            self._requests.append(now)
+            self.num_requests += 1
+
+    def try_retry(self) -> bool:
+        """
+        withdraw a retry from the budget, returns False if the budget is exhausted
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+                self.num_rejected += 1
+                return False
+            self._retries.append(now)
+            self.num_retries += 1
+            return True
+
+    @property
+    def remaining(self) -> int:
+        with self._lock:
+            self._expire(time.monotonic())
+            return max(0, int(self.min_retries + self.ratio * len(self._requests)) - len(self._retries))
+
+
+# The circuit breaker and retry budget of each (provider, model)
+_guards: Dict[Tuple[str, str], Tuple[CircuitBreaker, RetryBudget]] = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(provider: str, model: str = None) -> Tuple[CircuitBreaker, RetryBudget]:
+    key = (provider, model)
+    with _guards_lock:
+        guard = _guards.get(key)
+        if guard is None:
+            guard = _guards[key] = (CircuitBreaker(), RetryBudget())
+    return guard
+
+
+def reset_guards():
+    with _guards_lock:
+        _guards.clear()
+
+
+def resilience_report() -> Dict[str, Dict]:
+    """
+    report the circuit breaker and retry budget of every provider called so far
+    """
+    with _guards_lock:
+        guards = dict(_guards)
+    report = {}
+    for (provider, model), (breaker, budget) in guards.items():
+        report[f"{provider}/{model}" if model else provider] = {
+            "circuit": breaker.state,
+            "consecutive_failures": breaker.failures,
+            "times_opened": breaker.num_opened,
+            "requests": budget.num_requests,
+            "retries": budget.num_retries,
+            "retries_rejected": budget.num_rejected,
+            "retry_budget_remaining": budget.remaining,
+        }
+    return report
+
+
+def backoff_delay(attempt: int, retry_after: float = None, base_delay: float = DEFAULT_BASE_DELAY,
+                  max_delay: float = DEFAULT_MAX_DELAY) -> float:
+    """
+    the full-jitter exponential delay before the next attempt, at least the Retry-After of the provider
+    """
+    delay = random.uniform(base_delay, min(max_delay, base_delay * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def resilient(max_attempts: int = DEFAULT_MAX_ATTEMPTS, base_delay: float = DEFAULT_BASE_DELAY,
+              max_delay: float = DEFAULT_MAX_DELAY) -> Callable:
+    """
+    decorate a backend method that calls the provider, the guard is chosen by the provider and model of the backend
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(backend, *args, **kwargs):
+            name = backend.provider
+            model = getattr(backend, "model", None)
+            breaker, budget = get_guard(name, model)
+            name = f"{name}/{model}" if model else name
+
+            budget.record_request()
+            attempt = 0
+            while True:
+                breaker.before_call(name)
+                try:
+                    result = func(backend, *args, **kwargs)
+                except Exception as e:
+                    attempt += 1
+                    retryable, retry_after = classify_error(e)
+                    if not retryable:
+                        # The request is wrong, which neither closes nor opens the circuit
+                        breaker.release_trial()
+                        raise FatalBackendError(f"{name}: {type(e).__name__}: {e}", cause=e, attempts=attempt) from e
+                    if breaker.record_failure():
+                        logging.warning(f"The circuit of {name} is open after {breaker.failures} consecutive "
+                                        f"failures, the calls fail fast for {breaker.reset_timeout}s")
+                    if attempt >= max_attempts:
+                        raise RetriesExhausted(f"{name}: gave up after {attempt} attempts: {type(e).__name__}: {e}",
+                                               cause=e, attempts=attempt) from e
+                    if not budget.try_retry():
+                        raise RetriesExhausted(f"{name}: retry budget exhausted: {type(e).__name__}: {e}",
+                                               cause=e, attempts=attempt) from e
+                    if retry_after is not None and retry_after > max_delay:
+                        raise RetriesExhausted(f"{name}: asked to retry after {retry_after:.0f}s: "
+                                               f"{type(e).__name__}: {e}", cause=e, attempts=attempt) from e
+                    time.sleep(backoff_delay(attempt, retry_after, base_delay=base_delay, max_delay=max_delay))
+                else:
+                    breaker.record_success()
+                    return result
+        return wrapper
+    return decorator
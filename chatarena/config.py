@@ -1,5 +1,7 @@
 import json
 import copy
+import uuid
+import hashlib
 from abc import abstractmethod
 
 from .utils import AttributedDict
@@ -39,6 +41,86 @@ class Config(AttributedDict):
         # make a deep copy of the config
         return config_class(copy.deepcopy(self))
 
+    def freeze(self) -> "FrozenConfig":
+        return FrozenConfig(self)
+
+
+def _freeze_value(value):
+    if isinstance(value, FrozenConfig):
+        return value  # already immutable, shared instead of copied
+    elif isinstance(value, dict):
+        return FrozenConfig(value)
+    elif isinstance(value, (list, tuple)):
+        return tuple(_freeze_value(item) for item in value)
+    return value
+
+
+class FrozenConfig(dict):
+    """
+    An immutable config, e.g., to identify a player or an environment when logging arenas.
+    The canonical JSON and the digest are computed on first use and cached, since the config cannot change.
+    Nested dicts are frozen as FrozenConfig and lists as tuples.
+    """
+    __slots__ = ("_json", "_digest")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__((key, _freeze_value(value)) for key, value in dict(*args, **kwargs).items())
+        object.__setattr__(self, "_json", None)
+        object.__setattr__(self, "_digest", None)
+
+    def _immutable(self, *args, **kwargs):
+        raise TypeError("FrozenConfig is immutable, use thaw() to get a mutable Config")
+
+    __setitem__ = __delitem__ = __setattr__ = __delattr__ = __ior__ = _immutable
+    update = pop = popitem = clear = setdefault = _immutable
+
+    def __getattr__(self, key):
+        if key in self:
+            return self[key]
+        raise AttributeError(key)
+
+    def __reduce__(self):
+        return self.__class__, (dict(self),)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __hash__(self):
+        return int(self.digest[:16], 16)
+
+    def to_json(self) -> str:
+        """
+        the canonical JSON of the config, i.e., with sorted keys and without whitespace
+        """
+        if self._json is None:
+            object.__setattr__(self, "_json", json.dumps(self, sort_keys=True, separators=(",", ":")))
+        return self._json
+
+    @property
+    def digest(self) -> str:
+        """
+        the SHA-1 hex digest of the canonical JSON, stable across processes unlike hash()
+        """
+        if self._digest is None:
+            object.__setattr__(self, "_digest", hashlib.sha1(self.to_json().encode("utf-8")).hexdigest())
+        return self._digest
+
+    def config_id(self, namespace: uuid.UUID) -> uuid.UUID:
+        """
+        a uuid5 of the config in the namespace, e.g., the id of a player in an arena
+        """
+        return uuid.uuid5(namespace, self.digest)
+
+    def without(self, *keys) -> "FrozenConfig":
+        return FrozenConfig((key, value) for key, value in self.items() if key not in keys)
+
+    def thaw(self) -> Config:
+        # a mutable deep copy, e.g., to be modified and saved
+        return init_config(json.loads(self.to_json()))
+
 
 class Configurable:
     """
@@ -47,15 +129,31 @@ class Configurable:
 
     def __init__(self, **kwargs):
         self._config_dict = kwargs
+        self._frozen_config = None
 
     @classmethod
     def from_config(cls, config: Config):
+        if isinstance(config, FrozenConfig):
+            config = config.thaw()
         return cls(**config)
 
+    def reconfigure(self, **kwargs):
+        # Update the registered arguments in place, e.g., to reuse the object for another game
+        self._config_dict.update(kwargs)
+        self._frozen_config = None  # invalidate the cached frozen config
+
     def to_config(self) -> Config:
         # Convert the _config_dict to Config
         return Config(**self._config_dict)
 
+    def freeze(self) -> FrozenConfig:
+        """
+        get the config as a FrozenConfig, cached until the object is reconfigured
+        """
+        if getattr(self, "_frozen_config", None) is None:
+            self._frozen_config = self.to_config().freeze()
+        return self._frozen_config
+
     def save_config(self, path: str):
         self.to_config().save(path)
 
@@ -1,12 +1,20 @@
 """
 Datastore module for chat_arena.
 This module provides utilities for storing the messages and the game results into database.
-Currently, it supports Supabase.
+Currently, it supports Supabase, a local SQLite database and columnar Parquet files.
 """
 import json
 import os
-from typing import List
+import re
+from abc import ABC, abstractmethod
+from typing import Dict, List, Iterator
 import uuid
+import sqlite3
+import time
+import queue
+import atexit
+import logging
+import threading
 
 from .arena import Arena
 from .message import Message
@@ -24,15 +32,217 @@ except:
 else:
     supabase_available = True
 
+# Attempt importing pyarrow for the Parquet sink
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow_available = False
+else:
+    pyarrow_available = True
 
-# Store the messages into the Supabase database
-class SupabaseDB:
-    def __init__(self):
-        assert supabase_available and SUPABASE_URL and SUPABASE_SECRET_KEY
-        supabase_client = supabase.create_client(SUPABASE_URL, SUPABASE_SECRET_KEY)
-        self.client = supabase_client
 
-    # Save Arena state to Supabase
+# The columns of each table with their types, in the order of the foreign keys,
+# i.e., rows of a batch are inserted in this order
+TABLE_SCHEMAS = {
+    "Arena": {"arena_id": "str", "global_prompt": "str", "env_type": "str", "env_config": "str"},
+    "Moderator": {"moderator_id": "str", "arena_id": "str", "role_desc": "str", "terminal_condition": "str",
+                  "backend_type": "str", "temperature": "float", "max_tokens": "int"},
+    "Player": {"player_id": "str", "arena_id": "str", "name": "str", "role_desc": "str", "backend_type": "str",
+               "temperature": "float", "max_tokens": "int"},
+    "Message": {"message_id": "str", "arena_id": "str", "agent_name": "str", "content": "str", "turn": "int",
+                "timestamp": "str", "msg_type": "str", "visible_to": "str"},
+}
+TABLE_ORDER = tuple(TABLE_SCHEMAS)
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL = 1.0  # seconds
+DEFAULT_MAX_QUEUE_SIZE = 10000
+
+_FLUSH = ("flush", None)  # the queue item that asks the writer to insert its buffered rows now
+
+
+class LocalSupabaseClient:
+    """
+    A local stand-in for the Supabase client that keeps the inserted rows in memory,
+    supporting the client.table(name).insert(rows).execute() calls used by SupabaseDB.
+    """
+
+    def __init__(self, latency: float = 0.):
+        self.latency = latency  # simulated round-trip time of each request
+        self.rows: Dict[str, List[dict]] = {}
+        self.num_requests = 0
+        self._lock = threading.Lock()
+
+    def table(self, name: str):
+        return _LocalQuery(self, name)
+
+    def _insert(self, name: str, rows: List[dict]):
+        if self.latency > 0:
+            time.sleep(self.latency)
+        with self._lock:
+            self.rows.setdefault(name, []).extend(rows)
+            self.num_requests += 1
+
+
+class _LocalQuery:
+    def __init__(self, client: LocalSupabaseClient, name: str):
+        self.client = client
+        self.name = name
+        self.rows = []
+
+    def insert(self, rows):
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def execute(self):
+        self.client._insert(self.name, self.rows)
+        return self
+
+
+class BatchWriter:
+    """
+    Insert the rows in a background thread, so that the arena never waits on the database.
+    The rows of many arenas are buffered and inserted with one request per table,
+    when the buffer reaches batch_size rows or every flush_interval seconds.
+    The queue is bounded by max_queue_size, so put() blocks only if the database falls far behind.
+    """
+
+    def __init__(self, insert_fn, batch_size: int = DEFAULT_BATCH_SIZE, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                 max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE):
+        self.insert_fn = insert_fn  # insert_fn(table, rows) inserts a batch of rows into a table
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.failed_rows = 0
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._depth = 0  # the rows queued or buffered but not inserted yet
+        self._depth_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="chatarena-db-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._depth
+
+    def put(self, table: str, rows: List[dict], block: bool = True):
+        if not rows:
+            return
+        assert not self._closed, "The writer is closed"
+        # counted before the put, so that the writer thread never decrements the rows before they are counted
+        with self._depth_lock:
+            self._depth += len(rows)
+        try:
+            self._queue.put((table, rows), block=block)
+        except queue.Full:  # if not block and the queue is full
+            with self._depth_lock:
+                self._depth -= len(rows)
+            raise
+
+    def flush(self):
+        """insert the buffered rows now and wait until all the rows put so far are inserted"""
+        if self._closed:
+            return  # all the rows were inserted on close
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        buffer: Dict[str, List[dict]] = {}
+        num_buffered = 0
+        num_items = 0  # the queue items in the buffer, marked done once inserted
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0., deadline - time.monotonic()))
+            except queue.Empty:
+                item = ()  # time to flush
+
+            if item:
+                num_items += 1
+                if item is not _FLUSH:
+                    table, rows = item
+                    buffer.setdefault(table, []).extend(rows)
+                    num_buffered += len(rows)
+            # flush when the buffer is full, the interval elapses, or on request
+            if num_buffered >= self.batch_size or time.monotonic() >= deadline or item is None or item is _FLUSH:
+                self._insert(buffer)
+                with self._depth_lock:
+                    self._depth -= num_buffered
+                for _ in range(num_items):
+                    self._queue.task_done()
+                buffer, num_buffered, num_items = {}, 0, 0
+                deadline = time.monotonic() + self.flush_interval
+            if item is None:
+                self._queue.task_done()
+                return
+
+    def _insert(self, buffer: Dict[str, List[dict]]):
+        tables = sorted(buffer, key=lambda t: TABLE_ORDER.index(t) if t in TABLE_ORDER else len(TABLE_ORDER))
+        for table in tables:
+            rows = buffer[table]
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size]
+                try:
+                    self.insert_fn(table, batch)
+                except Exception:
+                    self.failed_rows += len(batch)
+                    logging.exception(f"Failed to insert {len(batch)} rows into {table}")
+
+
+class Datastore(ABC):
+    """
+    Base class of the datastores of the arena logs.
+    The rows of the Arena, Moderator, Player and Message tables are built here, and the subclasses
+    only insert batches of rows into a table in _insert_batch, optionally in a background BatchWriter.
+    """
+
+    def __init__(self, async_writes: bool = True, batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL, max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE):
+        """
+        args:
+            async_writes: whether to insert the rows in batches in a background thread
+            batch_size: the max number of rows per insert
+            flush_interval: the max time (in seconds) the rows are buffered
+            max_queue_size: the max number of queued inserts before save_arena blocks
+        """
+        self.writer = BatchWriter(self._insert_batch, batch_size, flush_interval, max_queue_size) \
+            if async_writes else None
+
+    @abstractmethod
+    def _insert_batch(self, table: str, rows: List[dict]):
+        """insert a batch of rows into a table"""
+
+    @property
+    def queue_depth(self) -> int:
+        """the number of rows waiting to be inserted"""
+        return self.writer.queue_depth if self.writer is not None else 0
+
+    def insert_rows(self, table: str, rows):
+        rows = rows if isinstance(rows, list) else [rows]
+        if self.writer is not None:
+            self.writer.put(table, rows)
+        elif rows:
+            self._insert_batch(table, rows)
+
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    # Save Arena state to the datastore
     def save_arena(self, arena: Arena):
         # Save the environment config
         self._save_environment(arena)
@@ -46,21 +256,22 @@ class SupabaseDB:
     # Save the environment config of the arena
     def _save_environment(self, arena: Arena):
         env = arena.environment
-        env_config = env.to_config()
-        moderator_config = env_config.pop("moderator", None)
+        # the frozen configs are cached, so their JSON and ids are computed once per configuration
+        env_config = env.freeze()
+        moderator_config = env_config.get("moderator", None)
 
         arena_row = {
             "arena_id": str(arena.uuid),
             "global_prompt": arena.global_prompt,
             "env_type": env_config["env_type"],
-            "env_config": json.dumps(env_config),
+            "env_config": env_config.without("moderator").to_json(),
         }
-        self.client.table("Arena").insert(arena_row).execute()
+        self.insert_rows("Arena", arena_row)
 
         # Get the moderator config
         if moderator_config:
             moderator_row = {
-                "moderator_id": str(uuid.uuid5(arena.uuid, json.dumps(moderator_config))),
+                "moderator_id": str(moderator_config.config_id(arena.uuid)),
                 "arena_id": str(arena.uuid),
                 "role_desc": moderator_config["role_desc"],
                 "terminal_condition": moderator_config["terminal_condition"],
@@ -68,15 +279,15 @@ class SupabaseDB:
                 "temperature": moderator_config["backend"]["temperature"],
                 "max_tokens": moderator_config["backend"]["max_tokens"],
             }
-            self.client.table("Moderator").insert(moderator_row).execute()
+            self.insert_rows("Moderator", moderator_row)
 
     # Save the player configs of the arena
     def _save_player_configs(self, arena: Arena):
         player_rows = []
         for player in arena.players:
-            player_config = player.to_config()
+            player_config = player.freeze()
             player_row = {
-                "player_id": str(uuid.uuid5(arena.uuid, json.dumps(player_config))),
+                "player_id": str(player_config.config_id(arena.uuid)),
                 "arena_id": str(arena.uuid),
                 "name": player.name,
                 "role_desc": player_config["role_desc"],
@@ -86,7 +297,7 @@ class SupabaseDB:
             }
             player_rows.append(player_row)
 
-        self.client.table("Player").insert(player_rows).execute()
+        self.insert_rows("Player", player_rows)
 
     # Save the messages
     def save_messages(self, arena: Arena, messages: List[Message] = None):
@@ -110,14 +321,199 @@ class SupabaseDB:
             }
             message_rows.append(message_row)
 
-        self.client.table("Message").insert(message_rows).execute()
+        self.insert_rows("Message", message_rows)
 
         # Mark the messages as logged
         for message in messages:
             message.logged = True
 
 
-# Log the arena results into the Supabase database
+# Store the messages into the Supabase database
+class SupabaseDB(Datastore):
+    def __init__(self, client=None, **kwargs):
+        """
+        args:
+            client: the Supabase client, e.g., a LocalSupabaseClient for tests; created from the environment variables if None
+            kwargs: the batching options of Datastore
+        """
+        if client is None:
+            assert supabase_available and SUPABASE_URL and SUPABASE_SECRET_KEY
+            client = supabase.create_client(SUPABASE_URL, SUPABASE_SECRET_KEY)
+        self.client = client
+        super().__init__(**kwargs)
+
+    def _insert_batch(self, table: str, rows: List[dict]):
+        self.client.table(table).insert(rows).execute()
+
+
+_SQLITE_TYPES = {"str": "TEXT", "float": "REAL", "int": "INTEGER"}
+
+
+# Store the messages into a local SQLite database
+class SQLiteDB(Datastore):
+    def __init__(self, path: str = "chatarena.db", **kwargs):
+        """
+        args:
+            path: the SQLite database file, created if it does not exist
+            kwargs: the batching options of Datastore
+        """
+        self.path = path
+        # the connection is shared by the writer thread and the readers, serialized by the lock
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            # write-ahead logging lets the readers run concurrently with the writer
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            for table, schema in TABLE_SCHEMAS.items():
+                columns = [f"{col} {_SQLITE_TYPES[col_type]}" for col, col_type in schema.items()]
+                columns[0] += " PRIMARY KEY"
+                self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({", ".join(columns)})')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS message_arena ON "Message" (arena_id, turn)')
+        super().__init__(**kwargs)
+
+    def _insert_batch(self, table: str, rows: List[dict]):
+        columns = list(TABLE_SCHEMAS[table])
+        sql = f'INSERT OR IGNORE INTO "{table}" ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+        with self._lock, self._conn:  # one transaction per batch
+            self._conn.executemany(sql, [tuple(row.get(col) for col in columns) for row in rows])
+
+    def iter_rows(self, table: str, columns: List[str] = None, arena_id: str = None,
+                  batch_size: int = 10000) -> Iterator[tuple]:
+        """iterate over the rows (as tuples of the columns) of a table, optionally of an arena"""
+        assert table in TABLE_SCHEMAS, f"Unknown table: {table}"
+        columns = columns or list(TABLE_SCHEMAS[table])
+        assert all(col in TABLE_SCHEMAS[table] for col in columns), f"Unknown columns: {columns}"
+        sql = f'SELECT {", ".join(columns)} FROM "{table}"'
+        params = ()
+        if arena_id is not None:
+            sql += " WHERE arena_id = ?"
+            params = (arena_id,)
+        if table == "Message":
+            sql += " ORDER BY arena_id, turn" if arena_id is None else " ORDER BY turn"
+        # read with a separate connection, so that the writer is not blocked
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                yield from batch
+        finally:
+            conn.close()
+
+    def read_columns(self, table: str, columns: List[str] = None, arena_id: str = None) -> Dict[str, list]:
+        """read the columns of a table in bulk, returning a dict of column -> values"""
+        columns = columns or list(TABLE_SCHEMAS[table])
+        rows = list(self.iter_rows(table, columns, arena_id=arena_id))
+        return {col: [row[idx] for row in rows] for idx, col in enumerate(columns)}
+
+    def read_messages(self, arena_id: str = None) -> List[dict]:
+        """read the messages, optionally of an arena, ordered by turn"""
+        columns = list(TABLE_SCHEMAS["Message"])
+        return [dict(zip(columns, row)) for row in self.iter_rows("Message", columns, arena_id=arena_id)]
+
+    def close(self):
+        super().close()
+        with self._lock:
+            self._conn.close()
+
+
+_ARROW_TYPES = {"str": "string", "float": "float64", "int": "int64"}
+_PART_PATTERN = re.compile(r"part-\d+\.parquet")
+_PART_NUMBER_PATTERN = re.compile(r"^\.?part-(\d+)\.parquet")
+
+
+# Store the messages into columnar Parquet files for analytics
+class ParquetSink(Datastore):
+    """
+    Each table is a directory of Parquet part files, <output_dir>/<table>/part-<n>.parquet.
+    A Parquet file is only readable once closed, so a part is written to a hidden temporary file and renamed when
+    closed, on flush() or close(). Reopening the sink appends new parts and never overwrites the existing ones.
+    """
+
+    def __init__(self, output_dir: str, compression: str = "zstd", **kwargs):
+        """
+        args:
+            output_dir: the directory of the Parquet files, one subdirectory per table
+            compression: the compression codec of the Parquet files
+            kwargs: the batching options of Datastore, each batch is written as a row group
+        """
+        assert pyarrow_available, "pyarrow is not installed"
+        os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        self.compression = compression
+        self.schemas = {
+            table: pa.schema([(col, getattr(pa, _ARROW_TYPES[col_type])()) for col, col_type in schema.items()])
+            for table, schema in TABLE_SCHEMAS.items()
+        }
+        self._writers = {}  # table -> (ParquetWriter, file, temporary path, final path)
+        self._lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def table_dir(output_dir: str, table: str) -> str:
+        return os.path.join(output_dir, table)
+
+    @staticmethod
+    def part_paths(output_dir: str, table: str) -> List[str]:
+        """the paths of the closed parts of a table, in the order they were written"""
+        table_dir = ParquetSink.table_dir(output_dir, table)
+        if not os.path.isdir(table_dir):
+            return []
+        parts = [name for name in os.listdir(table_dir) if _PART_PATTERN.fullmatch(name)]
+        return [os.path.join(table_dir, name)
+                for name in sorted(parts, key=lambda name: int(_PART_NUMBER_PATTERN.match(name).group(1)))]
+
+    def _open_part(self, table: str):
+        table_dir = self.table_dir(self.output_dir, table)
+        os.makedirs(table_dir, exist_ok=True)
+        # the next part number after the closed and in-progress parts, created exclusively so that
+        # another sink appending to the same directory fails loudly instead of overwriting the part
+        numbers = [int(match.group(1)) for match in map(_PART_NUMBER_PATTERN.search, os.listdir(table_dir)) if match]
+        number = max(numbers, default=-1) + 1
+        path = os.path.join(table_dir, f"part-{number:05d}.parquet")
+        tmp_path = os.path.join(table_dir, f".part-{number:05d}.parquet.tmp")
+        sink = open(tmp_path, "xb")
+        writer = pq.ParquetWriter(sink, self.schemas[table], compression=self.compression)
+        return writer, sink, tmp_path, path
+
+    def _insert_batch(self, table: str, rows: List[dict]):
+        batch = pa.Table.from_pylist(rows, schema=self.schemas[table])
+        with self._lock:
+            if table not in self._writers:
+                self._writers[table] = self._open_part(table)
+            self._writers[table][0].write_table(batch)
+
+    def _close_parts(self):
+        with self._lock:
+            for writer, sink, tmp_path, path in self._writers.values():
+                writer.close()
+                sink.close()
+                os.replace(tmp_path, path)
+            self._writers = {}
+
+    def flush(self):
+        """write the rows put so far and close the current parts, so that they are readable"""
+        super().flush()
+        self._close_parts()
+
+    def close(self):
+        super().close()
+        self._close_parts()
+
+    @staticmethod
+    def read_table(output_dir: str, table: str, columns: List[str] = None):
+        """read a table (or some of its columns) from its closed parts as a pyarrow Table"""
+        assert pyarrow_available, "pyarrow is not installed"
+        parts = ParquetSink.part_paths(output_dir, table)
+        if not parts:
+            raise FileNotFoundError(f"No Parquet part of {table} in {output_dir}")
+        return pa.concat_tables([pq.read_table(part, columns=columns) for part in parts])
+
+
+# Log the arena results into the database
 def log_arena(arena: Arena, database=None):
     if database is None:
         pass
@@ -125,7 +521,7 @@ def log_arena(arena: Arena, database=None):
         database.save_arena(arena)
 
 
-# Log the messages into the Supabase database
+# Log the messages into the database
 def log_messages(arena: Arena, messages: List[Message], database=None):
     if database is None:
         pass
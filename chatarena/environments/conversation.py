@@ -3,7 +3,7 @@ from typing import List, Union
 from .base import TimeStep, Environment
 from ..message import Message, MessagePool
 from ..agent import Moderator, SIGNAL_END_OF_CONVERSATION
-from ..config import EnvironmentConfig, AgentConfig
+from ..config import EnvironmentConfig, AgentConfig, FrozenConfig
 
 
 class Conversation(Environment):
@@ -34,6 +34,19 @@ class Conversation(Environment):
                                  terminal=False)
         return init_timestep
 
+    def reconfigure(self, **kwargs) -> TimeStep:
+        """
+        reuse the environment for another conversation, e.g., between players with other names
+        """
+        for key in ("player_names", "parallel"):
+            if key in kwargs:
+                setattr(self, key, kwargs[key])
+        super().reconfigure(**kwargs)
+
+        # The messages of the new conversation are kept under a new conversation_id
+        self.message_pool.reset(new_conversation=True)
+        return self.reset()
+
     def to_config(self) -> EnvironmentConfig:
         return EnvironmentConfig(env_type=self.type_name, player_names=self.player_names, parallel=self.parallel)
 
@@ -108,12 +121,39 @@ class ModeratedConversation(Conversation):
         self.moderator_visibility = moderator_visibility
         self.moderator_period = moderator_period
 
+    def reset(self):
+        # Forget the backend error of the previous conversation
+        self.moderator.reset()
+        return super().reset()
+
+    def reconfigure(self, moderator: dict = None, **kwargs) -> TimeStep:
+        """
+        reuse the environment for another conversation
+        Args:
+            moderator: the arguments to swap in the moderator, e.g., its role_desc and terminal_condition
+        """
+        if moderator is not None:
+            self.moderator.reconfigure(**moderator)
+        for key in ("moderator_visibility", "moderator_period"):
+            if key in kwargs:
+                setattr(self, key, kwargs[key])
+        return super().reconfigure(**kwargs)
+
     def to_config(self) -> EnvironmentConfig:
         # This environment contains some speical config arguments that needs to be handle specially
         return EnvironmentConfig(env_type=self.type_name, player_names=self.player_names, parallel=self.parallel,
                                  moderator=self.moderator.to_config(), moderator_visibility=self.moderator_visibility,
                                  moderator_period=self.moderator_period)
 
+    def freeze(self) -> FrozenConfig:
+        # The cached config is stale once the moderator is reconfigured
+        moderator = self.moderator.freeze()
+        if self._frozen_config is None or self._frozen_config["moderator"] is not moderator:
+            config = self.to_config()
+            config["moderator"] = moderator
+            self._frozen_config = FrozenConfig(config)
+        return self._frozen_config
+
     def step(self, player_name: str, action: str) -> TimeStep:
         """
         step function that is called by the arena
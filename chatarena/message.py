@@ -1,5 +1,6 @@
 from typing import List, Union
 from dataclasses import dataclass
+from functools import cached_property
 import time
 from uuid import uuid1
 import hashlib
@@ -24,9 +25,9 @@ class Message:
     msg_type: str = "text"
     logged: bool = False  # Whether the message is logged in the database
 
-    @property
+    @cached_property
     def msg_hash(self):
-        # Generate a unique message id given the content, timestamp and role
+        # Generate a unique message id given the content, timestamp and role, computed once per message
         return _hash(
             f"agent: {self.agent_name}\ncontent: {self.content}\ntimestamp: {str(self.timestamp)}\nturn: {self.turn}\nmsg_type: {self.msg_type}")
 
@@ -48,8 +49,11 @@ class MessagePool():
         self._messages: List[Message] = []  # TODO: for the sake of thread safety, use a queue instead
         self._last_message_idx = 0
 
-    def reset(self):
+    def reset(self, new_conversation: bool = False):
         self._messages = []
+        if new_conversation:
+            # The pool is reused for another conversation
+            self.conversation_id = str(uuid1())
 
     def append_message(self, message: Message):
         self._messages.append(message)
@@ -0,0 +1,150 @@
+"""
+Metrics module for chat_arena.
+This module records the wall time, retries, token usage, cost and errors of the backend calls,
+aggregated per (agent role, model).
+"""
+from typing import Dict, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+import re
+import threading
+
+# Try to import tiktoken for exact token counts
+try:
+    import tiktoken
+except ImportError:
+    is_tiktoken_available = False
+else:
+    is_tiktoken_available = True
+
+# USD per 1K (prompt, completion) tokens, used to estimate the cost of a run
+PRICE_PER_1K_TOKENS = {
+    "gpt-3.5-turbo": (0.0015, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+}
+
+# The backend call in progress on the current thread, see IntelligenceBackend.track_call
+_current_call = threading.local()
+
+
+@dataclass
+class CallStats:
+    attempts: int = 0
+    wall_time: float = 0.
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    error: str = None
+
+
+def current_call() -> CallStats:
+    """
+    get the stats of the backend call in progress on the current thread, None if the call is not tracked
+    """
+    return getattr(_current_call, "stats", None)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    prompt_price, completion_price = PRICE_PER_1K_TOKENS.get(model, (0., 0.))
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
+    """
+    count the tokens of a text with the tokenizer of the model if tiktoken is installed,
+    otherwise estimate it as the number of words and punctuation marks
+    """
+    if is_tiktoken_available:
+        return len(_get_encoding(model).encode(text))
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+
+class MetricsRecorder:
+    """
+    Thread-safe aggregation of the backend calls per (agent role, model).
+    """
+
+    FIELDS = ("calls", "retries", "errors", "wall_time", "prompt_tokens", "completion_tokens")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+    def _entry(self, role: str, model: str) -> Dict[str, float]:
+        key = (role, model)
+        if key not in self._stats:
+            self._stats[key] = {field: 0 for field in self.FIELDS}
+        return self._stats[key]
+
+    def record(self, role: str, model: str, call: CallStats):
+        with self._lock:
+            entry = self._entry(role, model)
+            entry["calls"] += 1
+            entry["retries"] += max(0, call.attempts - 1)
+            entry["errors"] += int(call.error is not None)
+            entry["wall_time"] += call.wall_time
+            entry["prompt_tokens"] += call.prompt_tokens
+            entry["completion_tokens"] += call.completion_tokens
+
+    def merge(self, other: "MetricsRecorder"):
+        if other is self:
+            return
+        # One lock at a time, so that concurrent a.merge(b) and b.merge(a) cannot deadlock
+        with other._lock:
+            other_stats = {key: dict(entry) for key, entry in other._stats.items()}
+        with self._lock:
+            for (role, model), other_entry in other_stats.items():
+                entry = self._entry(role, model)
+                for field in self.FIELDS:
+                    entry[field] += other_entry[field]
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """
+        convert the metrics to a JSON-serializable dict keyed by "role/model"
+        """
+        with self._lock:
+            metrics = {}
+            for (role, model), entry in self._stats.items():
+                metrics[f"{role}/{model}"] = dict(
+                    entry, wall_time=round(entry["wall_time"], 4),
+                    cost=round(estimate_cost(model, entry["prompt_tokens"], entry["completion_tokens"]), 6))
+            return metrics
+
+    def to_prometheus(self, prefix: str = "chatarena_backend") -> str:
+        """
+        convert the metrics to the Prometheus text exposition format
+        """
+        with self._lock:
+            stats = {key: dict(entry) for key, entry in self._stats.items()}
+        for (_, model), entry in stats.items():
+            entry["wall_time"] = round(entry["wall_time"], 4)
+            entry["cost"] = round(estimate_cost(model, entry["prompt_tokens"], entry["completion_tokens"]), 6)
+
+        lines = []
+        for field in self.FIELDS + ("cost",):
+            metric_type = "gauge" if field == "cost" else "counter"
+            lines.append(f"# TYPE {prefix}_{field} {metric_type}")
+            for (role, model), entry in stats.items():
+                lines.append(f'{prefix}_{field}{{role="{_escape_label(role)}",model="{_escape_label(model)}"}} '
+                             f'{entry[field]}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value) -> str:
+    """
+    escape a label value of the Prometheus text format
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
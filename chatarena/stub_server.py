@@ -0,0 +1,193 @@
+"""
+A local stub server speaking the OpenAI chat-completions protocol.
+It is meant for load tests of the curation pipeline without calling (and paying for) a real model:
+
+    python -m chatarena.stub_server --port 8000 --latency 0.5
+    python dialog_simulation.py --api_base http://127.0.0.1:8000/v1 ...
+"""
+import argparse
+import json
+import random
+import re
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "That sounds interesting, could you tell me more about it?"
+TERMINAL_QUESTION = "Answer yes or no"
+
+
+def count_tokens(text: str) -> int:
+    # A rough whitespace-based estimation, which is enough for a stub
+    return len(text.split())
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Handle POST /v1/chat/completions with a canned reply after a tunable latency.
+    With "stream": true, the reply is sent word by word as server-sent events.
+    """
+    protocol_version = "HTTP/1.1"  # keep-alive connections, as the real API
+    disable_nagle_algorithm = True  # do not delay the small responses on kept-alive connections
+    server_version = "ChatArenaStub/0.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, code: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_event(self, body):
+        # One server-sent event in its own HTTP chunk
+        data = b"data: " + (body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")) + b"\n\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(self, request: dict, reply: str, usage: dict):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        chunk = {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+        }
+        try:
+            for idx, token in enumerate(re.findall(r"\s*\S+", reply)):
+                if idx > 0:
+                    time.sleep(self.server.token_latency)
+                self._send_event({**chunk, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]})
+            self._send_event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if request.get("stream_options", {}).get("include_usage"):
+                self._send_event({**chunk, "choices": [], "usage": usage})
+            self._send_event(b"[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g., it cut the response early
+            self.close_connection = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body", "type": "invalid_request_error"}})
+            return
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        messages = request.get("messages", [])
+        if not messages:
+            self._send_json(400, {"error": {"message": "messages is required", "type": "invalid_request_error"}})
+            return
+
+        if random.random() < self.server.error_rate:
+            # An injected failure of the provider, e.g., to test the retries and the circuit breaker
+            headers = {"Retry-After": str(self.server.retry_after)} if self.server.retry_after is not None else None
+            error_type = "rate_limit_error" if self.server.error_status == 429 else \
+                "invalid_request_error" if self.server.error_status < 500 else "server_error"
+            self._send_json(self.server.error_status,
+                            {"error": {"message": "Injected error of the stub server", "type": error_type}}, headers)
+            return
+
+        time.sleep(max(0., self.server.latency + random.uniform(-self.server.jitter, self.server.jitter)))
+
+        # The moderator is asked whether to end the conversation, always say no so that dialogs run to the max steps
+        if TERMINAL_QUESTION in messages[-1].get("content", ""):
+            reply = "No"
+        else:
+            reply = self.server.reply
+        prompt_tokens = sum(count_tokens(msg.get("content", "")) for msg in messages)
+        completion_tokens = count_tokens(reply)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+        if request.get("stream"):
+            self._send_stream(request, reply, usage)
+            return
+
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        })
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8000, latency: float = 0., jitter: float = 0.,
+                 reply: str = DEFAULT_REPLY, token_latency: float = 0., error_rate: float = 0.,
+                 error_status: int = 503, retry_after: float = None, verbose: bool = False):
+        super().__init__((host, port), StubHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.token_latency = token_latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.reply = reply
+        self.verbose = verbose
+
+    @property
+    def api_base(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.,
+                        help="The mean latency (in seconds) of each response.")
+    parser.add_argument("--jitter", type=float, default=0.,
+                        help="The maximum uniform deviation (in seconds) from the mean latency.")
+    parser.add_argument("--token_latency", type=float, default=0.,
+                        help="The latency (in seconds) between two streamed words.")
+    parser.add_argument("--reply", type=str, default=DEFAULT_REPLY,
+                        help="The canned reply of the players.")
+    parser.add_argument("--error_rate", type=float, default=0.,
+                        help="The fraction of requests answered with an error.")
+    parser.add_argument("--error_status", type=int, default=503,
+                        help="The HTTP status of the injected errors, e.g., 429, 500, 503 or 400.")
+    parser.add_argument("--retry_after", type=float, default=None,
+                        help="The Retry-After header (in seconds) of the injected errors.")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Whether to log every request.")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = StubServer(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                        reply=args.reply, token_latency=args.token_latency, error_rate=args.error_rate,
+                        error_status=args.error_status, retry_after=args.retry_after, verbose=args.verbose)
+    print(f"Serving the chat-completions stub at {server.api_base}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
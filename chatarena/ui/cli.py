@@ -38,9 +38,12 @@ class ArenaCLI:
     def __init__(self, arena: Arena):
         self.arena = arena
 
-    def launch(self, max_steps: int = None, interactive: bool = True, show_description: bool = True, show_message: bool = True):
+    def launch(self, max_steps: int = None, interactive: bool = True, show_description: bool = True, show_message: bool = True,
+               reset: bool = True):
         """
         Run the CLI
+        Args:
+            reset: whether to reset the arena first, which is not needed for an arena acquired from an ArenaPool
         """
         if not interactive and max_steps is None:
             max_steps = MAX_STEPS
@@ -48,7 +51,7 @@ class ArenaCLI:
         console = Console()
         # Print ascii art
         #console.print(ASCII_ART, style="bold dark_orange3")
-        timestep = self.arena.reset()
+        timestep = self.arena.reset() if reset else self.arena.current_timestep
         #console.print("🏟 Chat Arena Initialized!", style="bold green")
 
         env = self.arena.environment
@@ -74,77 +77,108 @@ class ArenaCLI:
         if show_message:
             console.print("\n========= Arena Start! ==========\n", style="bold green")
 
-        step = 0
-        while not timestep.terminal:
-            if interactive:
-                command = prompt([('class:command', "command (n/r/q/s/h) > ")],
-                                 style=Style.from_dict({'command': 'blue'}),
-                                 completer=WordCompleter(
-                                     ['next', 'n', 'reset', 'r', 'exit', 'quit', 'q', 'help', 'h', 'save', 's']))
-                command = command.strip()
-
-                if command == "help" or command == "h":
-                    console.print("Available commands:")
-                    console.print("    [bold]next or n or <Enter>[/]: next step")
-                    console.print("    [bold]exit or quit or q[/]: exit the game")
-                    console.print("    [bold]help or h[/]: print this message")
-                    console.print("    [bold]reset or r[/]: reset the game")
-                    console.print("    [bold]save or s[/]: save the history to file")
-                    continue
-                elif command == "exit" or command == "quit" or command == "q":
-                    break
-                elif command == "reset" or command == "r":
-                    timestep = self.arena.reset()
-                    console.print("\n========= Arena Reset! ==========\n", style="bold green")
-                    continue
-                elif command == "next" or command == "n" or command == "":
-                    pass
-                elif command == "save" or command == "s":
-                    # Prompt to get the file path
-                    file_path = prompt([('class:command', "save file path > ")],
-                                       style=Style.from_dict({'command': 'blue'}))
-                    file_path = file_path.strip()
-                    # Save the history to file
-                    self.arena.save_history(file_path)
-                    # Print the save success message
-                    console.print(f"History saved to {file_path}", style="bold green")
-                else:
-                    console.print(f"Invalid command: {command}", style="bold red")
-                    continue
-
-            try:
-                timestep = self.arena.step()
-            except HumanBackendError as e:
-                # Handle human input and recover with the game update
-                human_player_name = env.get_next_player()
+        # Print the responses of the streaming backends as they are generated
+        streaming_players = [player for player in players if getattr(player.backend, "stream", False)] \
+            if show_message else []
+        streamed_names = {player.name for player in streaming_players}
+        streaming = set()  # the agents whose response is being printed
+
+        def print_stream(agent_name, delta, done, retry=False):
+            if retry:
+                # the attempt failed midway, the response is printed again from the start if retried
+                if agent_name in streaming:
+                    streaming.discard(agent_name)
+                    console.print(Text(" [interrupted, retrying]", style="dim"))
+                    console.file.flush()
+                return
+            if agent_name not in streaming:
+                streaming.add(agent_name)
+                header = Text(f"[{agent_name}->all]: ")
+                header.stylize(f"bold {name_to_color[agent_name]}")
+                console.print(header, end="")
+            console.print(Text(delta), end="")
+            if done:
+                streaming.discard(agent_name)
+                console.print()
+            console.file.flush()
+
+        for player in streaming_players:
+            player.backend.add_listener(print_stream)
+        try:
+            step = 0
+            while not timestep.terminal:
                 if interactive:
-                    human_input = prompt(
-                        [('class:user_prompt', f"Type your input for {human_player_name}: ")],
-                        style=Style.from_dict({'user_prompt': 'ansicyan underline'})
-                    )
-                    # If not, the conversation does not stop
-                    timestep = env.step(human_player_name, human_input)
-                else:
-                    raise e  # cannot recover from this error in non-interactive mode
-            except TooManyInvalidActions as e:
-                # Print the error message
-                console.print(f"Too many invalid actions: {e}", style="bold red")
-                break
-
-            # The messages that are not yet logged
-            messages = [msg for msg in env.get_observation() if not msg.logged]
-            # Print the new messages
-            for msg in messages:
-                message_text = Text(f"[{msg.agent_name}->{msg.visible_to}]: {msg.content}")
-                message_text.stylize(f"bold {name_to_color[msg.agent_name]}", 0,
-                                     len(f"[{msg.agent_name}->{msg.visible_to}]:"))
-                if show_message:
-                    console.print(message_text)
-                msg.logged = True
-
-            step += 1
-            if max_steps is not None and step >= max_steps:
-                break
+                    command = prompt([('class:command', "command (n/r/q/s/h) > ")],
+                                     style=Style.from_dict({'command': 'blue'}),
+                                     completer=WordCompleter(
+                                         ['next', 'n', 'reset', 'r', 'exit', 'quit', 'q', 'help', 'h', 'save', 's']))
+                    command = command.strip()
+
+                    if command == "help" or command == "h":
+                        console.print("Available commands:")
+                        console.print("    [bold]next or n or <Enter>[/]: next step")
+                        console.print("    [bold]exit or quit or q[/]: exit the game")
+                        console.print("    [bold]help or h[/]: print this message")
+                        console.print("    [bold]reset or r[/]: reset the game")
+                        console.print("    [bold]save or s[/]: save the history to file")
+                        continue
+                    elif command == "exit" or command == "quit" or command == "q":
+                        break
+                    elif command == "reset" or command == "r":
+                        timestep = self.arena.reset()
+                        console.print("\n========= Arena Reset! ==========\n", style="bold green")
+                        continue
+                    elif command == "next" or command == "n" or command == "":
+                        pass
+                    elif command == "save" or command == "s":
+                        # Prompt to get the file path
+                        file_path = prompt([('class:command', "save file path > ")],
+                                           style=Style.from_dict({'command': 'blue'}))
+                        file_path = file_path.strip()
+                        # Save the history to file
+                        self.arena.save_history(file_path)
+                        # Print the save success message
+                        console.print(f"History saved to {file_path}", style="bold green")
+                    else:
+                        console.print(f"Invalid command: {command}", style="bold red")
+                        continue
+
+                try:
+                    timestep = self.arena.step()
+                except HumanBackendError as e:
+                    # Handle human input and recover with the game update
+                    human_player_name = env.get_next_player()
+                    if interactive:
+                        human_input = prompt(
+                            [('class:user_prompt', f"Type your input for {human_player_name}: ")],
+                            style=Style.from_dict({'user_prompt': 'ansicyan underline'})
+                        )
+                        # If not, the conversation does not stop
+                        timestep = env.step(human_player_name, human_input)
+                    else:
+                        raise e  # cannot recover from this error in non-interactive mode
+                except TooManyInvalidActions as e:
+                    # Print the error message
+                    console.print(f"Too many invalid actions: {e}", style="bold red")
+                    break
+
+                # The messages that are not yet logged
+                messages = [msg for msg in env.get_observation() if not msg.logged]
+                # Print the new messages
+                for msg in messages:
+                    message_text = Text(f"[{msg.agent_name}->{msg.visible_to}]: {msg.content}")
+                    message_text.stylize(f"bold {name_to_color[msg.agent_name]}", 0,
+                                         len(f"[{msg.agent_name}->{msg.visible_to}]:"))
+                    if show_message and msg.agent_name not in streamed_names:  # otherwise printed as streamed
+                        console.print(message_text)
+                    msg.logged = True
+
+                step += 1
+                if max_steps is not None and step >= max_steps:
+                    break
+        finally:
+            for player in streaming_players:
+                player.backend.remove_listener(print_stream)
 
         if show_message:
             console.print("\n========= Arena Ended! ==========\n", style="bold red")
@@ -6,6 +6,8 @@ import argparse
 from tqdm import tqdm
 from py2neo import Graph
 from data_utils import normalize_profile, sample_profile, sample_knowledge
+from instruction import get_domain
+from dataset_io import OUTPUT_FORMATS, SeedReader, open_sink
 
 
 def parse_args():
@@ -29,6 +31,13 @@ def parse_args():
         default=3,
         help="The number of instances to curate for each seed dialog.",
     )
+    parser.add_argument(
+        "--output_format",
+        type=str,
+        default="jsonl",
+        choices=list(OUTPUT_FORMATS),
+        help="The format of the cached data: jsonl, zstd-compressed jsonl or parquet.",
+    )
     parser.add_argument(
         "--random_seed",
         type=int,
@@ -99,38 +108,23 @@ def exe_query(graph: Graph, query: str):
     
     return triples
 
-def ground_knowledge(graph, data_fp_list, profile_fp, save_dir, num_instance_per_seed=3):
+def ground_knowledge(graph, data_fp_list, profile_fp, save_dir, num_instance_per_seed=3, output_format="jsonl"):
     """Ground seed dialogs with domain knowledge and comments."""
     
     profile_slots = json.load(open(profile_fp, "r", encoding='utf-8'))
     print(f"Loaded user profiles with {len(profile_slots)} slot keys.")
 
     for data_fp in data_fp_list:
-        seed_dialogs = []
-        with open(data_fp, "r", encoding='utf-8') as f:
-            for line in f:
-                seed_dialogs.append(json.loads(line))
-        print(f"Loaded {len(seed_dialogs)} seed dialogs from {data_fp}.")
-        
         save_fp = os.path.join(save_dir, "cache_{}".format(data_fp.split("/")[-1]))
-        with open(save_fp, "w", encoding='utf-8') as fw:
+        # the seed dialogs are decoded one at a time
+        with SeedReader(data_fp) as seed_dialogs, open_sink(save_fp, output_format) as sink:
+            print(f"Loaded {len(seed_dialogs)} seed dialogs from {data_fp}.")
             for seed_dialog in tqdm(seed_dialogs):
                 user_profile = seed_dialog["user_profile"]
                 knowledge = seed_dialog["knowledge_graph"]
                 target = seed_dialog["target"]
 
-                domain = ""
-                target_action = target[0].lower()
-                if "movie" in target_action:
-                    domain = "movie"
-                elif "music" in target_action:
-                    domain = "music"
-                elif "food" in target_action:
-                    domain = "food"
-                elif "poi" in target_action:
-                    domain = "poi"
-                else:
-                    raise ValueError("Invalid target action: {}".format(target_action))
+                domain = get_domain(target)
 
                 for idx in range(num_instance_per_seed):
                     if idx == 0:
@@ -197,10 +191,8 @@ def ground_knowledge(graph, data_fp_list, profile_fp, save_dir, num_instance_per
                         "seed_action_path": seed_dialog["action_path"],
                         "seed_topic_path": seed_dialog["topic_path"],
                     }
-                    line = json.dumps(new_dialog, ensure_ascii=False)
-                    fw.write(line + "\n")
-                    fw.flush()
-        print("Saved {} simulated dialogs to {}.".format(num_instance_per_seed * len(seed_dialogs), save_fp))       
+                    sink.write(new_dialog)
+        print("Saved {} simulated dialogs to {}.".format(num_instance_per_seed * len(seed_dialogs), sink.path))       
 
 
 if __name__ == "__main__":
@@ -232,4 +224,5 @@ if __name__ == "__main__":
     graph = Graph("http://localhost:7474", auth=("neo4j", "neo4j"))
     ground_knowledge(graph, data_fp_list=[train_fp, dev_fp, test_seen_fp, test_unseen_fp],
                      profile_fp=saved_profile_fp, save_dir=args.cache_dir, 
-                     num_instance_per_seed=args.num_instance_per_seed)
\ No newline at end of file
+                     num_instance_per_seed=args.num_instance_per_seed,
+                     output_format=args.output_format)
\ No newline at end of file
@@ -0,0 +1,496 @@
+# -*- coding: utf-8 -*-
+"""
+Output sinks and readers for the curated datasets, in JSONL, zstd-compressed JSONL or Parquet.
+"""
+import io
+import os
+import re
+import json
+import mmap
+import time
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from typing import Dict, Iterator
+
+# Attempt importing fcntl for appending from multiple processes (not available on Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Attempt importing zstandard for the compressed JSONL
+try:
+    import zstandard
+except ImportError:
+    zstandard_available = False
+else:
+    zstandard_available = True
+
+# Attempt importing pyarrow for the Parquet layout
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow_available = False
+else:
+    pyarrow_available = True
+
+OUTPUT_FORMATS = {"jsonl": ".jsonl", "jsonl.zst": ".jsonl.zst", "parquet": ".parquet"}
+
+
+class _Sink(ABC):
+    """
+    Base class of the output sinks, which writes the records (in the order of their indices if ordered)
+    to a partial file that is renamed to the path on close() if atomic.
+    The subclasses encode the records in _encode (outside of the lock) and buffer them in _add.
+    """
+
+    def __init__(self, path: str, atomic: bool = True, ordered: bool = False):
+        self.path = path
+        self.atomic = atomic
+        self.ordered = ordered
+        self.num_records = 0
+        self.write_path = "{}.partial".format(path) if atomic else path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._pending = {}  # index -> encoded record, the records waiting for their predecessors
+        self._next_index = 0
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # keep the partial file if failed, so that the completed records can be inspected or resumed
+        self.close(commit=exc_type is None)
+
+    def _encode(self, record: dict):
+        return record
+
+    @abstractmethod
+    def _add(self, encoded):
+        """buffer an encoded record, called under the lock"""
+
+    def _after_add(self):
+        """called after adding records, e.g., to flush a full buffer"""
+        pass
+
+    @abstractmethod
+    def _finish(self):
+        """write the remaining buffered records and close the file"""
+
+    def write(self, record: dict, index: int = None):
+        encoded = self._encode(record)
+        with self._lock:
+            assert not self._closed, "The sink is closed"
+            if self.ordered:
+                assert index is not None, "The index of the record is required in the ordered mode"
+                self._pending[index] = encoded
+                while self._next_index in self._pending:
+                    self._add(self._pending.pop(self._next_index))
+                    self._next_index += 1
+                    self.num_records += 1
+            else:
+                self._add(encoded)
+                self.num_records += 1
+            self._after_add()
+
+    def close(self, commit: bool = True):
+        """
+        write the remaining records, and rename the partial file to the path if atomic and commit
+        """
+        with self._lock:
+            if self._closed:
+                return
+            if self._pending:
+                # the records after a missing index are still written, in index order
+                for index in sorted(self._pending):
+                    self._add(self._pending[index])
+                    self.num_records += 1
+                self._pending = {}
+            self._finish()
+            self._closed = True
+            if self.atomic and commit:
+                os.replace(self.write_path, self.path)
+
+
+class JsonlSink(_Sink):
+    """
+    Write records as JSON lines with buffered writes and periodic fsync.
+        - The records are buffered and written once the buffer reaches buffer_size bytes, and the file is
+          fsynced at least every durability_window seconds (so at most that much output is lost on a crash).
+        - If atomic, the records are written to a partial file that is renamed to the path on close(),
+          so that a complete file never coexists with a truncated one.
+        - If append, the records are appended to the path; each buffer is written under an exclusive file lock,
+          so that the lines of multiple workers (threads or processes) never interleave.
+        - If ordered, write() takes the index of each record and the records are written in index order
+          (starting from 0), e.g., in the order of the seeds when the dialogs are generated concurrently.
+        - If compression is "zstd", each buffer is written as an independent zstd frame, so that the
+          appended frames of multiple workers still form a valid stream.
+    Usage:
+        with JsonlSink("dialogue_train.jsonl") as sink:
+            for record in records:
+                sink.write(record)
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1 << 20, durability_window: float = 5.0,
+                 atomic: bool = True, append: bool = False, ordered: bool = False, ensure_ascii: bool = False,
+                 compression: str = None, compression_level: int = 3):
+        """
+        args:
+            path: the output file
+            buffer_size: the max number of buffered bytes
+            durability_window: the max time (in seconds) between two fsyncs, 0 to fsync every write,
+                None to fsync only on close
+            atomic: whether to write to a partial file and rename it to the path on close
+            append: whether to append to the path, safe for multiple workers
+            ordered: whether to write the records in the order of their indices
+            ensure_ascii: passed to json.dumps
+            compression: None or "zstd"
+            compression_level: the zstd compression level
+        """
+        assert not (atomic and append), "An appended file cannot be renamed atomically"
+        assert compression in (None, "zstd"), "Invalid compression: {}".format(compression)
+        super().__init__(path, atomic=atomic, ordered=ordered)
+        self.buffer_size = buffer_size
+        self.durability_window = durability_window
+        self.append = append
+        self.ensure_ascii = ensure_ascii
+        self._compressor = None
+        if compression == "zstd":
+            assert zstandard_available, "zstandard is not installed"
+            self._compressor = zstandard.ZstdCompressor(level=compression_level)
+
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_APPEND if append else os.O_TRUNC)
+        self._fd = os.open(self.write_path, flags, 0o644)
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._last_sync = time.monotonic()
+
+    def _encode(self, record: dict):
+        return (json.dumps(record, ensure_ascii=self.ensure_ascii) + "\n").encode("utf-8")
+
+    def _add(self, line: bytes):
+        self._buffer.append(line)
+        self._buffered_bytes += len(line)
+
+    def _after_add(self):
+        if self._buffered_bytes >= self.buffer_size:
+            self._flush_buffer()
+        if self.durability_window is not None and time.monotonic() - self._last_sync >= self.durability_window:
+            self._sync()
+
+    def _flush_buffer(self):
+        if not self._buffer:
+            return
+        data = b"".join(self._buffer)
+        self._buffer, self._buffered_bytes = [], 0
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        data = memoryview(data)
+        if self.append and fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            while data:
+                written = os.write(self._fd, data)
+                data = data[written:]
+        finally:
+            if self.append and fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _sync(self):
+        self._flush_buffer()
+        os.fsync(self._fd)
+        self._last_sync = time.monotonic()
+
+    def flush(self):
+        """write the buffered records and fsync the file"""
+        with self._lock:
+            self._sync()
+
+    def _finish(self):
+        self._sync()
+        os.close(self._fd)
+
+
+# The knowledge triples are stored as a list of (subject, relation, object) structs,
+# each field dictionary-encoded since the same entities repeat across the dialogs
+_TRIPLE_FIELDS = ("subject", "relation", "object")
+
+# The fields of the curated records, i.e., the seed dialogs of data_preprocess and the dialogs of dialog_simulation,
+# and how they are stored in Parquet: "string" as a string column, "knowledge" as a list of triple structs,
+# and "json" as JSON strings. A record may omit fields, which are stored as nulls.
+DIALOG_FIELDS = {
+    "id": "string",
+    "original_goal": "json",
+    "user_profile": "json",
+    "user_personality": "json",
+    "knowledge": "knowledge",
+    "target": "json",
+    "conversation": "json",
+    "seed_conversation": "json",
+    "seed_action_path": "json",
+    "seed_topic_path": "json",
+}
+
+
+def _knowledge_type():
+    dict_string = pa.dictionary(pa.int32(), pa.string())
+    return pa.list_(pa.struct([(field, dict_string) for field in _TRIPLE_FIELDS]))
+
+
+class ParquetSink(_Sink):
+    """
+    Write records (dialogs) to a Parquet file, one row group per row_group_size records.
+    The schema is declared by fields (DIALOG_FIELDS by default), so that it does not depend on the records:
+    the knowledge triples are stored as a list of dictionary-encoded (subject, relation, object) structs, and the
+    other fields (e.g., user_profile, conversation) as JSON strings, which are dictionary-encoded by Parquet so that
+    the repeated profiles of the instances of a seed are stored once. The records are decoded back by iter_dialogs.
+    """
+
+    def __init__(self, path: str, row_group_size: int = 1000, compression: str = "zstd", atomic: bool = True,
+                 ordered: bool = False, fields: Dict[str, str] = None):
+        assert pyarrow_available, "pyarrow is not installed"
+        super().__init__(path, atomic=atomic, ordered=ordered)
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.fields = dict(DIALOG_FIELDS if fields is None else fields)
+        self.schema = self._build_schema(self.fields)
+        self._writer = None
+        self._rows = []
+
+    @staticmethod
+    def _build_schema(fields: Dict[str, str]):
+        columns = []
+        for key, kind in fields.items():
+            assert kind in ("string", "json", "knowledge"), "Invalid kind of {}: {}".format(key, kind)
+            columns.append((key, _knowledge_type() if kind == "knowledge" else pa.string()))
+        json_columns = [key for key, kind in fields.items() if kind == "json"]
+        return pa.schema(columns, metadata={"json_columns": json.dumps(json_columns)})
+
+    def _encode(self, record: dict):
+        row = {}
+        for key, value in record.items():
+            kind = self.fields.get(key)
+            if kind is None:
+                raise ValueError("The field {} is not declared in the Parquet schema of {}".format(key, self.path))
+            if kind == "knowledge":
+                row[key] = [dict(zip(_TRIPLE_FIELDS, triple)) for triple in value]
+            elif kind == "json":
+                row[key] = json.dumps(value, ensure_ascii=False)
+            else:
+                row[key] = value
+        return row
+
+    def _add(self, row: dict):
+        self._rows.append(row)
+
+    def _after_add(self):
+        if len(self._rows) >= self.row_group_size:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.write_path, self.schema, compression=self.compression)
+        if self._rows:
+            self._writer.write_table(pa.Table.from_pylist(self._rows, schema=self.schema))
+            self._rows = []
+
+    def _finish(self):
+        # an empty file still has the declared schema
+        self._write_row_group()
+        self._writer.close()
+
+
+def _decode_knowledge(column) -> list:
+    """decode a column of lists of triple structs back to lists of [subject, relation, object], column-wise"""
+    offsets = column.offsets.to_numpy()
+    offsets = offsets - offsets[0]
+    # decode the dictionary indices with a lookup into the (small) dictionaries
+    fields = []
+    for field in column.flatten().flatten():
+        dictionary = field.dictionary.to_pylist()
+        fields.append([dictionary[idx] for idx in field.indices.to_numpy(zero_copy_only=False).tolist()])
+    flat = [list(triple) for triple in zip(*fields)]
+    return [flat[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+# The bytes stripped by bytes.strip()
+_WHITESPACE = frozenset(b" \t\n\r\x0b\x0c")
+
+# The id of a record whose first key is "id", as written by data_preprocess and dialog_simulation
+_LEADING_ID = re.compile(rb'\{\s*"id"\s*:\s*("(?:[^"\\]|\\.)*"|-?\d+)\s*[,}]')
+
+
+class SeedReader:
+    """
+    Lazy reader of a JSONL seed file: the file is memory-mapped, the offsets of its lines are indexed once,
+    and a record is only decoded when accessed, so that memory stays small and the first record is available
+    immediately. Supports len(), indexing, slicing, get_by_id() and sharding, e.g.:
+
+        reader = SeedReader("cache_dialogue_train.jsonl")
+        for seed_dialog in reader.shard(num_shards=4, shard_id=0):
+            ...
+    """
+
+    def __init__(self, path: str, _parent: "SeedReader" = None, _lines: array = None):
+        self.path = path
+        # a view is closed with the reader it was taken from
+        self._owner = _parent is None
+        if _parent is not None:
+            # a view on the lines of a parent reader, sharing its memory map
+            self._file, self._mm = _parent._file, _parent._mm
+            self._starts, self._ends = _lines
+            self._ids = None
+            return
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else b""
+        self._starts, self._ends = array("q"), array("q")
+        self._build_index(size)
+        self._ids = None
+
+    def _build_index(self, size: int):
+        mm, start = self._mm, 0
+        while start < size:
+            end = mm.find(b"\n", start)
+            end = size if end < 0 else end
+            # skip blank lines, only copied out of the map if the line starts with a whitespace
+            if mm[start] not in _WHITESPACE or mm[start:end].strip():
+                self._starts.append(start)
+                self._ends.append(end)
+            start = end + 1
+
+    def __len__(self):
+        return len(self._starts)
+
+    def raw(self, idx: int) -> bytes:
+        """get the undecoded line of the idx-th record"""
+        return self._mm[self._starts[idx]:self._ends[idx]]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return SeedReader(self.path, _parent=self, _lines=(self._starts[idx], self._ends[idx]))
+        return json.loads(self.raw(idx))
+
+    def __iter__(self) -> Iterator[dict]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def shard(self, num_shards: int, shard_id: int) -> "SeedReader":
+        """the view on every num_shards-th record starting from shard_id"""
+        assert 0 <= shard_id < num_shards, "Invalid shard {} of {}".format(shard_id, num_shards)
+        return self[shard_id::num_shards]
+
+    def _record_id(self, idx: int) -> str:
+        line = self.raw(idx)
+        match = _LEADING_ID.match(line)
+        # fast path: take the leading id without decoding the record
+        record_id = json.loads(match.group(1)) if match else json.loads(line).get("id")
+        return str(record_id)
+
+    def index_of(self, record_id) -> int:
+        """get the index of the record with the id, e.g., to resume after it; the id index is built on first use"""
+        if self._ids is None:
+            self._ids = {}
+            for idx in range(len(self)):
+                self._ids.setdefault(self._record_id(idx), idx)
+        return self._ids[str(record_id)]
+
+    def get_by_id(self, record_id) -> dict:
+        return self[self.index_of(record_id)]
+
+    def close(self):
+        if not self._owner:
+            return
+        if isinstance(self._mm, mmap.mmap) and not self._mm.closed:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SeedList(list):
+    """The seeds decoded at once, closeable like a SeedReader."""
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_seeds(path: str):
+    """Read the seeds lazily, with random access for a JSONL file. Close the seeds once done, e.g., with `with`."""
+    if path.endswith(".jsonl"):
+        return SeedReader(path)
+    # the compressed and columnar formats have no line offsets, so they are decoded at once
+    return SeedList(iter_dialogs(path))
+
+
+def get_output_path(path: str, output_format: str = "jsonl"):
+    """Replace the extension of a .jsonl path with that of the output format."""
+    assert output_format in OUTPUT_FORMATS, "Invalid output format: {}".format(output_format)
+    if path.endswith(".jsonl"):
+        path = path[:-len(".jsonl")]
+    return path + OUTPUT_FORMATS[output_format]
+
+
+def open_sink(path: str, output_format: str = "jsonl", **kwargs):
+    """Open a sink of the output format, the path is given with the .jsonl extension."""
+    path = get_output_path(path, output_format)
+    if output_format == "parquet":
+        # the buffering and fsync options of the JSONL sink do not apply, a Parquet file is only readable once closed
+        kwargs = {k: v for k, v in kwargs.items() if k in ("row_group_size", "atomic", "ordered", "fields")}
+        return ParquetSink(path, **kwargs)
+    return JsonlSink(path, compression="zstd" if output_format == "jsonl.zst" else None, **kwargs)
+
+
+def iter_dialogs(path: str, batch_size: int = 1000) -> Iterator[dict]:
+    """Iterate over the dialogs of a JSONL, zstd-compressed JSONL or Parquet file lazily."""
+    if path.endswith(".parquet"):
+        assert pyarrow_available, "pyarrow is not installed"
+        parquet_file = pq.ParquetFile(path)
+        metadata = parquet_file.schema_arrow.metadata or {}
+        json_columns = set(json.loads(metadata.get(b"json_columns", b"[]")))
+        # read one row group at a time, nested columns cannot be read in batches across row groups
+        batches = (batch for idx in range(parquet_file.num_row_groups)
+                   for batch in parquet_file.read_row_group(idx).to_batches(max_chunksize=batch_size))
+        for batch in batches:
+            columns, valid = {}, {}
+            for name, column in zip(batch.schema.names, batch.columns):
+                if column.null_count == len(column):
+                    continue  # a field that none of the records has
+                if column.null_count > 0:
+                    valid[name] = column.is_valid().to_pylist()
+                if name == "knowledge":
+                    columns[name] = _decode_knowledge(column)
+                elif name in json_columns:
+                    columns[name] = [json.loads(value) if value is not None else None for value in column.to_pylist()]
+                else:
+                    columns[name] = column.to_pylist()
+            names = list(columns)
+            for idx, values in enumerate(zip(*columns.values())):
+                # the fields that the record omits are null
+                yield {name: value for name, value in zip(names, values) if name not in valid or valid[name][idx]}
+    elif path.endswith(".zst"):
+        assert zstandard_available, "zstandard is not installed"
+        with open(path, "rb") as fr:
+            reader = zstandard.ZstdDecompressor().stream_reader(fr, read_across_frames=True)
+            for line in io.TextIOWrapper(reader, encoding="utf-8"):
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-8") as fr:
+            for line in fr:
+                if line.strip():
+                    yield json.loads(line)
@@ -4,13 +4,17 @@ import json
 import os
 import random
 import argparse
+from contextlib import nullcontext
 from tqdm import tqdm
 from chatarena.agent import Player, Moderator
 from chatarena.backends import OpenAIChat
 from chatarena.environments.conversation import ModeratedConversation
-from chatarena.arena import Arena
+from chatarena.arena import Arena, ArenaPool, VectorArena
+from chatarena.metrics import MetricsRecorder
+from chatarena.backends.resilience import resilience_report
 from data_utils import find_word_in_string
-from instruction import create_instruct
+from instruction import create_instruct, knowledge_token_savings
+from dataset_io import OUTPUT_FORMATS, JsonlSink, open_sink, read_seeds
 
 
 def parse_args():
@@ -28,6 +32,16 @@ def parse_args():
                         help="The chat model to use.")
     parser.add_argument("--temperature", type=float, default=0.75, 
                         help="The temperature to use in sampling.")
+    parser.add_argument("--api_base", type=str, default=None,
+                        help="The base URL of an OpenAI-compatible API, e.g., a self-hosted model or the local stub server.")
+    parser.add_argument("--api_key_env", type=str, default=None,
+                        help="The environment variable holding the key of the API at --api_base, the OpenAI key is only sent to the official API.")
+    parser.add_argument("--pool_size", type=int, default=16,
+                        help="The max number of keep-alive connections to the API.")
+    parser.add_argument("--request_timeout", type=float, default=600,
+                        help="The timeout (in seconds) of each API request.")
+    parser.add_argument("--stream", type=str2bool, default="false",
+                        help="Whether to stream the responses of the system and the user, which are cut as soon as they end or start speaking for the other role.")
     parser.add_argument("--max_system_tokens", type=int, default=100, 
                         help="The max number of tokens to generate for the system.")
     parser.add_argument("--max_user_tokens", type=int, default=80,
@@ -38,6 +52,22 @@ def parse_args():
                         help="Whether to show the role description.")
     parser.add_argument("--show_message", type=str2bool, default="true", 
                         help="Whether to show the conversation messages.")
+    parser.add_argument("--save_metrics", type=str2bool, default="true",
+                        help="Whether to save the per-dialog latency, token and cost metrics next to the output file.")
+    parser.add_argument("--metrics_summary", type=str, default="none", choices=["none", "json", "prometheus"],
+                        help="The format of the metrics summary of the whole run.")
+    parser.add_argument("--knowledge_format", type=str, default="repr", choices=["repr", "compact"],
+                        help="The serialization of the knowledge in the assistant instruction, compact saves prompt tokens.")
+    parser.add_argument("--durability_window", type=float, default=5.0,
+                        help="The max time (in seconds) between two fsyncs of the output file.")
+    parser.add_argument("--output_format", type=str, default="jsonl", choices=list(OUTPUT_FORMATS),
+                        help="The format of the output file: jsonl, zstd-compressed jsonl or parquet.")
+    parser.add_argument("--num_shards", type=int, default=1,
+                        help="Split the seed dialogs into this number of shards, e.g., for parallel runs.")
+    parser.add_argument("--shard_id", type=int, default=0,
+                        help="The shard of the seed dialogs to simulate in this run.")
+    parser.add_argument("--num_parallel_dialogs", type=int, default=1,
+                        help="The number of dialogs simulated in lockstep when running headless.")
     parser.add_argument("--random_seed", type=int, default=42)
     return parser.parse_args()
 
@@ -116,22 +146,29 @@ def generate_dialog_data(
     max_interaction_step=10,
     model_name="gpt-3.5-turbo",
     temperature=0.75,
+    api_base=None,
+    api_key_env=None,
+    pool_size=16,
+    request_timeout=600,
+    stream=False,
     max_system_tokens=100,
     max_user_tokens=80,
     max_moderator_tokens=10,
     show_description=True,
     show_message=True,
+    save_metrics=True,
+    metrics_summary="none",
+    knowledge_format="repr",
+    durability_window=5.0,
+    output_format="jsonl",
+    num_shards=1,
+    shard_id=0,
+    num_parallel_dialogs=1,
 ):
     """Generate dialog data from a seed dialog file."""
     profile_slots = json.load(open(profile_path, "r", encoding='utf-8'))
     print(f"Loaded user profiles with {len(profile_slots)} slot keys.")
 
-    seed_dialogs = []
-    with open(seed_path, "r", encoding='utf-8') as f:
-        for line in f:
-            seed_dialogs.append(json.loads(line))
-    print(f"Loaded {len(seed_dialogs)} cached dialogs.")
-
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     if "test_seen" in seed_path:
@@ -143,76 +180,157 @@ def generate_dialog_data(
     else:
         output_path = os.path.join(output_dir, "dialogue_train.jsonl")
     
-    with open(output_path, "w", encoding='utf-8') as fw:
-        for seed_dialog in tqdm(seed_dialogs):
-            simulated_profile = seed_dialog["user_profile"]
-            sampled_knowledge = seed_dialog["knowledge"]
-            target = seed_dialog["target"]
-
-            conversation = seed_dialog["seed_conversation"]
-            seed_conv = sample_seed_conversation(seed_dialog["original_goal"], conversation)
-            
-            # randomly sample a personality
-            simulated_personality = sample_personality()
-            assistant_name = sample_assistant_role(profile_slots, simulated_profile)
-            
-            env_desc, user_dict, assistant_dict, moderator_dict = create_instruct(
-                target=target,
-                simulated_profile=simulated_profile,
-                simulated_personality=simulated_personality,
-                assistant_name=assistant_name,
-                domain_knowledge=sampled_knowledge,
-                seed_conversation=seed_conv
-            )
-            assistant = Player(
-                name=assistant_dict["name"], backend=OpenAIChat(model=model_name, temperature=temperature, max_tokens=max_system_tokens),
-                role_desc=assistant_dict["role_desc"], global_prompt=env_desc
-            )
-            user = Player(
-                name=user_dict["name"], backend=OpenAIChat(model=model_name, temperature=temperature, max_tokens=max_user_tokens),
-                role_desc=user_dict["role_desc"], global_prompt=env_desc
-            )
-            moderator = Moderator(
-                backend=OpenAIChat(model=model_name, temperature=temperature, max_tokens=max_moderator_tokens),
-                role_desc=moderator_dict["role_desc"], terminal_condition=moderator_dict["terminal_condition"]
-            )
-            # let assistant start the conversation
-            env = ModeratedConversation(player_names=[p.name for p in [assistant, user]], moderator=moderator, moderator_period="round")
-            arena = Arena(players=[assistant, user], environment=env, global_prompt=env_desc)
-            
-            arena.launch_cli(max_steps=max_interaction_step, show_description=show_description, show_message=show_message, interactive=False)
-
-            #print("Save? (y/n)")
-            #if input() == "n":
-            #    continue
-            
-            # save the simulated dialog to file
-            messages = env.get_observation()
-            simulated_convs = []
-            for msg in messages:
-                if msg.agent_name == assistant.name:
-                    utt = {"system": msg.content}
+    # all backends share the same pooled HTTP session
+    api_kwargs = {"api_base": api_base, "pool_size": pool_size, "request_timeout": request_timeout,
+                  "api_key": os.environ.get(api_key_env) if api_key_env else None}
+
+    def create_arena(global_prompt, players, environment):
+        # let assistant start the conversation
+        assistant_dict, user_dict = players
+        assistant = Player(
+            backend=OpenAIChat(model=model_name, temperature=temperature, max_tokens=max_system_tokens, stream=stream, **api_kwargs),
+            global_prompt=global_prompt, **assistant_dict
+        )
+        user = Player(
+            backend=OpenAIChat(model=model_name, temperature=temperature, max_tokens=max_user_tokens, stream=stream, **api_kwargs),
+            global_prompt=global_prompt, **user_dict
+        )
+        moderator = Moderator(
+            backend=OpenAIChat(model=model_name, temperature=temperature, max_tokens=max_moderator_tokens, **api_kwargs),
+            **environment["moderator"]
+        )
+        env = ModeratedConversation(player_names=[p.name for p in [assistant, user]], moderator=moderator, moderator_period="round")
+        return Arena(players=[assistant, user], environment=env, global_prompt=global_prompt)
+
+    arena_pool = ArenaPool(create_arena)
+
+    if num_shards > 1:
+        output_path = os.path.splitext(output_path)[0] + f"_shard{shard_id}.jsonl"
+    output_prefix = os.path.splitext(output_path)[0]
+    run_metrics = MetricsRecorder()
+    failed_ids = []  # the dialogs ended early by an API error, which are not saved
+
+    # the seeds are closed once the run ends
+    with read_seeds(seed_path) as seed_dialogs:
+        if num_shards > 1:
+            seed_dialogs = seed_dialogs[shard_id::num_shards]
+        print(f"Loaded {len(seed_dialogs)} cached dialogs.")
+
+        # the outputs are renamed from *.partial once the run completes, and kept partial if it fails
+        with open_sink(output_path, output_format, durability_window=durability_window) as sink, \
+                (JsonlSink(output_prefix + ".metrics.jsonl", durability_window=durability_window, ensure_ascii=True)
+                 if save_metrics else nullcontext()) as fm, \
+                tqdm(total=len(seed_dialogs)) as pbar:
+            for batch_start in range(0, len(seed_dialogs), num_parallel_dialogs):
+                dialogs = []
+                for seed_dialog in seed_dialogs[batch_start:batch_start + num_parallel_dialogs]:
+                    simulated_profile = seed_dialog["user_profile"]
+                    sampled_knowledge = seed_dialog["knowledge"]
+                    target = seed_dialog["target"]
+
+                    conversation = seed_dialog["seed_conversation"]
+                    seed_conv = sample_seed_conversation(seed_dialog["original_goal"], conversation)
+
+                    # randomly sample a personality
+                    simulated_personality = sample_personality()
+                    assistant_name = sample_assistant_role(profile_slots, simulated_profile)
+
+                    env_desc, user_dict, assistant_dict, moderator_dict = create_instruct(
+                        target=target,
+                        simulated_profile=simulated_profile,
+                        simulated_personality=simulated_personality,
+                        assistant_name=assistant_name,
+                        domain_knowledge=sampled_knowledge,
+                        seed_conversation=seed_conv,
+                        knowledge_format=knowledge_format
+                    )
+                    # the players, backends and environment are reused across dialogs, only the prompts are swapped in
+                    arena = arena_pool.acquire(global_prompt=env_desc, players=[assistant_dict, user_dict],
+                                               environment={"moderator": moderator_dict})
+                    assistant, user = arena.players
+                    dialog_metrics = MetricsRecorder()
+                    assistant.backend.attach_metrics(dialog_metrics, role="system")
+                    user.backend.attach_metrics(dialog_metrics, role="user")
+                    arena.environment.moderator.backend.attach_metrics(dialog_metrics, role="moderator")
+                    dialogs.append((seed_dialog, simulated_personality, arena, dialog_metrics))
+
+                arenas = [arena for _, _, arena, _ in dialogs]
+                # the arenas of the pool are acquired ready to run, without another reset
+                if show_description or show_message:
+                    for arena in arenas:
+                        arena.launch_cli(max_steps=max_interaction_step, show_description=show_description, show_message=show_message, interactive=False,
+                                         reset=False)
+                elif len(arenas) > 1:
+                    # headless lockstep path, the queries of all the dialogs in the batch are sent together
+                    with VectorArena(arenas) as vector_arena:
+                        vector_arena.run_until_terminal(max_steps=max_interaction_step, reset=False)
                 else:
-                    utt = {"user": msg.content}
-                simulated_convs.append(utt)
-            
-            write_line = {
-                "id": "s_" + str(seed_dialog["id"]),
-                "user_profile": simulated_profile,
-                "user_personality": simulated_personality,
-                "knowledge": sampled_knowledge,
-                "target": target,
-                "conversation": simulated_convs
-            }
-            fw.write(json.dumps(write_line, ensure_ascii=False) + "\n")
-            fw.flush()
-
-            print("Sleeping for 5 seconds...")
-            time.sleep(5)
-
-            #print("Continue? (y/n)")
-            #if input() == "n":
-            #    break
+                    # headless fast path without any terminal rendering
+                    arenas[0].run_until_terminal(max_steps=max_interaction_step, reset=False)
+
+                #print("Save? (y/n)")
+                #if input() == "n":
+                #    continue
+
+                for seed_dialog, simulated_personality, arena, dialog_metrics in dialogs:
+                    # save the simulated dialog to file, unless it was cut short by an API error
+                    assistant = arena.players[0]
+                    messages = arena.environment.get_observation()
+                    simulated_convs = []
+                    for msg in messages:
+                        if msg.agent_name == assistant.name:
+                            utt = {"system": msg.content}
+                        else:
+                            utt = {"user": msg.content}
+                        simulated_convs.append(utt)
+
+                    write_line = {
+                        "id": "s_" + str(seed_dialog["id"]),
+                        "user_profile": seed_dialog["user_profile"],
+                        "user_personality": simulated_personality,
+                        "knowledge": seed_dialog["knowledge"],
+                        "target": seed_dialog["target"],
+                        "conversation": simulated_convs
+                    }
+                    if arena.backend_error is None:
+                        sink.write(write_line)
+                    else:
+                        failed_ids.append(write_line["id"])
+                    arena_pool.release(arena)
+
+                    run_metrics.merge(dialog_metrics)
+                    if fm is not None:
+                        # the knowledge is resent on every assistant call
+                        knowledge_tokens = knowledge_token_savings(seed_dialog["knowledge"], model=model_name)
+                        assistant_calls = sum(1 for msg in messages if msg.agent_name == assistant.name)
+                        knowledge_tokens.update({
+                            "format": knowledge_format,
+                            "assistant_calls": assistant_calls,
+                            "saved_per_dialog": knowledge_tokens["saved"] * assistant_calls if knowledge_format == "compact" else 0,
+                        })
+                        fm.write({"id": write_line["id"], "metrics": dialog_metrics.to_dict(),
+                                  "knowledge_tokens": knowledge_tokens})
+                    pbar.update(1)
+
+                print("Sleeping for 5 seconds...")
+                time.sleep(5)
+
+                #print("Continue? (y/n)")
+                #if input() == "n":
+                #    break
+
+    if failed_ids:
+        print(f"Skipped {len(failed_ids)} dialogs ended early by an API error: {', '.join(failed_ids)}")
+    # the retries and circuit breakers of the API, if it has not always been healthy
+    report = resilience_report()
+    if any(stats["retries"] or stats["times_opened"] for stats in report.values()):
+        print("API resilience: {}".format(json.dumps(report)))
+    if metrics_summary == "json":
+        with open(output_prefix + ".metrics.json", "w", encoding='utf-8') as f:
+            json.dump(run_metrics.to_dict(), f, indent=4)
+    elif metrics_summary == "prometheus":
+        with open(output_prefix + ".metrics.prom", "w", encoding='utf-8') as f:
+            f.write(run_metrics.to_prometheus())
 
 
 if __name__ == '__main__':
@@ -223,8 +341,21 @@ if __name__ == '__main__':
                         max_interaction_step=args.max_interaction_step,
                         model_name=args.model_name,
                         temperature=args.temperature,
+                        api_base=args.api_base,
+                        api_key_env=args.api_key_env,
+                        pool_size=args.pool_size,
+                        request_timeout=args.request_timeout,
+                        stream=args.stream,
                         max_system_tokens=args.max_system_tokens,
                         max_user_tokens=args.max_user_tokens,
                         max_moderator_tokens=args.max_moderator_tokens,
                         show_description=args.show_description,
-                        show_message=args.show_message)
+                        show_message=args.show_message,
+                        save_metrics=args.save_metrics,
+                        metrics_summary=args.metrics_summary,
+                        knowledge_format=args.knowledge_format,
+                        durability_window=args.durability_window,
+                        output_format=args.output_format,
+                        num_shards=args.num_shards,
+                        shard_id=args.shard_id,
+                        num_parallel_dialogs=args.num_parallel_dialogs)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized sentence-level BLEU-1/2, equivalent to nltk's sentence_bleu with SmoothingFunction().method1
+and one-hot weights, but computing all the sentence scores in one NumPy pass.
+"""
+from typing import List, Tuple
+import numpy as np
+
+# The epsilon used by SmoothingFunction().method1 for n-grams without any match
+EPSILON = 0.1
+
+
+def _encode(sentences: List[List[str]], vocab: dict) -> Tuple[np.ndarray, np.ndarray]:
+    """Map the tokens to integer ids, returning the flat token ids and the sentence index of each token."""
+    lengths = np.fromiter((len(sent) for sent in sentences), dtype=np.int64, count=len(sentences))
+    token_ids = np.fromiter((vocab.setdefault(tok, len(vocab)) for sent in sentences for tok in sent),
+                            dtype=np.int64, count=int(lengths.sum()))
+    sent_ids = np.repeat(np.arange(len(sentences), dtype=np.int64), lengths)
+    return token_ids, sent_ids
+
+
+def _ngrams(token_ids: np.ndarray, sent_ids: np.ndarray, n: int, vocab_size: int):
+    """Hash the n-grams that do not cross sentence boundaries to integer ids."""
+    if n == 1:
+        return token_ids, sent_ids
+    if vocab_size ** n >= 2 ** 63:
+        raise ValueError(f"The {n}-gram ids of a vocabulary of size {vocab_size} overflow int64")
+    size = len(token_ids) - n + 1
+    if size <= 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    gram_ids = token_ids[:size].copy()
+    for k in range(1, n):
+        gram_ids = gram_ids * vocab_size + token_ids[k:size + k]
+    in_sentence = sent_ids[:size] == sent_ids[n - 1:]
+    return gram_ids[in_sentence], sent_ids[:size][in_sentence]
+
+
+def _clipped_matches(hyp_grams, hyp_sents, ref_grams, ref_sents, num_sents: int) -> np.ndarray:
+    """Count the n-gram matches of each hypothesis, clipped by the n-gram counts of its reference."""
+    if len(hyp_grams) == 0:
+        return np.zeros(num_sents)
+    # Re-index the n-grams densely so that (sentence, n-gram) pairs fit into one int64 key
+    _, ranks = np.unique(np.concatenate([hyp_grams, ref_grams]), return_inverse=True)
+    num_grams = int(ranks.max()) + 1
+    hyp_keys, hyp_counts = np.unique(hyp_sents * num_grams + ranks[:len(hyp_grams)], return_counts=True)
+    ref_keys, ref_counts = np.unique(ref_sents * num_grams + ranks[len(hyp_grams):], return_counts=True)
+
+    if len(ref_keys) == 0:
+        return np.zeros(num_sents)
+    pos = np.minimum(np.searchsorted(ref_keys, hyp_keys), len(ref_keys) - 1)
+    ref_matched = np.where(ref_keys[pos] == hyp_keys, ref_counts[pos], 0)
+    clipped = np.minimum(hyp_counts, ref_matched)
+    return np.bincount(hyp_keys // num_grams, weights=clipped, minlength=num_sents)
+
+
+def sentence_bleu_scores(hyps: List[List[str]], refs: List[List[str]], max_n: int = 2) -> np.ndarray:
+    """
+    Compute the sentence-level BLEU-n (n = 1..max_n, with one-hot weights) of each hypothesis against its reference.
+    Returns an array of shape (len(hyps), max_n).
+    """
+    assert len(hyps) == len(refs)
+    num_sents = len(hyps)
+    if num_sents == 0:
+        return np.zeros((0, max_n))
+
+    vocab = {}
+    hyp_tokens, hyp_sents = _encode(hyps, vocab)
+    ref_tokens, ref_sents = _encode(refs, vocab)
+    vocab_size = max(len(vocab), 1)
+
+    hyp_lens = np.bincount(hyp_sents, minlength=num_sents)
+    ref_lens = np.bincount(ref_sents, minlength=num_sents)
+
+    # Brevity penalty with a single reference
+    bp = np.where(hyp_lens > ref_lens, 1.,
+                  np.where(hyp_lens == 0, 0., np.exp(1 - ref_lens / np.maximum(hyp_lens, 1))))
+
+    scores = np.zeros((num_sents, max_n))
+    unigram_matches = None
+    for n in range(1, max_n + 1):
+        hyp_grams, hyp_gram_sents = _ngrams(hyp_tokens, hyp_sents, n, vocab_size)
+        ref_grams, ref_gram_sents = _ngrams(ref_tokens, ref_sents, n, vocab_size)
+        matches = _clipped_matches(hyp_grams, hyp_gram_sents, ref_grams, ref_gram_sents, num_sents)
+        if n == 1:
+            unigram_matches = matches
+        denominators = np.maximum(1, hyp_lens - n + 1)
+        # method1 smoothing: add epsilon to the numerator of the precisions without any match
+        precisions = np.where(matches > 0, matches, EPSILON) / denominators
+        scores[:, n - 1] = bp * precisions
+
+    # nltk scores 0 if there is no unigram match at all
+    scores[unigram_matches == 0] = 0.
+    return scores
@@ -1,37 +1,41 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import os
+import csv
 import argparse
 import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import zip_longest
 import numpy as np
 from collections import Counter
 import nltk
-from nltk.translate import bleu_score
-from nltk.translate.bleu_score import SmoothingFunction
+from bleu import sentence_bleu_scores
+from ingest import ingest_file, DEFAULT_CACHE_DIR
+from matcher import count_hits, get_matcher
+from bootstrap import STAT_FIELDS, FIELD_INDEX, confidence_intervals, paired_comparison
+
+
+# target action -> domain of the target success rates
+ACTION_DOMAINS = {
+    "Movie recommendation": "Movie",
+    "Music recommendation": "Music",
+    "Play music": "Music",
+    "POI recommendation": "POI",
+    "Food recommendation": "Food",
+}
+
+# the metrics a leaderboard can be ranked on
+SORT_METRICS = ("succ", "avg_bleu", "bleu_1", "bleu_2", "knowledge_f1", "persona_f1") + \
+    tuple("succ_" + domain.lower() for domain in ("Movie", "Music", "POI", "Food"))
 
 
 def calc_bleu(hyps, refs):
     """ Calculate bleu score """
-    bleu_1 = []
-    bleu_2 = []
-    for hyp, ref in zip(hyps, refs):
-        try:
-            score = bleu_score.sentence_bleu(
-                [ref], hyp,
-                smoothing_function=SmoothingFunction().method1,
-                weights=[1, 0, 0, 0])
-        except:
-            score = 0
-        bleu_1.append(score)
-        try:
-            score = bleu_score.sentence_bleu(
-                [ref], hyp,
-                smoothing_function=SmoothingFunction().method1,
-                weights=[0, 1, 0, 0])
-        except:
-            score = 0
-        bleu_2.append(score)
-    bleu_1 = np.average(bleu_1)
-    bleu_2 = np.average(bleu_2)
+    # sentence-level BLEU-1/2 of all hypotheses in one vectorized pass,
+    # equivalent to nltk's sentence_bleu with SmoothingFunction().method1
+    scores = sentence_bleu_scores(hyps, refs, max_n=2)
+    bleu_1 = np.average(scores[:, 0])
+    bleu_2 = np.average(scores[:, 1])
     avg_bleu = (bleu_1 + bleu_2) / 2
     return bleu_1, bleu_2, avg_bleu
 
@@ -43,12 +47,9 @@ def calc_knowledge_f1(hyps, knowledge_refs, knowledge_alls):
     hit_total = 0.0
     for response, golden_kd, all_kd in zip(hyps, knowledge_refs, knowledge_alls):
         golden_total += len(golden_kd)
-        for kd in golden_kd:
-            if is_obj_hit(response, kd):
-                hit_total += 1
-        for kd in all_kd:
-            if is_obj_hit(response, kd):
-                pred_total += 1
+        golden_hit, all_hit = count_hits(response, golden_kd, all_kd)
+        hit_total += golden_hit
+        pred_total += all_hit
     p = hit_total / pred_total if pred_total > 0 else 0
     r = hit_total / golden_total if golden_total > 0 else 0
     f1 = 2 * p * r / (p + r) if p + r > 0 else 0
@@ -62,88 +63,82 @@ def calc_persona_f1(hyps, persona_refs, persona_alls):
     hit_total = 0.0
     for response, golden_persona, all_persona in zip(hyps, persona_refs, persona_alls):
         golden_total += len(golden_persona)
-        for persona in golden_persona:
-            if is_obj_hit(response, persona, threshold=0.8):
-                hit_total += 1
-        for persona in all_persona:
-            if is_obj_hit(response, persona, threshold=0.8):
-                pred_total += 1
+        golden_hit, all_hit = count_hits(response, golden_persona, all_persona, threshold=0.8)
+        hit_total += golden_hit
+        pred_total += all_hit
     p = hit_total / pred_total if pred_total > 0 else 0
     r = hit_total / golden_total if golden_total > 0 else 0
     f1 = 2 * p * r / (p + r) if p + r > 0 else 0
     return f1
 
-def calc_succ(eval_fp, gold_fp):
-    all_eval, all_gold = [], []
-    with open(eval_fp, 'r', encoding='utf-8') as fr:
-        for line in fr:
-            sample = json.loads(line)
-            all_eval.append(sample)
-    with open(gold_fp, 'r', encoding='utf-8') as fr:
-        for line in fr:
-            raw_sample = json.loads(line)
-            sample = {
-                "id": raw_sample["id"],
-                "target": raw_sample["target"],
-                "response": raw_sample["response"]
-            }
-            all_gold.append(sample)
-    assert len(all_eval) == len(all_gold)
-
-    topic_hit, topic_total = 0, 0
-    movie_hit, music_hit, poi_hit, food_hit = 0, 0, 0, 0
-    movie_total, music_total, poi_total, food_total = 0, 0, 0, 0
-    
-    for idx, gold_sample in enumerate(all_gold):
-        if gold_sample["target"][1].lower() in gold_sample["response"].lower():
-            topic_total += 1
-            eval_action = gold_sample["target"][0]
-            eval_topic = gold_sample["target"][1]
-            
-            # eval target turn and neighboring turns
-            eval_list = get_eval_response(idx, all_eval, all_gold)
-            
-            eval_topic = " ".join(nltk.word_tokenize(eval_topic))
-            eval_list = [" ".join(nltk.word_tokenize(eval_response)) for eval_response in eval_list]
-            
-            if is_topic_hit(eval_topic, eval_list):
-                topic_hit += 1
-            
-            if eval_action == "Movie recommendation":
-                movie_total += 1
-                if is_topic_hit(eval_topic, eval_list):
-                    movie_hit += 1
-            elif eval_action == "Music recommendation" or eval_action == "Play music":
-                music_total += 1
-                if is_topic_hit(eval_topic, eval_list):
-                    music_hit += 1
-            elif eval_action == "POI recommendation":
-                poi_total += 1
-                if is_topic_hit(eval_topic, eval_list):
-                    poi_hit += 1
-            elif eval_action == "Food recommendation":
-                food_total += 1
-                if is_topic_hit(eval_topic, eval_list):
-                    food_hit += 1
-    succ_rate = float(topic_hit) / topic_total
-    movie_rec_sr = float(movie_hit) / movie_total
-    music_rec_sr = float(music_hit) / music_total
-    poi_rec_sr = float(poi_hit) / poi_total
-    food_rec_sr = float(food_hit) / food_total
-    print("Succ.: {:.2f}%".format(succ_rate*100))
-    print("Succ.-Movie: {}/{} = {:.2f}%".format(movie_hit, movie_total, movie_rec_sr*100))
-    print("Succ.-Music: {}/{} = {:.2f}%".format(music_hit, music_total, music_rec_sr*100))
-    print("Succ.-POI: {}/{} = {:.2f}%".format(poi_hit, poi_total, poi_rec_sr*100))
-    print("Succ.-Food: {}/{} = {:.2f}%".format(food_hit, food_total, food_rec_sr*100))
-
-
-def get_eval_response(idx, eval_samples, gold_samples):
-    eval_list = [eval_samples[idx]["response"]]
+def build_succ_index(gold_data):
+    """
+    Index the gold samples once for the target success: the target turns, whether the neighboring turns belong
+    to the same dialog, and the lowercased target topics and domains
+    """
+    if "succ_index" in gold_data:
+        return gold_data["succ_index"]
+    all_gold = gold_data["samples"]
+    num_samples = len(all_gold)
+    dialog_ids = [sample["id"] for sample in all_gold]
+    # consecutive gold samples of the same dialog form a group
+    has_prev = np.array([idx > 0 and dialog_ids[idx] == dialog_ids[idx-1] for idx in range(num_samples)], dtype=bool)
+    has_next = np.zeros(num_samples, dtype=bool)
+    has_next[:-1] = has_prev[1:]
+    is_target = [sample["target"][1].lower() in sample["response"].lower() for sample in all_gold]
+    succ_index = {
+        "target_idx": np.flatnonzero(np.array(is_target, dtype=bool)),
+        "has_prev": has_prev,
+        "has_next": has_next,
+        "topics": [" ".join(topic_toks).lower() for topic_toks in gold_data["topic_tokens"]],
+        "domains": [ACTION_DOMAINS.get(sample["target"][0]) for sample in all_gold],
+    }
+    gold_data["succ_index"] = succ_index
+    return succ_index
+
+
+def calc_succ_hits(eval_data, succ_index):
+    """Check whether each target turn is hit by the eval response of the turn or its neighboring turns"""
+    candidates = [" ".join(eval_toks).lower() for eval_toks in eval_data["raw_tokens"]]
+    topics, has_prev, has_next = succ_index["topics"], succ_index["has_prev"], succ_index["has_next"]
+    hits = [topics[idx] in candidates[idx] or
+            (has_prev[idx] and topics[idx] in candidates[idx-1]) or
+            (has_next[idx] and topics[idx] in candidates[idx+1])
+            for idx in succ_index["target_idx"]]
+    return np.array(hits, dtype=bool)
+
+
+def calc_succ(eval_data, gold_data, verbose=True):
+    """Calculate target success rates, given the ingested eval and gold data"""
+    assert len(eval_data["samples"]) == len(gold_data["samples"])
+    succ_index = build_succ_index(gold_data)
+    hits = calc_succ_hits(eval_data, succ_index)
+    target_domains = [succ_index["domains"][idx] for idx in succ_index["target_idx"]]
+
+    results = {"succ": hits.mean() if len(hits) > 0 else None}
+    if verbose:
+        print("Succ.: {}".format("N/A" if results["succ"] is None else "{:.2f}%".format(results["succ"]*100)))
+    for domain in ("Movie", "Music", "POI", "Food"):
+        in_domain = np.array([target_domain == domain for target_domain in target_domains], dtype=bool)
+        domain_hit, domain_total = int(hits[in_domain].sum()) if len(hits) > 0 else 0, int(in_domain.sum())
+        # a domain may be absent from the gold file
+        domain_sr = float(domain_hit) / domain_total if domain_total > 0 else None
+        results["succ_" + domain.lower()] = domain_sr
+        if verbose:
+            if domain_sr is None:
+                print("Succ.-{}: 0/0 = N/A".format(domain))
+            else:
+                print("Succ.-{}: {}/{} = {:.2f}%".format(domain, domain_hit, domain_total, domain_sr*100))
+    return results
+
+
+def get_eval_response(idx, eval_responses, gold_samples):
+    eval_list = [eval_responses[idx]]
     dialog_id = gold_samples[idx]["id"]
     if idx - 1 >= 0 and gold_samples[idx-1]["id"] == dialog_id:
-        eval_list.append(eval_samples[idx-1]["response"])
+        eval_list.append(eval_responses[idx-1])
     if idx + 1 < len(gold_samples) and gold_samples[idx+1]["id"] == dialog_id:
-        eval_list.append(eval_samples[idx+1]["response"])
+        eval_list.append(eval_responses[idx+1])
     return eval_list
 
 def is_topic_hit(topic, candidates):
@@ -175,10 +170,11 @@ def label_knowledge(utterance_toks, kg_list, lower_case=True):
         assert len(triple) == 3
         all_objs.add(triple[0].lower() if lower_case else triple[0])
         all_objs.add(triple[2].lower() if lower_case else triple[2])
-    for obj in all_objs:
-        if is_obj_hit(utterance_toks, obj):
-            gold_knowledge.append(obj)
     all_objs = list(all_objs)
+    matcher = get_matcher(tuple(all_objs))
+    for obj, hit in zip(all_objs, matcher.hits(utterance_toks)):
+        if hit:
+            gold_knowledge.append(obj)
     return all_objs, gold_knowledge
 
 def label_persona(utterance_toks, persona_dict, lower_case=True):
@@ -187,65 +183,349 @@ def label_persona(utterance_toks, persona_dict, lower_case=True):
     for k, v in persona_dict.items():
         if v != '' and v != ' ':
             all_personas.append(v.lower() if lower_case else v)
-    for persona in all_personas:
-        if is_obj_hit(utterance_toks, persona, threshold=0.8):
+    matcher = get_matcher(tuple(all_personas))
+    for persona, hit in zip(all_personas, matcher.hits(utterance_toks, threshold=0.8)):
+        if hit:
             gold_persona.append(persona)
     return all_personas, gold_persona
 
 
-def load_data(fp, is_gold=False, lower_case=True):
-    samples = []
+def load_data(data, is_gold=False, lower_case=True):
+    """Load the tokenized samples (and labeled knowledge/persona for gold) from the ingested data"""
+    samples = data["tokens"]
+    if not is_gold:
+        return samples
+
     all_knowledges, gold_knowledges = [], []
     all_personas, gold_personas = [], []
-    with open(fp, 'r', encoding='utf-8') as fr:
-        for idx, line in enumerate(fr):
-            sample = json.loads(line)
-            response = sample["response"].lower() if lower_case else sample["response"]
-            # English word-level
-            sentence_toks = nltk.word_tokenize(response)
-            samples.append(sentence_toks)
-            if is_gold:
-                knowledge = sample["knowledge"]
-                all_k, all_k= label_knowledge(sentence_toks, knowledge, lower_case=lower_case)
-                all_knowledges.append(all_k)
-                gold_knowledges.append(all_k)
-                persona = sample["user_profile"]
-                all_p, gold_p = label_persona(sentence_toks, persona, lower_case=lower_case)
-                all_personas.append(all_p)
-                gold_personas.append(gold_p)
-    if is_gold:
-        assert len(samples) == len(all_knowledges) and \
-            len(samples) == len(gold_knowledges) and \
-            len(samples) == len(all_personas)
-        return (samples, all_knowledges, gold_knowledges, all_personas, gold_personas)
+    for sample, sentence_toks in zip(data["samples"], samples):
+        knowledge = sample["knowledge"]
+        all_k, all_k= label_knowledge(sentence_toks, knowledge, lower_case=lower_case)
+        all_knowledges.append(all_k)
+        gold_knowledges.append(all_k)
+        persona = sample["user_profile"]
+        all_p, gold_p = label_persona(sentence_toks, persona, lower_case=lower_case)
+        all_personas.append(all_p)
+        gold_personas.append(gold_p)
+    assert len(samples) == len(all_knowledges) and \
+        len(samples) == len(gold_knowledges) and \
+        len(samples) == len(all_personas)
+    return (samples, all_knowledges, gold_knowledges, all_personas, gold_personas)
+
+
+class StreamingEvaluator:
+    """
+    Constant-memory evaluation: consume (eval, gold) sample pairs one by one and accumulate the counters of
+    all metrics, keeping only the +-1 turn window needed by the target success.
+    """
+
+    def __init__(self, lower_case=True, chunk_size=1024):
+        self.lower_case = lower_case
+        self.chunk_size = chunk_size
+
+        self.num_samples = 0
+        self.bleu_sums = np.zeros(2)
+        self._bleu_hyps, self._bleu_refs = [], []  # pending chunk of BLEU pairs
+        self.kg_counts = np.zeros(3)  # hit, pred, golden
+        self.persona_counts = np.zeros(3)
+        self.topic_hit, self.topic_total = 0, 0
+        self.domain_hit = {domain: 0 for domain in ACTION_DOMAINS.values()}
+        self.domain_total = {domain: 0 for domain in ACTION_DOMAINS.values()}
+        self._prev, self._cur = None, None  # the turn window for the target success
+
+    def update(self, eval_sample, gold_sample):
+        eval_response = eval_sample["response"]
+        gold_response = gold_sample["response"]
+        hyp = nltk.word_tokenize(eval_response.lower() if self.lower_case else eval_response)
+        ref = nltk.word_tokenize(gold_response.lower() if self.lower_case else gold_response)
+        self.num_samples += 1
+
+        self._bleu_hyps.append(hyp)
+        self._bleu_refs.append(ref)
+        if len(self._bleu_hyps) >= self.chunk_size:
+            self._flush_bleu()
+
+        all_k, all_k = label_knowledge(ref, gold_sample["knowledge"], lower_case=self.lower_case)
+        golden_hit, all_hit = count_hits(hyp, all_k, all_k)
+        self.kg_counts += (golden_hit, all_hit, len(all_k))
+        all_p, gold_p = label_persona(ref, gold_sample["user_profile"], lower_case=self.lower_case)
+        golden_hit, all_hit = count_hits(hyp, gold_p, all_p, threshold=0.8)
+        self.persona_counts += (golden_hit, all_hit, len(gold_p))
+
+        turn = {
+            "id": gold_sample["id"],
+            "target": gold_sample["target"],
+            "response": gold_response,
+            "eval_text": " ".join(nltk.word_tokenize(eval_response)),
+        }
+        if self._cur is not None:
+            self._eval_succ(self._prev, self._cur, turn)
+        self._prev, self._cur = self._cur, turn
+
+    def _flush_bleu(self):
+        if self._bleu_hyps:
+            self.bleu_sums += sentence_bleu_scores(self._bleu_hyps, self._bleu_refs, max_n=2).sum(axis=0)
+            self._bleu_hyps, self._bleu_refs = [], []
+
+    def _eval_succ(self, prev, cur, nxt):
+        target_action, target_topic = cur["target"]
+        if target_topic.lower() not in cur["response"].lower():
+            return
+        eval_list = [cur["eval_text"]]
+        for neighbor in (prev, nxt):
+            if neighbor is not None and neighbor["id"] == cur["id"]:
+                eval_list.append(neighbor["eval_text"])
+        hit = is_topic_hit(" ".join(nltk.word_tokenize(target_topic)), eval_list)
+
+        self.topic_total += 1
+        self.topic_hit += int(hit)
+        domain = ACTION_DOMAINS.get(target_action)
+        if domain is not None:
+            self.domain_total[domain] += 1
+            self.domain_hit[domain] += int(hit)
+
+    @staticmethod
+    def _f1(counts):
+        hit_total, pred_total, golden_total = counts
+        p = hit_total / pred_total if pred_total > 0 else 0
+        r = hit_total / golden_total if golden_total > 0 else 0
+        return 2 * p * r / (p + r) if p + r > 0 else 0
+
+    def finalize(self):
+        self._flush_bleu()
+        if self._cur is not None:
+            self._eval_succ(self._prev, self._cur, None)
+            self._prev, self._cur = None, None
+
+        bleu_1, bleu_2 = self.bleu_sums / max(self.num_samples, 1)
+        return {
+            "bleu_1": bleu_1,
+            "bleu_2": bleu_2,
+            "avg_bleu": (bleu_1 + bleu_2) / 2,
+            "knowledge_f1": self._f1(self.kg_counts),
+            "persona_f1": self._f1(self.persona_counts),
+            "succ": self.topic_hit / self.topic_total if self.topic_total > 0 else None,  # same as calc_succ
+            "succ_hit": {"All": self.topic_hit, **self.domain_hit},
+            "succ_total": {"All": self.topic_total, **self.domain_total},
+        }
+
+
+def evaluate_streaming(eval_fp, gold_fp, lower_case=True):
+    """Evaluate by streaming the eval and gold files in lockstep"""
+    evaluator = StreamingEvaluator(lower_case=lower_case)
+    with open(eval_fp, 'r', encoding='utf-8') as fe, open(gold_fp, 'r', encoding='utf-8') as fg:
+        for eval_line, gold_line in zip_longest(fe, fg):
+            assert eval_line is not None and gold_line is not None, "The eval and gold files differ in length"
+            evaluator.update(json.loads(eval_line), json.loads(gold_line))
+    results = evaluator.finalize()
+
+    output_str = "Avg. BLEU: %.3f\n" % results["avg_bleu"]
+    output_str += "Knowledge F1: %.2f%%\n" % (results["knowledge_f1"] * 100)
+    output_str += "Persona F1: %.2f%%" % (results["persona_f1"] * 100)
+    print(output_str)
+
+    print("Succ.: {}".format("N/A" if results["succ"] is None else "{:.2f}%".format(results["succ"]*100)))
+    for domain in ("Movie", "Music", "POI", "Food"):
+        hit, total = results["succ_hit"][domain], results["succ_total"][domain]
+        if total > 0:
+            print("Succ.-{}: {}/{} = {:.2f}%".format(domain, hit, total, hit / total * 100))
+        else:
+            print("Succ.-{}: 0/0 = N/A".format(domain))
+    return results
+
+
+def calc_sample_stats(preds, eval_data, gold_data, gold_labels):
+    """Calculate the per-sample sufficient statistics of all metrics, for bootstrap resampling"""
+    refs, all_knowledges, ref_knowledges, all_personas, ref_personas = gold_labels
+    stats = np.zeros((len(preds), len(STAT_FIELDS)))
+    stats[:, [FIELD_INDEX["bleu_1"], FIELD_INDEX["bleu_2"]]] = sentence_bleu_scores(preds, refs, max_n=2)
+
+    for idx, response in enumerate(preds):
+        golden_hit, all_hit = count_hits(response, ref_knowledges[idx], all_knowledges[idx])
+        stats[idx, [FIELD_INDEX["kg_hit"], FIELD_INDEX["kg_pred"], FIELD_INDEX["kg_gold"]]] = \
+            (golden_hit, all_hit, len(ref_knowledges[idx]))
+        golden_hit, all_hit = count_hits(response, ref_personas[idx], all_personas[idx], threshold=0.8)
+        stats[idx, [FIELD_INDEX["persona_hit"], FIELD_INDEX["persona_pred"], FIELD_INDEX["persona_gold"]]] = \
+            (golden_hit, all_hit, len(ref_personas[idx]))
+
+    succ_index = build_succ_index(gold_data)
+    hits = calc_succ_hits(eval_data, succ_index)
+    for idx, hit in zip(succ_index["target_idx"], hits):
+        stats[idx, FIELD_INDEX["succ_total"]] = 1
+        stats[idx, FIELD_INDEX["succ_hit"]] = hit
+        domain = succ_index["domains"][idx]
+        if domain is not None:
+            stats[idx, FIELD_INDEX["succ_total_" + domain.lower()]] = 1
+            stats[idx, FIELD_INDEX["succ_hit_" + domain.lower()]] = hit
+    return stats
+
+
+# The gold data and labels shared by the workers of the multi-system evaluation
+_gold = None
+
+
+def _init_gold(gold_data, gold_labels):
+    global _gold
+    _gold = (gold_data, gold_labels)
+
+
+def evaluate_system(eval_fp, cache_dir=DEFAULT_CACHE_DIR, with_stats=False):
+    """Evaluate one system against the gold data labeled once in _init_gold"""
+    gold_data, (refs, all_knowledges, ref_knowledges, all_personas, ref_personas) = _gold
+    # one process per system, so tokenize within the process
+    eval_data = ingest_file(eval_fp, is_gold=False, num_workers=1, cache_dir=cache_dir)
+    preds = load_data(eval_data)
+    assert len(preds) == len(refs), "{} differs in length from the gold file".format(eval_fp)
+
+    bleu1, bleu2, avg_bleu = calc_bleu(preds, refs)
+    results = {
+        "system": eval_fp,
+        "bleu_1": bleu1,
+        "bleu_2": bleu2,
+        "avg_bleu": avg_bleu,
+        "knowledge_f1": calc_knowledge_f1(preds, ref_knowledges, all_knowledges),
+        "persona_f1": calc_persona_f1(preds, ref_personas, all_personas),
+    }
+    results.update(calc_succ(eval_data, gold_data, verbose=False))
+    if with_stats:
+        results["_stats"] = calc_sample_stats(preds, eval_data, gold_data, _gold[1])
+    return results
+
+
+def evaluate_systems(eval_fps, gold_fp, num_workers=None, cache_dir=DEFAULT_CACHE_DIR, sort_by="succ",
+                     bootstrap=0, confidence=0.95, seed=42):
+    """
+    Evaluate many systems against the same gold file in a process pool, returning a leaderboard.
+    With bootstrap > 0, the confidence intervals of each system and its paired comparison with the top system
+    are computed from bootstrap resamples.
+    """
+    gold_data = ingest_file(gold_fp, is_gold=True, num_workers=num_workers, cache_dir=cache_dir)
+    gold_labels = load_data(gold_data, is_gold=True)
+    build_succ_index(gold_data)  # shared by all systems
+
+    num_workers = min(num_workers or os.cpu_count() or 1, len(eval_fps))
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_gold,
+                             initargs=(gold_data, gold_labels)) as executor:
+        leaderboard = list(executor.map(evaluate_system, eval_fps, [cache_dir] * len(eval_fps),
+                                        [bootstrap > 0] * len(eval_fps)))
+    leaderboard.sort(key=lambda results: -1 if results[sort_by] is None else results[sort_by], reverse=True)
+
+    if bootstrap > 0:
+        best_stats = leaderboard[0]["_stats"]
+        for rank, results in enumerate(leaderboard):
+            stats = results.pop("_stats")
+            intervals = confidence_intervals(stats, num_resamples=bootstrap, confidence=confidence, seed=seed)
+            for metric in ("avg_bleu", "knowledge_f1", "persona_f1", "succ"):
+                _, results[metric + "_low"], results[metric + "_high"] = intervals[metric]
+            # the top system is not compared with itself, but every row has the same columns
+            results["p_value_vs_top"] = None
+            if rank > 0:
+                comparison = paired_comparison(best_stats, stats, num_resamples=bootstrap,
+                                               confidence=confidence, seed=seed)
+                results["p_value_vs_top"] = comparison[sort_by]["p_value"] if sort_by in comparison else None
+    return leaderboard
+
+
+def print_intervals(intervals, confidence):
+    """Print the bootstrap confidence intervals"""
+    print("Bootstrap {:.0f}% confidence intervals:".format(confidence * 100))
+    for metric, (point, low, high) in intervals.items():
+        print("  {:<14} {:.4f} [{:.4f}, {:.4f}]".format(metric, point, low, high))
+
+
+def save_leaderboard(leaderboard, fp):
+    """Save the leaderboard to a CSV or JSON file"""
+    if fp.endswith(".csv"):
+        with open(fp, 'w', encoding='utf-8', newline='') as fw:
+            # the union of the columns of all rows, in order of appearance
+            fieldnames = list(dict.fromkeys(key for results in leaderboard for key in results))
+            writer = csv.DictWriter(fw, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(leaderboard)
     else:
-        return samples
+        with open(fp, 'w', encoding='utf-8') as fw:
+            json.dump(leaderboard, fw, indent=4)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--eval_file", type=str)
+    parser.add_argument("--eval_file", type=str, nargs="+",
+                        help="The eval file(s), many files are scored in parallel against the same gold file.")
     parser.add_argument("--gold_file", type=str)
+    parser.add_argument("--num_workers", type=int, default=None,
+                        help="The number of processes to tokenize with, default to the number of CPUs.")
+    parser.add_argument("--cache_dir", type=str, default=DEFAULT_CACHE_DIR,
+                        help="The directory to cache the tokens, set to empty to disable caching.")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Stream the eval and gold files with constant memory, without tokenization cache.")
+    parser.add_argument("--leaderboard", type=str, default=None,
+                        help="The CSV or JSON file to save the leaderboard of many eval files.")
+    parser.add_argument("--sort_by", type=str, default="succ", choices=SORT_METRICS,
+                        help="The metric to rank the systems on the leaderboard.")
+    parser.add_argument("--bootstrap", type=int, default=0,
+                        help="The number of bootstrap resamples for confidence intervals, 0 to disable.")
+    parser.add_argument("--confidence", type=float, default=0.95,
+                        help="The confidence level of the bootstrap intervals.")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="The random seed of the bootstrap resampling.")
     args = parser.parse_args()
+    if args.streaming and (len(args.eval_file) > 1 or args.leaderboard is not None):
+        parser.error("--streaming evaluates a single --eval_file without a leaderboard")
+    if args.streaming and args.bootstrap > 0:
+        parser.error("--streaming does not keep the per-sample stats that --bootstrap resamples")
 
-    preds = load_data(args.eval_file)
-    refs, all_knowledges, ref_knowlwedges, all_peronas, ref_personas = load_data(args.gold_file, is_gold=True)
-    assert len(preds) == len(refs)
+    if len(args.eval_file) > 1 or args.leaderboard is not None:
+        leaderboard = evaluate_systems(args.eval_file, args.gold_file, num_workers=args.num_workers,
+                                       cache_dir=args.cache_dir, sort_by=args.sort_by, bootstrap=args.bootstrap,
+                                       confidence=args.confidence, seed=args.seed)
+        print("{:<40} {:>8} {:>8} {:>8} {:>8}".format("System", "BLEU", "K-F1", "P-F1", "Succ."))
+        for results in leaderboard:
+            print("{:<40} {:>8.3f} {:>7.2f}% {:>7.2f}% {:>7.2f}%".format(
+                results["system"][-40:], results["avg_bleu"], results["knowledge_f1"] * 100,
+                results["persona_f1"] * 100, (results["succ"] or 0) * 100))
+            if args.bootstrap > 0:
+                print("{:<40} [{:.3f}, {:.3f}] [{:.2f}%, {:.2f}%] [{:.2f}%, {:.2f}%] [{:.2f}%, {:.2f}%]{}".format(
+                    "", results["avg_bleu_low"], results["avg_bleu_high"],
+                    results["knowledge_f1_low"] * 100, results["knowledge_f1_high"] * 100,
+                    results["persona_f1_low"] * 100, results["persona_f1_high"] * 100,
+                    results["succ_low"] * 100, results["succ_high"] * 100,
+                    "" if results.get("p_value_vs_top") is None else
+                    "  p={:.4f} vs. top".format(results["p_value_vs_top"])))
+        if args.leaderboard is not None:
+            save_leaderboard(leaderboard, args.leaderboard)
+    elif args.streaming:
+        evaluate_streaming(args.eval_file[0], args.gold_file)
+    else:
+        args.eval_file = args.eval_file[0]
+        # parse and tokenize each file only once
+        eval_data = ingest_file(args.eval_file, is_gold=False, num_workers=args.num_workers, cache_dir=args.cache_dir)
+        gold_data = ingest_file(args.gold_file, is_gold=True, num_workers=args.num_workers, cache_dir=args.cache_dir)
 
-    # calculate bleu
-    bleu1, bleu2, avg_bleu = calc_bleu(preds, refs)
+        preds = load_data(eval_data)
+        refs, all_knowledges, ref_knowlwedges, all_peronas, ref_personas = load_data(gold_data, is_gold=True)
+        assert len(preds) == len(refs)
 
-    # calculate knowledge-F1
-    kg_f1 = calc_knowledge_f1(preds, ref_knowlwedges, all_knowledges)
+        # calculate bleu
+        bleu1, bleu2, avg_bleu = calc_bleu(preds, refs)
 
-    # calculate persona-F1
-    persona_f1 = calc_persona_f1(preds, ref_personas, all_peronas)
+        # calculate knowledge-F1
+        kg_f1 = calc_knowledge_f1(preds, ref_knowlwedges, all_knowledges)
 
-    output_str = "Avg. BLEU: %.3f\n" % avg_bleu
-    output_str += "Knowledge F1: %.2f%%\n" % (kg_f1 * 100)
-    output_str += "Persona F1: %.2f%%" % (persona_f1 * 100)
+        # calculate persona-F1
+        persona_f1 = calc_persona_f1(preds, ref_personas, all_peronas)
 
-    print(output_str)
+        output_str = "Avg. BLEU: %.3f\n" % avg_bleu
+        output_str += "Knowledge F1: %.2f%%\n" % (kg_f1 * 100)
+        output_str += "Persona F1: %.2f%%" % (persona_f1 * 100)
+
+        print(output_str)
+
+        # calculate target success
+        calc_succ(eval_data, gold_data)
 
-    # calculate target success
-    calc_succ(args.eval_file, args.gold_file)
+        if args.bootstrap > 0:
+            gold_labels = (refs, all_knowledges, ref_knowlwedges, all_peronas, ref_personas)
+            stats = calc_sample_stats(preds, eval_data, gold_data, gold_labels)
+            intervals = confidence_intervals(stats, num_resamples=args.bootstrap, confidence=args.confidence,
+                                             seed=args.seed)
+            print_intervals(intervals, args.confidence)
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Ingestion stage of the evaluation: parse and tokenize an eval/gold file once, in parallel across processes,
+and cache the tokens on disk keyed by the file hash, so that repeated evaluations skip tokenization entirely.
+"""
+import os
+import json
+import pickle
+import hashlib
+from multiprocessing import Pool
+import nltk
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "topdial", "eval")
+CACHE_VERSION = 1
+GOLD_KEYS = ("id", "target", "response", "knowledge", "user_profile")
+
+
+def file_hash(fp, chunk_size=1 << 20):
+    """Hash the content of a file."""
+    sha = hashlib.sha1()
+    with open(fp, 'rb') as fr:
+        for chunk in iter(lambda: fr.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def tokenize_all(texts, num_workers=None):
+    """Word-tokenize the texts, in parallel if num_workers > 1."""
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_workers <= 1 or len(texts) < 1000:
+        return [nltk.word_tokenize(text) for text in texts]
+    chunksize = max(1, len(texts) // (num_workers * 4))
+    with Pool(num_workers) as pool:
+        return pool.map(nltk.word_tokenize, texts, chunksize=chunksize)
+
+
+def _parse(fp, is_gold, lower_case, num_workers):
+    samples = []
+    with open(fp, 'r', encoding='utf-8') as fr:
+        for line in fr:
+            raw_sample = json.loads(line)
+            if is_gold:
+                samples.append({k: raw_sample[k] for k in GOLD_KEYS})
+            else:
+                samples.append({"response": raw_sample["response"]})
+
+    responses = [sample["response"] for sample in samples]
+    data = {
+        "samples": samples,
+        # English word-level tokens for BLEU and F1
+        "tokens": tokenize_all([r.lower() if lower_case else r for r in responses], num_workers=num_workers),
+    }
+    if is_gold:
+        # tokens of the target topics for the target success
+        data["topic_tokens"] = tokenize_all([sample["target"][1] for sample in samples], num_workers=num_workers)
+    else:
+        # tokens of the original-case responses for the target success
+        data["raw_tokens"] = data["tokens"] if not lower_case else tokenize_all(responses, num_workers=num_workers)
+    return data
+
+
+def ingest_file(fp, is_gold=False, lower_case=True, num_workers=None, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Load an eval (or gold) file with its tokens. Returns a dict with:
+        samples: the parsed samples (only the fields used by the evaluation)
+        tokens: the tokens of the (lowercased) responses
+        raw_tokens: the tokens of the original-case responses (eval file only)
+        topic_tokens: the tokens of the target topics (gold file only)
+    """
+    cache_fp = None
+    if cache_dir:
+        key = "{}-{}-{}-{}-v{}".format(file_hash(fp), int(is_gold), int(lower_case), nltk.__version__, CACHE_VERSION)
+        cache_fp = os.path.join(cache_dir, key + ".pkl")
+        if os.path.exists(cache_fp):
+            with open(cache_fp, 'rb') as fr:
+                return pickle.load(fr)
+
+    data = _parse(fp, is_gold, lower_case, num_workers)
+
+    if cache_fp is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_fp = "{}.{}.tmp".format(cache_fp, os.getpid())
+        with open(tmp_fp, 'wb') as fw:
+            pickle.dump(data, fw, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_fp, cache_fp)
+    return data
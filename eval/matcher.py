@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Fast object-hit matcher for knowledge and persona F1, equivalent to calling is_obj_hit for every
+(response, object) pair but precomputing the token counts of each object once and finding the exact
+substring hits of all objects in a single scan of the response.
+"""
+from typing import List, Tuple
+from collections import Counter
+from functools import lru_cache
+
+# Try to import pyahocorasick for the exact-substring case
+try:
+    import ahocorasick
+except ImportError:
+    is_ahocorasick_available = False
+else:
+    is_ahocorasick_available = True
+
+EXACT_HIT = float("inf")  # the score of an object that occurs as a substring, above any recall threshold
+
+
+@lru_cache(maxsize=65536)
+def compile_object(obj_str: str) -> Tuple[Tuple[str, int], ...]:
+    """Count the tokens of an object once."""
+    return tuple(Counter(obj_str.split()).items())
+
+
+class ObjectMatcher:
+    """
+    Score a set of objects against responses, an object is hit by a response if its score >= threshold.
+    """
+
+    def __init__(self, objects: List[str]):
+        self.objects = list(objects)
+        self._token_counts = [compile_object(obj) for obj in self.objects]
+        self._lengths = [len(obj) for obj in self.objects]
+
+        self._automaton = None
+        if is_ahocorasick_available and len(self.objects) > 0:
+            automaton = ahocorasick.Automaton()
+            for idx, obj in enumerate(self.objects):
+                if obj:
+                    # several objects may share the same string
+                    automaton.add_word(obj, automaton.get(obj, ()) + (idx,))
+            automaton.make_automaton()
+            self._automaton = automaton
+
+    def _exact_hits(self, utterance: str) -> List[bool]:
+        if self._automaton is None:
+            return [obj in utterance for obj in self.objects]
+        hits = [obj == "" for obj in self.objects]  # the empty string is a substring of everything
+        for _, indices in self._automaton.iter(utterance):
+            for idx in indices:
+                hits[idx] = True
+        return hits
+
+    def scores(self, utterance_toks: List[str]) -> List[float]:
+        """
+        Compute the score of every object for a response in a single pass:
+        EXACT_HIT if the object occurs in the response, otherwise its word-level recall (as in is_obj_hit).
+        """
+        utterance = " ".join(utterance_toks)
+        exact_hits = self._exact_hits(utterance)
+        utterance_counts = None
+
+        scores = []
+        for exact, token_counts, length in zip(exact_hits, self._token_counts, self._lengths):
+            if exact:
+                scores.append(EXACT_HIT)
+                continue
+            if utterance_counts is None:
+                utterance_counts = Counter(utterance.split())
+            hit_char_total = sum(min(count, utterance_counts[tok]) for tok, count in token_counts)
+            scores.append(hit_char_total / length if length > 0 else 0)
+        return scores
+
+    def hits(self, utterance_toks: List[str], threshold: float = 0.55) -> List[bool]:
+        return [score >= threshold for score in self.scores(utterance_toks)]
+
+
+@lru_cache(maxsize=4096)
+def get_matcher(objects: Tuple[str, ...]) -> ObjectMatcher:
+    """Get the matcher of a set of objects, which is shared by the turns of the same dialog."""
+    return ObjectMatcher(list(objects))
+
+
+def count_hits(utterance_toks, golden_objs, all_objs, threshold=0.55):
+    """Count the golden and all objects that are hit by a response, scoring each distinct object once."""
+    matcher = get_matcher(tuple(all_objs))
+    hit_by_obj = dict(zip(matcher.objects, matcher.hits(utterance_toks, threshold)))
+    missing = tuple(obj for obj in golden_objs if obj not in hit_by_obj)
+    if missing:
+        hit_by_obj.update(zip(missing, get_matcher(missing).hits(utterance_toks, threshold)))
+    golden_hit = sum(hit_by_obj[obj] for obj in golden_objs)
+    all_hit = sum(hit_by_obj[obj] for obj in all_objs)
+    return golden_hit, all_hit
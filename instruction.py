@@ -1,136 +1,234 @@
 # -*- coding: utf-8 -*-
-from typing import List
+from typing import List, Sequence
+from string import Formatter
+from functools import lru_cache
+from chatarena.metrics import count_tokens
 
+DOMAINS = ("movie", "music", "food", "poi")
+KNOWLEDGE_FORMATS = ("repr", "compact")
 
-def create_instruct(
-        target: List[str], 
-        simulated_profile: dict, 
-        simulated_personality: dict, 
-        assistant_name: str, 
-        domain_knowledge: List[List], 
-        seed_conversation: dict
-    ):
-    """Create instructions about the conversation environment and roles."""
-    domain = ""
+
+def get_domain(target: List[str]):
+    """Get the domain of a target, e.g., ["Movie recommendation", "xxx"] -> "movie"."""
     target_action = target[0].lower()
-    if "movie" in target_action:
-        domain = "movie"
-    elif "music" in target_action:
-        domain = "music"
-    elif "food" in target_action:
-        domain = "food"
-    elif "poi" in target_action:
-        domain = "poi"
-    else:
-        raise ValueError("Invalid target action: {}".format(target_action))
-    
-    # Describe the environment (shared by all roles)
-    if domain == "movie" or domain == "music":
-        env_desc = "You are participating in a conversation about music or movies."
-    else:
-        env_desc = "You are participating in a conversation about delicious food or point-of-interest (POI)."
-    
-    # Describe the user
-    user_desc = "You are {}, ".format(simulated_profile["Name"])
-    profile_desc = ""
-    
-    if simulated_profile["Occupation"] == "Student":
-        if simulated_profile["Gender"] == "Male":
-            profile_desc = "a male student in the age range of {}, living in {}".format(simulated_profile["Age Range"].lower(), simulated_profile["Residence"])
-        else:
-            profile_desc = "a female student in the age range of {}, living in {}".format(simulated_profile["Age Range"].lower(), simulated_profile["Residence"])
-    elif simulated_profile["Occupation"] == "Employed":
-        if simulated_profile["Gender"] == "Male":
-            profile_desc = "a man in the age range of {}, working in a company and living in {}".format(simulated_profile["Age Range"].lower(), simulated_profile["Residence"])
-        else:
-            profile_desc = "a woman in the age range of {}, working in a company and living in {}".format(simulated_profile["Age Range"].lower(), simulated_profile["Residence"])
+    for domain in DOMAINS:
+        if domain in target_action:
+            return domain
+    raise ValueError("Invalid target action: {}".format(target_action))
+
+
+def format_knowledge(domain_knowledge: List[List], knowledge_format: str = "repr"):
+    """
+    Serialize the knowledge triples for the assistant instruction.
+        repr: the Python representation of the list of triples
+        compact: one "subject | relation: object | relation: object" line per subject
+    """
+    if knowledge_format == "repr":
+        return str(domain_knowledge)
+    elif knowledge_format == "compact":
+        grouped = {}
+        for s, p, o in domain_knowledge:
+            grouped.setdefault(s, []).append("{}: {}".format(p, o))
+        return "\n".join(" | ".join([s] + facts) for s, facts in grouped.items())
     else:
-        if simulated_profile["Gender"] == "Male":
-            profile_desc = "a retired man in the age range of {}, living in {}".format(simulated_profile["Age Range"].lower(), simulated_profile["Residence"])
+        raise ValueError("Invalid knowledge format: {}".format(knowledge_format))
+
+
+def knowledge_token_savings(domain_knowledge: List[List], model: str = "gpt-3.5-turbo"):
+    """Count the tokens of the knowledge in each format, the savings are paid back on every assistant call."""
+    tokens = {fmt: count_tokens(format_knowledge(domain_knowledge, fmt), model) for fmt in KNOWLEDGE_FORMATS}
+    tokens["saved"] = tokens["repr"] - tokens["compact"]
+    return tokens
+
+
+class Template:
+    """A string template parsed once into literal chunks and fields, rendered with a single join."""
+
+    def __init__(self, template: str):
+        # the literal chunks, with a placeholder at the position of each field
+        self.chunks = []
+        self.fields = []
+        for literal, field_name, _, _ in Formatter().parse(template):
+            if literal:
+                self.chunks.append(literal)
+            if field_name is not None:
+                self.fields.append((len(self.chunks), field_name))
+                self.chunks.append("")
+
+    def render(self, **fields):
+        chunks = self.chunks.copy()
+        for idx, field_name in self.fields:
+            value = fields[field_name]
+            chunks[idx] = value if isinstance(value, str) else str(value)
+        return "".join(chunks)
+
+
+# (occupation, gender) -> the user profile in the third person
+PROFILE_TEMPLATES = {
+    ("Student", "Male"): "a male student in the age range of {age}, living in {residence}",
+    ("Student", "Female"): "a female student in the age range of {age}, living in {residence}",
+    ("Employed", "Male"): "a man in the age range of {age}, working in a company and living in {residence}",
+    ("Employed", "Female"): "a woman in the age range of {age}, working in a company and living in {residence}",
+    ("Retired", "Male"): "a retired man in the age range of {age}, living in {residence}",
+    ("Retired", "Female"): "a retired woman in the age range of {age}, living in {residence}",
+}
+
+ENV_DESCS = {
+    "movie": "You are participating in a conversation about music or movies.",
+    "music": "You are participating in a conversation about music or movies.",
+    "food": "You are participating in a conversation about delicious food or point-of-interest (POI).",
+    "poi": "You are participating in a conversation about delicious food or point-of-interest (POI).",
+}
+
+ASSISTANT_INTROS = {
+    "movie": "You are {assistant_name}, a movie enthusiast who enjoys a variety of films.\n",
+    "music": "You are {assistant_name}, a music enthusiast who enjoys a variety of music.\n",
+    "food": "You are {assistant_name}, a foodie who enjoys delicious food.\n",
+    "poi": "You are {assistant_name}, a food enthusiast who is interested in exploring different restaurants.\n",
+}
+
+USER_TEMPLATE = (
+    "You are {user_name}, {profile_desc}.\n\n"
+    "Based on your past experiences, you have the following preferences:\n"
+    "{preferences}\n"
+    "Based on the Big-5 personality traits, your personality is measured as:\n"
+    "{personality}\n"
+    "Your response should match your profile and personality, and be concise (no longer than 30 words).\n"
+    "You don't need to recommend anything, but feel free to express your personal interests."
+)
+
+ASSISTANT_TEMPLATE = (
+    "You are conversing with {user_name}, whose profile is below: \n## {profile_desc}\n\n"
+    "Your goal is to proactively lead the conversation with {user_name} towards the target <domain> \"{target}\".\n"
+    "To start the conversation, please begin with a greeting and avoid mentioning the target <domain>.\n"
+    "As the conversation progresses, use your domain knowledge to steer the discussed topic towards the target <domain> step by step.\n"
+    "Be informative and engaging while providing insights to arouse {user_name}'s interest.\n"
+    "Remember to ultimately recommend \"{target}\" as the focus of the conversation.\n"
+    "Your words at each turn should be concise (no longer than 30 words).\n\n"
+    "You may access the following domain knowledge for conversation: \n## {knowledge}."
+)
+
+MODERATOR_TEMPLATE = (
+    "You are the moderator of a conversation. You need to determine whether the discussion between Role-S and Role-U should come to an immediate end.\n"
+    "The conversation should conclude under the following two conditions:\n"
+    "(1) If Role-S completes <domain> recommendation on \"{target}\" and Role-U accepts it, and Role-S no longer takes the initiative for two rounds.\n"
+    "(2) If Role-U explicitly rejects Role-S's recommendation on \"{target}\" when Role-S has tried to recommend it for the second time.\n"
+    "In either of these cases, the conversation should be brought to an immediate end.\n\n"
+    "For example, here is a conversation:\n## {seed_continue}"
+    "Should the conversation end? The answer is no.\n\n"
+    "Here is another conversation:\n## {seed_end}"
+    "Should the conversation end? The answer is yes."
+)
+
+TERMINAL_TEMPLATE = "Now, for the above discussion between {assistant_name} (Role-S) and {user_name} (Role-U), should the conversation end? Answer yes or no."
+
+
+@lru_cache(maxsize=1024)
+def _personality_desc(traits):
+    # few distinct personalities are sampled, so their descriptions are shared by many dialogs
+    return "".join("For {}, you are {}.\n".format(k, v) for k, v in traits)
+
+
+class DomainTemplates:
+    """The templates of all roles compiled for a domain."""
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self.env_desc = ENV_DESCS[domain]
+        if domain == "movie" or domain == "music":
+            pref_keys = ["Accepted movies", "Accepted music", "Accepted celebrities", "Rejected movies", "Rejected music"]
         else:
-            profile_desc = "a retired woman in the age range of {}, living in {}".format(simulated_profile["Age Range"].lower(), simulated_profile["Residence"])
-    user_desc += profile_desc + ".\n\n"
-    
-    user_desc += "Based on your past experiences, you have the following preferences:\n"
-    if domain == "movie" or domain == "music":
-        for k in ["Accepted movies", "Accepted music", "Accepted celebrities", "Rejected movies", "Rejected music"]:
-            kk = k.replace("Accepted", "liked").replace("Rejected", "disliked")
-            user_desc += "Your {}: {}.\n".format(kk, simulated_profile[k]) if simulated_profile.get(k, "") != "" else ""
-    else:
-        for k in ["Accepted food", "Accepted POI"]:
-            kk = k.replace("Accepted", "liked")
-            user_desc += "Your {}: {}.\n".format(kk, simulated_profile[k]) if simulated_profile.get(k, "") != "" else ""
-    user_desc += "\n"
-
-    
-    user_desc += "Based on the Big-5 personality traits, your personality is measured as:\n"
-    for k, v in simulated_personality.items():
-        user_desc += "For {}, you are {}.\n".format(k, v)
-    user_desc += "\n"
-
-    user_desc += "Your response should match your profile and personality, and be concise (no longer than 30 words).\n"
-    user_desc += "You don't need to recommend anything, but feel free to express your personal interests."
-
-    gender_desc = "his" if simulated_profile["Gender"] == "Male" else "her"
-    if domain == "movie" or domain == "music":
-        for k in ["Accepted movies", "Accepted music", "Accepted celebrities", "Rejected movies", "Rejected music"]:
-            kk = k.replace("Accepted", "liked").replace("Rejected", "disliked")
-            profile_desc += "; {} {}: {}".format(gender_desc, kk, simulated_profile[k]) if simulated_profile.get(k, "") != "" else ""
-    else:
-        for k in ["Accepted food", "Accepted POI"]:
-            kk = k.replace("Accepted", "liked")
-            profile_desc += "; {} {}: {}".format(gender_desc, kk, simulated_profile[k]) if simulated_profile.get(k, "") != "" else ""
-    profile_desc += "."
-
-    user_dict = {
-        "name": simulated_profile["Name"],
-        "role_desc": user_desc,
-    }
-    
-    # Describe the assistant
-    if domain == "movie":
-        assistant_desc = "You are {}, a movie enthusiast who enjoys a variety of films.\n".format(assistant_name)
-    elif domain == "music":
-        assistant_desc = "You are {}, a music enthusiast who enjoys a variety of music.\n".format(assistant_name)
-    elif domain == "food":
-        assistant_desc = "You are {}, a foodie who enjoys delicious food.\n".format(assistant_name)
-    elif domain == "poi":
-        assistant_desc = "You are {}, a food enthusiast who is interested in exploring different restaurants.\n".format(assistant_name)
-    else:
+            pref_keys = ["Accepted food", "Accepted POI"]
+        # (slot key, the slot described in the instructions)
+        self.pref_slots = [(k, k.replace("Accepted", "liked").replace("Rejected", "disliked")) for k in pref_keys]
+
+        self.profiles = {key: Template(template) for key, template in PROFILE_TEMPLATES.items()}
+        self.user = Template(USER_TEMPLATE)
+        self.assistant = Template(ASSISTANT_INTROS[domain] + ASSISTANT_TEMPLATE.replace("<domain>", domain))
+        self.moderator = Template(MODERATOR_TEMPLATE.replace("<domain>", domain))
+        self.terminal = Template(TERMINAL_TEMPLATE)
+
+    def render(self, target, simulated_profile, simulated_personality, assistant_name, domain_knowledge,
+               seed_conversation, knowledge_format="repr"):
+        user_name = simulated_profile["Name"]
+        occupation = simulated_profile["Occupation"]
+        occupation = occupation if occupation in ("Student", "Employed") else "Retired"
+        gender = "Male" if simulated_profile["Gender"] == "Male" else "Female"
+        profile_desc = self.profiles[(occupation, gender)].render(
+            age=simulated_profile["Age Range"].lower(), residence=simulated_profile["Residence"])
+
+        prefs = [(kk, simulated_profile[k]) for k, kk in self.pref_slots if simulated_profile.get(k, "") != ""]
+        gender_desc = "his" if gender == "Male" else "her"
+
+        user_desc = self.user.render(
+            user_name=user_name,
+            profile_desc=profile_desc,
+            preferences="".join("Your {}: {}.\n".format(kk, v) for kk, v in prefs),
+            personality=_personality_desc(tuple(simulated_personality.items())),
+        )
+        assistant_desc = self.assistant.render(
+            assistant_name=assistant_name,
+            user_name=user_name,
+            profile_desc=profile_desc + "".join("; {} {}: {}".format(gender_desc, kk, v) for kk, v in prefs) + ".",
+            target=target[1],
+            knowledge=format_knowledge(domain_knowledge, knowledge_format),
+        )
+        moderator_desc = self.moderator.render(
+            target=target[1],
+            seed_continue=seed_conversation["seed_continue"],
+            seed_end=seed_conversation["seed_end"],
+        )
+        terminal_condition = self.terminal.render(assistant_name=assistant_name, user_name=user_name)
+
+        user_dict = {
+            "name": user_name,
+            "role_desc": user_desc,
+        }
+        assistant_dict = {
+            "name": assistant_name,
+            "role_desc": assistant_desc,
+        }
+        moderator_dict = {
+            "role_desc": moderator_desc,
+            "terminal_condition": terminal_condition
+        }
+        return (self.env_desc, user_dict, assistant_dict, moderator_dict)
+
+
+@lru_cache(maxsize=None)
+def get_templates(domain: str) -> DomainTemplates:
+    """Get the templates of a domain, compiled once."""
+    if domain not in DOMAINS:
         raise ValueError("Invalid domain: {}".format(domain))
-    
-    assistant_desc += "You are conversing with {}, whose profile is below: \n## {}\n\n".format(simulated_profile["Name"], profile_desc)
-    assistant_desc += "Your goal is to proactively lead the conversation with {} towards the target {} \"{}\".\n".format(simulated_profile["Name"], domain, target[1])
-    assistant_desc += "To start the conversation, please begin with a greeting and avoid mentioning the target {}.\n".format(domain)
-    assistant_desc += "As the conversation progresses, use your domain knowledge to steer the discussed topic towards the target {} step by step.\n".format(domain)
-    assistant_desc += "Be informative and engaging while providing insights to arouse {}'s interest.\n".format(simulated_profile["Name"])
-    assistant_desc += "Remember to ultimately recommend \"{}\" as the focus of the conversation.\n".format(target[1])
-    assistant_desc += "Your words at each turn should be concise (no longer than 30 words).\n\n"
-    assistant_desc += "You may access the following domain knowledge for conversation: \n## {}.".format(domain_knowledge)
-
-    assistant_dict = {
-        "name": assistant_name,
-        "role_desc": assistant_desc,
-    }
-    
-    # Describe the moderator
-    moderator_desc = "You are the moderator of a conversation. You need to determine whether the discussion between Role-S and Role-U should come to an immediate end.\n"
-    moderator_desc += "The conversation should conclude under the following two conditions:\n"
-    moderator_desc += "(1) If Role-S completes {} recommendation on \"{}\" and Role-U accepts it, and Role-S no longer takes the initiative for two rounds.\n".format(domain, target[1])
-    moderator_desc += "(2) If Role-U explicitly rejects Role-S's recommendation on \"{}\" when Role-S has tried to recommend it for the second time.\n".format(target[1])
-    moderator_desc += "In either of these cases, the conversation should be brought to an immediate end.\n\n"
-
-    moderator_desc += "For example, here is a conversation:\n## {}".format(seed_conversation["seed_continue"])
-    moderator_desc += "Should the conversation end? The answer is no.\n\n"
-    moderator_desc += "Here is another conversation:\n## {}".format(seed_conversation["seed_end"])
-    moderator_desc += "Should the conversation end? The answer is yes."
-
-    
-    terminal_condition = "Now, for the above discussion between {} (Role-S) and {} (Role-U), should the conversation end? Answer yes or no.".format(assistant_name, simulated_profile["Name"])
-
-    moderator_dict = {
-        "role_desc": moderator_desc,
-        "terminal_condition": terminal_condition
-    }
-
-    return (env_desc, user_dict, assistant_dict, moderator_dict)
+    return DomainTemplates(domain)
+
+
+def create_instruct(
+        target: List[str],
+        simulated_profile: dict,
+        simulated_personality: dict,
+        assistant_name: str,
+        domain_knowledge: List[List],
+        seed_conversation: dict,
+        knowledge_format: str = "repr"
+    ):
+    """Create instructions about the conversation environment and roles."""
+    templates = get_templates(get_domain(target))
+    return templates.render(target, simulated_profile, simulated_personality, assistant_name,
+                            domain_knowledge, seed_conversation, knowledge_format=knowledge_format)
+
+
+def create_instructs(
+        targets: Sequence[List[str]],
+        simulated_profiles: Sequence[dict],
+        simulated_personalities: Sequence[dict],
+        assistant_names: Sequence[str],
+        domain_knowledges: Sequence[List[List]],
+        seed_conversations: Sequence[dict],
+        knowledge_format: str = "repr"
+    ):
+    """Create the instructions of a batch of dialogs, given the columns of the inputs of create_instruct."""
+    columns = (targets, simulated_profiles, simulated_personalities, assistant_names, domain_knowledges,
+               seed_conversations)
+    assert all(len(column) == len(targets) for column in columns), "All input columns should have the same length"
+    return [get_templates(get_domain(row[0])).render(*row, knowledge_format=knowledge_format) for row in zip(*columns)]
@@ -0,0 +1,26 @@
+import os
+import sys
+import threading
+
+import pytest
+
+# The eval scripts import each other as top-level modules
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, "eval")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def stub_server():
+    """a local chat-completions server, see chatarena/stub_server.py"""
+    from chatarena.backends.resilience import reset_guards
+    from chatarena.stub_server import StubServer
+
+    server = StubServer(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    reset_guards()
@@ -0,0 +1,115 @@
+import pytest
+
+from chatarena.agent import Moderator, Player
+from chatarena.arena import Arena, ArenaPool
+from chatarena.backends import OpenAIChat
+from chatarena.environments.conversation import ModeratedConversation
+
+
+def make_factory(api_base):
+    def create_arena(global_prompt, players, environment):
+        backend = OpenAIChat(api_base=api_base)
+        arena_players = [Player(backend=backend, global_prompt=global_prompt, **kwargs) for kwargs in players]
+        moderator = Moderator(backend=backend, **environment["moderator"])
+        env = ModeratedConversation(player_names=[player.name for player in arena_players], moderator=moderator,
+                                    moderator_period="round")
+        return Arena(players=arena_players, environment=env, global_prompt=global_prompt)
+    return create_arena
+
+
+def game(idx):
+    return dict(global_prompt=f"Game {idx}",
+                players=[dict(name=f"Alice{idx}", role_desc="You are Alice."),
+                         dict(name=f"Bob{idx}", role_desc="You are Bob.")],
+                environment=dict(moderator=dict(role_desc="You are the moderator.",
+                                                terminal_condition="Is the conversation over? Answer yes or no.")))
+
+
+def test_reset_is_unconditional(stub_server):
+    arena = make_factory(stub_server.api_base)(**game(0))
+    old_uuid = arena.uuid
+    arena.reset()
+    assert arena.uuid != old_uuid
+
+    arena.run_until_terminal(max_steps=2, reset=False)
+    assert len(arena.environment.get_observation()) == 2
+    arena.reset()
+    assert arena.environment.get_observation() == []
+
+
+def test_pool_acquires_ready_arenas(stub_server):
+    pool = ArenaPool(make_factory(stub_server.api_base))
+    arena = pool.acquire(**game(0))
+    run = arena.run_until_terminal(max_steps=2, reset=False)
+    assert [msg.agent_name for msg in run.messages] == ["Alice0", "Bob0"]
+    old_uuid = arena.uuid
+    pool.release(arena)
+
+    reused = pool.acquire(**game(1))
+    assert reused is arena and pool.num_created == 1
+    assert reused.uuid != old_uuid
+    assert reused.environment.get_observation() == []
+    run = reused.run_until_terminal(max_steps=2, reset=False)
+    assert [msg.agent_name for msg in run.messages] == ["Alice1", "Bob1"]
+    assert all(player.global_prompt == "Game 1" for player in reused.players)
+
+
+def test_vector_arena_coalesces_backends_of_the_same_config(stub_server, monkeypatch):
+    from chatarena.arena import VectorArena
+    from chatarena.metrics import MetricsRecorder
+
+    batch_sizes = []
+    batch_query = OpenAIChat.batch_query
+
+    def counting_batch_query(self, queries, *args, **kwargs):
+        batch_sizes.append(len(queries))
+        return batch_query(self, queries, *args, **kwargs)
+
+    monkeypatch.setattr(OpenAIChat, "batch_query", counting_batch_query)
+
+    factory = make_factory(stub_server.api_base)
+    arenas = [factory(**game(idx)) for idx in range(3)]  # each arena has its own backend
+    recorders = []
+    for arena in arenas:
+        recorders.append(MetricsRecorder())
+        for player in arena.players:
+            player.backend.attach_metrics(recorders[-1], role="player")
+
+    with VectorArena(arenas) as vector_arena:
+        assert vector_arena.max_workers == 3
+        runs = vector_arena.run_until_terminal(max_steps=2, reset=False)
+
+    assert batch_sizes == [3, 3]
+    for idx, run in enumerate(runs):
+        assert run.error is None
+        assert [msg.agent_name for msg in run.messages] == [f"Alice{idx}", f"Bob{idx}"]
+    # each query is still recorded by the backend of its own arena: two players and one moderator call
+    assert all(recorder.to_dict()["player/gpt-3.5-turbo"]["calls"] == 3 for recorder in recorders)
+
+
+def test_backend_error_marks_the_run(stub_server):
+    stub_server.error_rate, stub_server.error_status = 1., 400  # a fatal error, which is not retried
+    pool = ArenaPool(make_factory(stub_server.api_base))
+    arena = pool.acquire(**game(0))
+    run = arena.run_until_terminal(max_steps=4, reset=False)
+    assert run.terminal
+    assert run.error.startswith("FatalBackendError")
+    assert arena.backend_error is arena.players[0].backend_error is not None
+    pool.release(arena)
+
+    stub_server.error_rate = 0.
+    reused = pool.acquire(**game(1))
+    assert reused.backend_error is None
+    run = reused.run_until_terminal(max_steps=2, reset=False)
+    assert run.error is None
+
+
+def test_cli_runs_pooled_arenas_without_another_reset(stub_server, monkeypatch):
+    pytest.importorskip("rich")
+    pool = ArenaPool(make_factory(stub_server.api_base))
+    arena = pool.acquire(**game(0))
+    old_uuid = arena.uuid
+    monkeypatch.setattr(arena, "reset", lambda: pytest.fail("the pooled arena was reset again"))
+    arena.launch_cli(max_steps=2, interactive=False, show_description=False, show_message=False, reset=False)
+    assert arena.uuid == old_uuid
+    assert [msg.agent_name for msg in arena.environment.get_observation()] == ["Alice0", "Bob0"]
@@ -0,0 +1,43 @@
+import warnings
+
+import pytest
+
+from bleu import sentence_bleu_scores
+
+bleu_score = pytest.importorskip("nltk.translate.bleu_score")
+
+CASES = [
+    # (hypothesis, reference)
+    ("the cat sat on the mat", "the cat sat on the mat"),
+    ("the cat sat on the mat today", "a cat sat on a mat"),
+    ("the the the the", "the cat sat on the mat"),
+    ("dog", "the cat sat on the mat"),
+    ("cat", "the cat sat on the mat"),
+    ("cat sat", "the cat sat on the mat"),
+    ("sat cat", "the cat sat on the mat"),
+    ("", "the cat sat on the mat"),
+    ("i would recommend the movie inception to you", "i recommend inception"),
+    ("hello", "hello"),
+]
+
+
+def nltk_scores(hyp, ref):
+    smoothing = bleu_score.SmoothingFunction().method1
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return [bleu_score.sentence_bleu([ref], hyp, weights=weights, smoothing_function=smoothing)
+                for weights in ((1, 0, 0, 0), (0, 1, 0, 0))]
+
+
+def test_matches_nltk():
+    hyps = [hyp.split() for hyp, _ in CASES]
+    refs = [ref.split() for _, ref in CASES]
+    scores = sentence_bleu_scores(hyps, refs, max_n=2)
+
+    assert scores.shape == (len(CASES), 2)
+    for (hyp, ref), row in zip(zip(hyps, refs), scores):
+        assert list(row) == pytest.approx(nltk_scores(hyp, ref), abs=1e-12), (hyp, ref)
+
+
+def test_empty_batch():
+    assert sentence_bleu_scores([], [], max_n=2).shape == (0, 2)
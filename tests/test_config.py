@@ -0,0 +1,81 @@
+import copy
+import pickle
+import uuid
+
+import pytest
+
+from chatarena.agent import Player
+from chatarena.backends import OpenAIChat
+from chatarena.config import AgentConfig, BackendConfig, Config, FrozenConfig
+
+PLAYER = {"name": "Alice", "role_desc": "You are Alice.", "global_prompt": None,
+          "backend": {"backend_type": "openai-chat", "temperature": 0.7, "stop": ["<EOS>", "\n"]}}
+REORDERED = {"backend": {"stop": ["<EOS>", "\n"], "temperature": 0.7, "backend_type": "openai-chat"},
+             "global_prompt": None, "role_desc": "You are Alice.", "name": "Alice"}
+
+
+def test_frozen_config_is_immutable():
+    frozen = FrozenConfig(PLAYER)
+    assert isinstance(frozen["backend"], FrozenConfig)
+    assert frozen.backend.stop == ("<EOS>", "\n")
+
+    mutators = [
+        lambda: frozen.__setitem__("name", "Bob"),
+        lambda: frozen.__delitem__("name"),
+        lambda: setattr(frozen, "name", "Bob"),
+        lambda: delattr(frozen, "name"),
+        lambda: frozen.update(name="Bob"),
+        lambda: frozen.pop("name"),
+        lambda: frozen.popitem(),
+        lambda: frozen.clear(),
+        lambda: frozen.setdefault("other", 1),
+        lambda: frozen.backend.__setitem__("temperature", 0.),
+    ]
+    for mutate in mutators:
+        with pytest.raises(TypeError):
+            mutate()
+    with pytest.raises(TypeError):
+        frozen |= {"name": "Bob"}
+    assert frozen == FrozenConfig(PLAYER)
+    assert copy.copy(frozen) is frozen and copy.deepcopy(frozen) is frozen
+    assert pickle.loads(pickle.dumps(frozen)) == frozen
+
+
+def test_digest_is_stable_across_key_order():
+    frozen, reordered = FrozenConfig(PLAYER), FrozenConfig(REORDERED)
+    assert frozen.to_json() == reordered.to_json()
+    assert frozen.digest == reordered.digest
+    assert hash(frozen) == hash(reordered)
+    assert len({frozen, reordered}) == 1
+
+    namespace = uuid.uuid4()
+    assert frozen.config_id(namespace) == reordered.config_id(namespace)
+    assert frozen.config_id(namespace) != frozen.without("name").config_id(namespace)
+    assert FrozenConfig(PLAYER, name="Bob").digest != frozen.digest
+
+
+def test_thaw_round_trip():
+    frozen = Config(PLAYER).freeze()
+    config = frozen.thaw()
+    assert isinstance(config, AgentConfig) and isinstance(config.backend, BackendConfig)
+    assert config.backend.stop == ["<EOS>", "\n"]
+    config.name = "Bob"  # mutable again
+    assert frozen.name == "Alice"
+    config.name = "Alice"
+    assert config.freeze() == frozen and config.freeze().digest == frozen.digest
+
+
+def test_freeze_is_cached_until_reconfigured():
+    backend = OpenAIChat(api_base="http://localhost:8000/v1")
+    player = Player(name="Alice", role_desc="You are Alice.", backend=backend)
+    frozen = player.freeze()
+    assert player.freeze() is frozen
+
+    player.reconfigure(role_desc="You are Alice, a pilot.")
+    reconfigured = player.freeze()
+    assert reconfigured is not frozen and reconfigured.role_desc == "You are Alice, a pilot."
+
+    backend_frozen = backend.freeze()
+    backend.reconfigure(temperature=0.1)
+    assert backend.freeze() is not backend_frozen and backend.freeze().temperature == 0.1
+    assert player.freeze() is not reconfigured and player.freeze().backend.temperature == 0.1
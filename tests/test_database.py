@@ -0,0 +1,104 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from chatarena.database import BatchWriter
+
+
+class BlockingInsert:
+    """An insert_fn that blocks until released, to fill up the queue of the writer"""
+
+    def __init__(self):
+        self.rows = []
+        self.release = threading.Event()
+
+    def __call__(self, table, rows):
+        self.release.wait(timeout=10)
+        self.rows.extend(rows)
+
+
+def test_flush_after_close_returns():
+    insert = BlockingInsert()
+    insert.release.set()
+    writer = BatchWriter(insert, batch_size=10, flush_interval=60)
+    writer.put("Message", [{"id": 1}])
+    writer.close()
+
+    done = threading.Event()
+    threading.Thread(target=lambda: (writer.flush(), done.set()), daemon=True).start()
+    assert done.wait(timeout=5), "flush() blocked after close()"
+    assert insert.rows == [{"id": 1}]
+
+
+def test_rows_are_counted_before_they_are_inserted(monkeypatch):
+    depths = []
+    inserted = threading.Event()
+
+    def insert(table, rows):
+        depths.append(writer.queue_depth)
+        inserted.set()
+
+    writer = BatchWriter(insert, batch_size=1, flush_interval=60)
+    put = writer._queue.put
+
+    def put_then_wait_for_insert(item, block=True, timeout=None):
+        put(item, block=block, timeout=timeout)
+        inserted.wait(timeout=5)  # the writer thread inserts the rows before put() returns
+
+    monkeypatch.setattr(writer._queue, "put", put_then_wait_for_insert)
+    writer.put("Message", [{"id": 1}])
+    assert depths == [1]
+    writer.close()
+    assert writer.queue_depth == 0
+
+
+def test_put_nonblocking_full_queue_keeps_depth():
+    insert = BlockingInsert()
+    writer = BatchWriter(insert, batch_size=1, flush_interval=60, max_queue_size=1)
+    try:
+        writer.put("Message", [{"id": 0}])  # taken by the worker, which blocks in insert_fn
+        while writer._queue.qsize() > 0:
+            time.sleep(0.001)
+        writer.put("Message", [{"id": 1}])  # fills the queue
+        depth = writer.queue_depth
+        with pytest.raises(queue.Full):
+            writer.put("Message", [{"id": 2}], block=False)
+        assert writer.queue_depth == depth
+    finally:
+        insert.release.set()
+        writer.close()
+    assert writer.queue_depth == 0
+    assert [row["id"] for row in insert.rows] == [0, 1]
+
+
+def test_datastore_is_abstract():
+    from chatarena.database import Datastore
+
+    with pytest.raises(TypeError):
+        Datastore(async_writes=False)
+
+
+def test_parquet_sink_appends_parts(tmp_path):
+    pytest.importorskip("pyarrow")
+    from chatarena.database import ParquetSink
+
+    rows = [{"message_id": str(i), "arena_id": "a", "agent_name": "Alice", "content": f"hi {i}", "turn": i,
+             "timestamp": str(i), "msg_type": "text", "visible_to": "all"} for i in range(4)]
+    output_dir = str(tmp_path)
+
+    sink = ParquetSink(output_dir, async_writes=False)
+    sink.insert_rows("Message", rows[:2])
+    sink.flush()  # readable without close()
+    assert ParquetSink.read_table(output_dir, "Message").num_rows == 2
+    sink.insert_rows("Message", rows[2:3])
+    sink.close()
+
+    # Reopening appends a new part instead of truncating the table
+    sink = ParquetSink(output_dir)
+    sink.insert_rows("Message", rows[3:])
+    sink.close()
+    table = ParquetSink.read_table(output_dir, "Message", columns=["message_id"])
+    assert table.column("message_id").to_pylist() == ["0", "1", "2", "3"]
+    assert len(ParquetSink.part_paths(output_dir, "Message")) == 3
@@ -0,0 +1,76 @@
+import pytest
+
+from dataset_io import SeedList, SeedReader, _Sink, iter_dialogs, open_sink, read_seeds
+
+RECORDS = [
+    # The first record lacks fields that the later ones have, and original_goal changes type
+    {"id": "s_1", "user_profile": {"Name": "Alice"}, "knowledge": [["Inception", "Director", "Nolan"]],
+     "target": ["Movie recommendation", "Inception"], "conversation": [{"system": "Hi!"}]},
+    {"id": "s_2", "original_goal": "Greet the user", "user_profile": {"Name": "Bob"}, "knowledge": [],
+     "target": ["Play music", "Yesterday"], "conversation": [], "user_personality": {"openness": "curious"}},
+    {"id": "s_3", "original_goal": ["Greet", "Recommend"], "user_profile": None,
+     "knowledge": [["Yesterday", "Singer", "The Beatles"], ["Yesterday", "Type", "Pop"]],
+     "target": ["Play music", "Yesterday"], "conversation": [{"user": "Hello"}, {"system": "Hi"}]},
+]
+
+
+def test_sink_is_abstract():
+    with pytest.raises(TypeError):
+        _Sink("unused.jsonl")
+
+
+@pytest.mark.parametrize("output_format", ["jsonl", "parquet"])
+def test_round_trip(tmp_path, output_format):
+    if output_format == "parquet":
+        pytest.importorskip("pyarrow")
+    kwargs = {"row_group_size": 2} if output_format == "parquet" else {}
+    with open_sink(str(tmp_path / "dialogue_dev.jsonl"), output_format, **kwargs) as sink:
+        for record in RECORDS:
+            sink.write(record)
+    assert list(iter_dialogs(sink.path)) == RECORDS
+
+
+def test_parquet_empty_file_and_undeclared_field(tmp_path):
+    pytest.importorskip("pyarrow")
+    with open_sink(str(tmp_path / "empty.jsonl"), "parquet") as sink:
+        pass
+    assert list(iter_dialogs(sink.path)) == []
+
+    with open_sink(str(tmp_path / "bad.jsonl"), "parquet") as sink:
+        with pytest.raises(ValueError):
+            sink.write({"id": "s_1", "undeclared": 1})
+
+
+def test_seed_reader_skips_blank_lines(tmp_path):
+    path = tmp_path / "seeds.jsonl"
+    path.write_bytes(b'\n{"id": "a"}\n  \t\r\n {"id": "b"}\r\n\n{"id": "c"}')
+    with SeedReader(str(path)) as reader:
+        assert [record["id"] for record in reader] == ["a", "b", "c"]
+        assert reader.get_by_id("b") == {"id": "b"}
+
+
+def test_seed_reader_view_does_not_close_parent(tmp_path):
+    path = tmp_path / "seeds.jsonl"
+    path.write_text("".join('{"id": %d}\n' % i for i in range(6)))
+    with SeedReader(str(path)) as reader:
+        with reader.shard(num_shards=2, shard_id=1) as view:
+            assert [record["id"] for record in view] == [1, 3, 5]
+        assert reader[0] == {"id": 0}
+    assert reader._file.closed
+
+
+def test_read_seeds_is_closeable(tmp_path):
+    with open_sink(str(tmp_path / "seeds.jsonl"), "jsonl.zst" if _has_zstd() else "jsonl") as sink:
+        for record in RECORDS:
+            sink.write(record)
+    with read_seeds(sink.path) as seeds:
+        assert list(seeds) == RECORDS
+        assert isinstance(seeds, SeedList if sink.path.endswith(".zst") else SeedReader)
+
+
+def _has_zstd():
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return False
+    return True
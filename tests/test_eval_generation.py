@@ -0,0 +1,68 @@
+import csv
+import json
+
+import pytest
+
+from eval_generation import evaluate_streaming, evaluate_systems, save_leaderboard
+
+GOLD = [
+    {"id": 0, "target": ["Movie recommendation", "Inception"], "response": "Hello! Do you like movies?",
+     "knowledge": [["Inception", "Director", "Christopher Nolan"]], "user_profile": {"Name": "Alice"}},
+    {"id": 0, "target": ["Movie recommendation", "Inception"], "response": "You should watch Inception.",
+     "knowledge": [["Inception", "Director", "Christopher Nolan"]], "user_profile": {"Name": "Alice"}},
+    {"id": 1, "target": ["Play music", "Yesterday"], "response": "Let me play Yesterday for you.",
+     "knowledge": [["Yesterday", "Singer", "The Beatles"]], "user_profile": {"Name": "Bob"}},
+]
+SYSTEMS = {
+    "good": ["Hello! Do you like movies?", "You should watch Inception by Christopher Nolan.",
+             "Let me play Yesterday for you."],
+    "bad": ["Hi.", "I do not know.", "Goodbye."],
+}
+
+
+def write_jsonl(fp, samples):
+    with open(fp, "w", encoding="utf-8") as fw:
+        for sample in samples:
+            fw.write(json.dumps(sample) + "\n")
+
+
+@pytest.fixture
+def leaderboard(tmp_path):
+    gold_fp = str(tmp_path / "gold.jsonl")
+    write_jsonl(gold_fp, GOLD)
+    eval_fps = []
+    for name, responses in SYSTEMS.items():
+        eval_fps.append(str(tmp_path / f"{name}.jsonl"))
+        write_jsonl(eval_fps[-1], [{"response": response} for response in responses])
+    return evaluate_systems(eval_fps, gold_fp, num_workers=1, cache_dir="", sort_by="avg_bleu", bootstrap=50)
+
+
+def test_bootstrap_leaderboard(leaderboard):
+    assert [results["system"].rsplit("/", 1)[-1] for results in leaderboard] == ["good.jsonl", "bad.jsonl"]
+    assert leaderboard[0]["p_value_vs_top"] is None
+    assert 0 <= leaderboard[1]["p_value_vs_top"] <= 1
+    assert len({tuple(results) for results in leaderboard}) == 1  # the same columns in every row
+
+
+def test_save_bootstrap_leaderboard_csv(leaderboard, tmp_path):
+    fp = str(tmp_path / "leaderboard.csv")
+    save_leaderboard(leaderboard, fp)
+    with open(fp, encoding="utf-8", newline="") as fr:
+        rows = list(csv.DictReader(fr))
+
+    assert len(rows) == 2
+    assert "p_value_vs_top" in rows[0] and "succ_low" in rows[0]
+    assert rows[0]["p_value_vs_top"] == ""
+    assert float(rows[1]["p_value_vs_top"]) == leaderboard[1]["p_value_vs_top"]
+
+
+def test_streaming_matches_batch_without_target_turns(tmp_path):
+    # no gold response mentions its target, so there is no target turn to hit
+    gold = [dict(sample, target=[sample["target"][0], "Titanic"]) for sample in GOLD]
+    gold_fp, eval_fp = str(tmp_path / "gold.jsonl"), str(tmp_path / "good.jsonl")
+    write_jsonl(gold_fp, gold)
+    write_jsonl(eval_fp, [{"response": response} for response in SYSTEMS["good"]])
+
+    streaming = evaluate_streaming(eval_fp, gold_fp)
+    batch, = evaluate_systems([eval_fp], gold_fp, num_workers=1, cache_dir="")
+    assert streaming["succ"] is None and batch["succ"] is None
@@ -0,0 +1,117 @@
+from types import SimpleNamespace
+
+import pytest
+
+from chatarena.backends import hf_transformers
+from chatarena.message import Message
+
+MODEL = "microsoft/DialoGPT-small"
+
+# Prompts of different lengths, so that the shorter ones are padded in the batch
+HISTORIES = [
+    [Message(agent_name="User", content="Hi!", turn=1)],
+    [Message(agent_name="User", content="Can you recommend a movie for tonight? I like thrillers.", turn=1)],
+    [Message(agent_name="User", content="Hello, how are you?", turn=1),
+     Message(agent_name="Bot", content="Fine, thanks.", turn=2),
+     Message(agent_name="User", content="What is your favorite food?", turn=3)],
+]
+QUERIES = [dict(agent_name="Bot", role_desc="You are a helpful bot.", history_messages=history)
+           for history in HISTORIES]
+
+
+class FakeConversation:
+    def __init__(self, text, past_user_inputs, generated_responses):
+        self.text = text
+        self.past_user_inputs = past_user_inputs
+        self.generated_responses = list(generated_responses)
+
+
+class FakeTokenizer:
+    def __init__(self):
+        self.pad_token = None
+        self.eos_token = "<eos>"
+        self.padding_side = "right"
+
+    def pad(self, sequences):
+        if self.pad_token is None:
+            raise ValueError("Asking to pad but the tokenizer does not have a padding token.")
+        width = max(len(sequence) for sequence in sequences)
+        padding = [[self.pad_token] * (width - len(sequence)) for sequence in sequences]
+        if self.padding_side == "left":
+            return [pad + sequence for pad, sequence in zip(padding, sequences)]
+        return [sequence + pad for pad, sequence in zip(padding, sequences)]
+
+
+class FakePipeline:
+    """
+    A conversational pipeline whose reply depends on the padded input the way a real model's does:
+    a decoder-only model continues after the last token, an encoder-decoder model with absolute positions
+    reads each token at its position.
+    """
+
+    def __init__(self, is_encoder_decoder):
+        self.model = SimpleNamespace(config=SimpleNamespace(is_encoder_decoder=is_encoder_decoder))
+        self.tokenizer = FakeTokenizer()
+
+    def _reply(self, tokens):
+        if self.model.config.is_encoder_decoder:
+            return str(sum(position * ord(token) for position, token in enumerate(tokens)
+                           if token != self.tokenizer.pad_token))
+        return f"after {tokens[-1]}"
+
+    def __call__(self, conversations, batch_size=1):
+        single = not isinstance(conversations, list)
+        if single:
+            conversations = [conversations]
+        inputs = [list(" ".join(conversation.past_user_inputs + [conversation.text]))
+                  for conversation in conversations]
+        if len(inputs) > 1:
+            inputs = self.tokenizer.pad(inputs)
+        for conversation, tokens in zip(conversations, inputs):
+            conversation.generated_responses.append(self._reply(tokens))
+        return conversations[0] if single else conversations
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    def create(is_encoder_decoder):
+        monkeypatch.setattr(hf_transformers, "Conversation", FakeConversation)
+        monkeypatch.setattr(hf_transformers, "pipeline",
+                            lambda task, model, device: FakePipeline(is_encoder_decoder))
+        return hf_transformers.TransformersConversational(model="fake")
+    return create
+
+
+@pytest.mark.parametrize("is_encoder_decoder", [False, True])
+def test_batched_replies_match_single(fake_backend, is_encoder_decoder):
+    backend = fake_backend(is_encoder_decoder)
+    tokenizer = backend.chatbot.tokenizer
+    if is_encoder_decoder:
+        assert tokenizer.padding_side == "right"
+        tokenizer.pad_token = "<pad>"  # as set by the encoder-decoder tokenizers
+    else:
+        assert tokenizer.padding_side == "left" and tokenizer.pad_token == tokenizer.eos_token
+
+    single = [backend.query(**query) for query in QUERIES]
+    assert backend.batch_query(QUERIES) == single
+
+
+@pytest.fixture(scope="module")
+def backend():
+    pytest.importorskip("transformers")
+    pytest.importorskip("torch")
+    try:
+        return hf_transformers.TransformersConversational(model=MODEL)
+    except OSError as e:  # the model is not cached and cannot be downloaded
+        pytest.skip(f"{MODEL} is not available: {e}")
+
+
+def test_left_padding(backend):
+    assert backend.chatbot.tokenizer.padding_side == "left"
+    assert backend.chatbot.tokenizer.pad_token is not None
+
+
+def test_batched_outputs_match_single(backend):
+    single = [backend.query(**query) for query in QUERIES]
+    batched = backend.batch_query(QUERIES)
+    assert batched == single
@@ -0,0 +1,38 @@
+import threading
+
+from chatarena.metrics import CallStats, MetricsRecorder
+
+
+def test_to_prometheus_escapes_label_values():
+    recorder = MetricsRecorder()
+    recorder.record('Us"er\\1', "org/model\nv2", CallStats(attempts=2, wall_time=0.5, prompt_tokens=3))
+    text = recorder.to_prometheus()
+
+    assert 'chatarena_backend_calls{role="Us\\"er\\\\1",model="org/model\\nv2"} 1' in text
+    assert 'chatarena_backend_retries{role="Us\\"er\\\\1",model="org/model\\nv2"} 1' in text
+    # Each sample stays on its own line
+    assert all(line.startswith(("# TYPE", "chatarena_backend_")) for line in text.splitlines())
+
+
+def test_merge_self_and_cross_merges_do_not_deadlock():
+    a, b = MetricsRecorder(), MetricsRecorder()
+    a.record("user", "model", CallStats())
+    b.record("user", "model", CallStats())
+
+    def merge_many(into, other, times):
+        for _ in range(times):
+            into.merge(other)
+
+    threads = [threading.Thread(target=merge_many, args=(a, a, 1), daemon=True)]
+    threads[0].start()
+    threads[0].join(timeout=10)
+    assert not threads[0].is_alive(), "a.merge(a) deadlocked"
+    assert a.to_dict()["user/model"]["calls"] == 1
+
+    threads += [threading.Thread(target=merge_many, args=(into, other, 1000), daemon=True)
+                for into, other in ((a, b), (b, a))]
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads[1:]:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads), "the merges deadlocked"
@@ -0,0 +1,17 @@
+from chatarena.backends import OpenAIChat
+from chatarena.backends import openai
+
+
+def test_openai_key_is_only_sent_to_the_official_api(monkeypatch):
+    monkeypatch.setattr(openai, "OPENAI_API_KEY", "sk-openai")
+
+    headers, _ = OpenAIChat(api_base=openai.OPENAI_OFFICIAL_API_BASE)._request([])
+    assert headers["Authorization"] == "Bearer sk-openai"
+
+    headers, _ = OpenAIChat(api_base="http://localhost:8000/v1")._request([])
+    assert "Authorization" not in headers
+
+    backend = OpenAIChat(api_base="http://localhost:8000/v1", api_key="sk-local")
+    headers, _ = backend._request([])
+    assert headers["Authorization"] == "Bearer sk-local"
+    assert "api_key" not in backend.to_config()
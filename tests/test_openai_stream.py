@@ -0,0 +1,70 @@
+import pytest
+
+from chatarena.backends import OpenAIChat
+from chatarena.backends import resilience
+from chatarena.backends.openai import StreamCutter
+from chatarena.message import MODERATOR_NAME, SYSTEM_NAME, Message
+
+ROLES = ("Alice", "Bob", SYSTEM_NAME, MODERATOR_NAME)
+
+
+def stream(text, agent_name="Alice", role_names=ROLES, chunk_size=1):
+    cutter = StreamCutter(agent_name, role_names)
+    released = "".join(cutter.feed(text[idx:idx + chunk_size]) for idx in range(0, len(text), chunk_size))
+    return released + cutter.finish(), cutter
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_cut_only_on_role_names(chunk_size):
+    released, cutter = stream("Price is [10]: cheap, see [note]: here.", chunk_size=chunk_size)
+    assert released == "Price is [10]: cheap, see [note]: here."
+    assert not cutter.stopped
+
+    released, cutter = stream("Hello Bob! [Bob]: Hi Alice!", chunk_size=chunk_size)
+    assert released == "Hello Bob! "
+    assert cutter.stopped
+
+
+@pytest.mark.parametrize("chunk_size", [1, 4, 100])
+def test_strip_leading_prefix_and_end_of_message(chunk_size):
+    released, cutter = stream("[Alice]: Hi there<EOS> [Bob]: ignored", chunk_size=chunk_size)
+    assert released == "Hi there"
+    assert cutter.stopped
+
+
+def test_query_keeps_bracketed_text(stub_server):
+    stub_server.reply = "The ticket is [10]: cheap enough."
+    backend = OpenAIChat(api_base=stub_server.api_base, stream=True)
+    deltas = []
+    backend.add_listener(lambda agent_name, delta, done, retry: deltas.append(delta))
+    history = [Message(agent_name="Bob", content="How much is it?", turn=1)]
+    response = backend.query(agent_name="Alice", role_desc="You sell tickets.", history_messages=history)
+    assert response == "The ticket is [10]: cheap enough."
+    assert "".join(deltas) == response
+
+
+def test_failed_attempt_is_discarded_by_listeners(stub_server, monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda *args, **kwargs: 0.)
+    stream_ = OpenAIChat._stream
+    attempts = []
+
+    def flaky_stream(self, messages, agent_name, cutter):
+        attempts.append(1)
+        if len(attempts) == 1:
+            self._notify(agent_name, cutter.feed("That sounds interesting, "))
+            raise ConnectionError("connection reset midway")
+        return stream_(self, messages, agent_name, cutter)
+
+    monkeypatch.setattr(OpenAIChat, "_stream", flaky_stream)
+    backend = OpenAIChat(api_base=stub_server.api_base, stream=True)
+    events = []
+    backend.add_listener(lambda agent_name, delta, done, retry: events.append((delta, done, retry)))
+    response = backend.query(agent_name="Alice", role_desc="You are Alice.", history_messages=[])
+
+    assert len(attempts) == 2
+    retry_at = [idx for idx, (_, _, retry) in enumerate(events) if retry]
+    assert len(retry_at) == 1
+    # the text after the retry signal is the whole response, sent once
+    after = events[retry_at[0] + 1:]
+    assert "".join(delta for delta, _, _ in after) == response
+    assert after[-1][1] is True
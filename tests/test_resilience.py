@@ -0,0 +1,135 @@
+import time
+from email.utils import format_datetime
+import datetime
+
+import pytest
+
+from chatarena.backends import resilience
+from chatarena.backends.resilience import (CircuitBreaker, CircuitOpenError, FatalBackendError, RetriesExhausted,
+                                           classify_error, get_guard, parse_retry_after, reset_guards, resilient)
+
+
+class Response:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class HTTPError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.response = Response(status_code, headers)
+
+
+class RateLimitError(Exception):
+    pass
+
+
+class BadRequestError(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def guards(monkeypatch):
+    monkeypatch.setattr(resilience, "backoff_delay", lambda *args, **kwargs: 0.)
+    yield
+    reset_guards()
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (HTTPError(429), True),
+    (HTTPError(503), True),
+    (HTTPError(408), True),
+    (HTTPError(400), False),
+    (HTTPError(401), False),
+    (RateLimitError("slow down"), True),
+    (BadRequestError("bad"), False),
+    (TimeoutError(), True),
+    (ConnectionError(), True),
+    (ValueError("bug"), False),
+    (KeyError("bug"), False),
+    (RuntimeError("unknown"), True),
+])
+def test_classify_error(error, retryable):
+    assert classify_error(error) == (retryable, None)
+
+
+def test_classify_error_reads_retry_after():
+    assert classify_error(HTTPError(429, {"retry-after": "7"})) == (True, 7.)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after({}) is None
+    assert parse_retry_after({"retry-after": "3"}) == 3.
+    assert parse_retry_after({"retry-after": "-3"}) == 0.
+    assert parse_retry_after({"retry-after-ms": "1500", "retry-after": "3"}) == 1.5
+    assert parse_retry_after({"retry-after-ms": "soon", "retry-after": "3"}) == 3.
+    assert parse_retry_after({"retry-after": "soon"}) is None
+
+    date = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=30)
+    assert 25 < parse_retry_after({"retry-after": format_datetime(date, usegmt=True)}) <= 30
+    date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=30)
+    assert parse_retry_after({"retry-after": format_datetime(date, usegmt=True)}) == 0.
+
+
+def test_breaker_transitions():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.before_call()
+    assert not breaker.record_failure() and breaker.state == "closed"
+    breaker.before_call()
+    assert breaker.record_failure() and breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()  # the trial call
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # a single trial at a time
+    assert breaker.record_failure() and breaker.state == "open" and breaker.num_opened == 2
+
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    breaker.before_call()
+
+
+class Backend:
+    provider = "test"
+    model = None
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+
+    @resilient(max_attempts=3)
+    def query(self):
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def test_resilient_retries_then_raises():
+    assert Backend([HTTPError(503), HTTPError(503)]).query() == "ok"
+    with pytest.raises(RetriesExhausted):
+        Backend([HTTPError(503)] * 3).query()
+    with pytest.raises(FatalBackendError):
+        Backend([HTTPError(400)]).query()
+
+
+def test_fatal_error_does_not_close_a_half_open_circuit():
+    breaker, _ = get_guard("test")
+    breaker.failure_threshold, breaker.reset_timeout = 2, 0.05
+    with pytest.raises(CircuitOpenError):
+        Backend([HTTPError(503)] * 2).query()  # the third attempt fails fast
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    with pytest.raises(FatalBackendError):
+        Backend([HTTPError(400)]).query()  # the trial call is a bad request, which proves nothing
+    assert breaker.state == "half_open" and breaker.failures == 2
+
+    with pytest.raises(CircuitOpenError):
+        Backend([HTTPError(503)]).query()  # another trial is let through, and it fails
+    assert breaker.state == "open"